@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Compare normal and fast_build() build times for rule-heavy stacks.
+
+    python benchmarks/fast_build.py [stacks] [repeats]
+
+Each stack has security groups with many rules, target groups with many
+targets and subnet route associations. Build time (helper calls plus the
+final validation pass) is reported apart from render time, which both
+modes share. Both modes must render the same JSON; the best of repeats is
+reported for each.
+"""
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from troposphere import Ref, Template  # noqa: E402
+
+from tropohelper.fastbuild import fast_build  # noqa: E402
+from tropohelper.network import (associate_routes,  # noqa: E402
+                                 create_target_group)
+from tropohelper.security import create_security_group  # noqa: E402
+
+
+class BenchmarkStack(object):
+    def __init__(self):
+        self.stack = Template()
+        self.env = 'bench'
+        self.vpc = Ref('VPC')
+
+
+def build(stacks):
+    """Build and return stacks."""
+    built = []
+
+    for index in range(stacks):
+        stack = BenchmarkStack()
+
+        for group in range(40):
+            create_security_group(stack, 'sg{0}x{1}'.format(index, group), [{
+                'name': 'rule{0}'.format(rule),
+                'cidr': '10.{0}.{1}.0/24'.format(group, rule),
+                'from_port': 1000 + rule,
+                'to_port': 1000 + rule,
+                'protocol': 'tcp'
+            } for rule in range(50)])
+
+        for group in range(40):
+            create_target_group(
+                stack, 'tg{0}x{1}'.format(index, group), 443,
+                targets=['i-{0:08x}'.format(target) for target in range(50)])
+        associate_routes(stack, [{
+            'name': 'assoc{0}'.format(subnet),
+            'subnet': 'Subnet{0}'.format(subnet),
+            'route_table': 'RouteTable'
+        } for subnet in range(100)])
+        built.append(stack)
+
+    return built
+
+
+def render(built):
+    return [stack.stack.to_json() for stack in built]
+
+
+def timed(function, repeats):
+    """Return the best time and the last result of function()."""
+    best = None
+
+    for _ in range(repeats):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def fast(stacks):
+    with fast_build():
+        return build(stacks)
+
+
+def main(argv):
+    stacks = int(argv[1]) if len(argv) > 1 else 10
+    repeats = int(argv[2]) if len(argv) > 2 else 3
+    normal_time, normal = timed(lambda: build(stacks), repeats)
+    render_time, rendered = timed(lambda: render(normal), repeats)
+    normal = None
+    fast_time, faster = timed(lambda: fast(stacks), repeats)
+
+    if rendered != render(faster):
+        raise SystemExit('fast_build() rendered different templates.')
+    print('stacks: {0}, resources per stack: 180'.format(stacks))
+    print('build, normal: {0:.3f}s'.format(normal_time))
+    print('build, fast:   {0:.3f}s ({1:.2f}x)'.format(
+        fast_time, normal_time / fast_time))
+    print('render:        {0:.3f}s'.format(render_time))
+    print('end to end:    {0:.2f}x'.format(
+        (normal_time + render_time) / (fast_time + render_time)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
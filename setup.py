@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
+import re
+
 from setuptools import setup, find_packages
 
+with open('tropohelper/__init__.py') as handle:
+    version = re.search(r"__version__ = '(.+)'", handle.read()).group(1)
+
 long_description = """
 tropohelper is a library to speed up creating resources  using tropospher
 and cloudformation on AWS. Troposphere makes it much easier, but it can really
@@ -11,14 +16,18 @@ functions keeps things much more DRY.
 
 setup(
     name='tropohelper',
-    version="1.4.0",
+    version=version,
     description='tropohelper is a collection of troposphere helpers to promote DRY.',
     long_description=long_description,
     author='Michael Gorman',
     author_email='michael@michaeljgorman.com',
     url='https://github.com/mjgorman/tropohelper',
     packages=find_packages(),
+    package_data={'tropohelper': ['data/*.json']},
     install_requires=['troposphere==2.4.6', 'awacs>=0.7.2'],
+    entry_points={
+        'console_scripts': ['tropohelper = tropohelper.cli:main'],
+    },
     test_suite='nose.collector',
     tests_require=['nose<2.0']
 )
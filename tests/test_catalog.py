@@ -0,0 +1,26 @@
+from tropohelper.catalog import get_instance_type, instance_types, recommend_instance_type
+
+
+class TestCatalog:
+    """Test the instance catalog."""
+
+    def test_get_instance_type(self):
+        """Test looking up a type by name."""
+        m7g = get_instance_type('m7g.xlarge')
+        assert m7g.family == 'm7g'
+        assert (m7g.vcpu, m7g.memory) == (4, 16)
+        assert get_instance_type('db.r7g.large').kind == 'db'
+
+    def test_instance_types_by_family(self):
+        """Test listing types for some families only."""
+        names = instance_types('ec2', ['c7i', 'r7g'])
+        assert 'c7i.48xlarge' in names and 'r7g.medium' in names
+        assert not [name for name in names if name.startswith('m')]
+
+    def test_recommend_instance_type(self):
+        """Test the smallest type meeting all requirements is picked."""
+        assert recommend_instance_type(vcpu=4, memory=30).name == 'r4.xlarge'
+        assert recommend_instance_type(vcpu=4, memory=30, families=['r7g']).name == 'r7g.xlarge'
+        assert recommend_instance_type(vcpu=2, memory=4, network=12, families=['c7i']).name == 'c7i.large'
+        assert recommend_instance_type(memory=6, kind='cache').name == 'cache.m5.large'
+        assert recommend_instance_type(vcpu=1000) is None
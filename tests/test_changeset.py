@@ -0,0 +1,81 @@
+from troposphere import Ref, Template
+from tropohelper.changeset import (NO_INTERRUPT, REPLACEMENT, SOME_INTERRUPT,
+                                   compare, minimize, update_behavior)
+from tropohelper.instances import create_autoscale_group, create_launch_config
+from tropohelper.render import render
+from tropohelper.security import create_iam_role
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self, env="test"):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = env
+        self.ssh_key_param = Ref('SSHKey')
+
+
+def build(env, instance_type='t3.micro'):
+    """Build a web tier whose names derive from env."""
+    stack = test_stack(env)
+    role = create_iam_role(stack, '{0}-web'.format(env), instance_profile=True)
+    config = create_launch_config(stack, 'web', 'ami-123', [Ref('WebSG')],
+                                  instance_type, Ref(role))
+    create_autoscale_group(stack, 'web', config, ['subnet-1', 'subnet-2'])
+
+    return stack
+
+
+class TestChangeset:
+    """Test classifying and minimizing change sets."""
+
+    def setup(self):
+        """Render the previous version of the stack."""
+        self.old = render(build('staging'))
+
+    def test_update_behavior(self):
+        """Test lookups in the bundled spec."""
+        assert update_behavior('AWS::IAM::Role', 'RoleName') == REPLACEMENT
+        assert update_behavior('AWS::IAM::Role', 'ManagedPolicyArns') == NO_INTERRUPT
+        assert update_behavior('AWS::AutoScaling::LaunchConfiguration', 'UserData') == REPLACEMENT
+        assert update_behavior('AWS::EC2::Instance', 'InstanceType') == SOME_INTERRUPT
+        assert update_behavior('AWS::Unknown::Thing', 'Anything') == SOME_INTERRUPT
+
+    def test_compare_classifies_changes(self):
+        """Test a same-name instance type change replaces only the launch config."""
+        changes = compare(self.old, build('staging', 't3.small'))
+        assert [(c['logical_id'], c['behavior']) for c in changes] == [
+            ('stagingwebLC', REPLACEMENT)]
+        assert changes[0]['properties'] == {'InstanceType': REPLACEMENT}
+        assert compare(self.old, build('staging')) == []
+
+    def test_minimize_keeps_logical_ids_and_names(self):
+        """Test an env rename turns into an in-place update."""
+        new = build('stage')
+        actions = set((c['logical_id'], c['action']) for c in compare(self.old, new))
+        assert ('stagingwebASG', 'remove') in actions
+        assert ('stagewebASG', 'add') in actions
+
+        result = minimize(self.old, new)
+        assert result['logical_ids'] == {
+            'stagewebRole': 'stagingwebRole',
+            'stagewebinstanceprofile': 'stagingwebinstanceprofile',
+            'stagewebLC': 'stagingwebLC',
+            'stagewebASG': 'stagingwebASG',
+        }
+        assert sorted((n['logical_id'], n['old'], n['new']) for n in result['names']) == [
+            ('stagingwebRole', 'staging-web', 'stage-web'),
+            ('stagingwebinstanceprofile', 'staging-web', 'stage-web'),
+        ]
+        assert result['changes'] == []
+        resources = result['template']['Resources']
+        assert resources['stagingwebASG']['Properties']['LaunchConfigurationName'] == \
+            {'Ref': 'stagingwebLC'}
+
+    def test_minimize_without_name_keeping(self):
+        """Test physical name changes are reported when not kept."""
+        result = minimize(self.old, build('stage'), keep_names=False)
+        assert result['names'] == []
+        behaviors = dict((c['logical_id'], c['behavior']) for c in result['changes'])
+        assert behaviors == {'stagingwebRole': REPLACEMENT,
+                             'stagingwebinstanceprofile': REPLACEMENT}
@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+
+from tropohelper.cli import StackSpec, build, build_order, format_report, load_manifest, main
+from tropohelper.exports import ExportRegistry
+
+SCRIPT = '''import json
+import sys
+
+from troposphere import Template
+from troposphere.sns import Topic
+
+config = json.load(open(sys.argv[1]))
+template = Template()
+template.add_resource(Topic(config['name']))
+print(template.to_json())
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPORTS = '''import json
+import sys
+
+sys.path.insert(0, {root!r})
+from troposphere import Template
+from troposphere.sns import Topic
+
+from tropohelper.exports import ExportRegistry, StackExports
+
+
+class Stack(object):
+    stack = Template()
+    env = 'test'
+
+
+config = json.load(open(sys.argv[1]))
+stack = Stack()
+exports = StackExports(stack, config['name'], ExportRegistry(sys.argv[2]))
+for role in config.get('share', []):
+    exports.share(role, stack.stack.add_resource(Topic(config['topic'])))
+for role in config.get('resolve', []):
+    exports.resolve(role)
+exports.publish()
+print(stack.stack.to_json())
+'''
+
+
+class TestCli:
+    """Test incremental builds."""
+
+    def setup(self):
+        """Write two build scripts, their configs and a manifest."""
+        self.root = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.root, 'build')
+
+        for name in ('web', 'worker'):
+            self.write('{0}.py'.format(name), SCRIPT)
+            self.write('{0}.json'.format(name), json.dumps({'name': '{0}Topic'.format(name)}))
+        self.write('broken.py', 'raise SystemExit("no template for you")')
+        self.write('stacks.json', json.dumps({'stacks': dict(
+            (name, {'script': '{0}.py'.format(name), 'configs': ['{0}.json'.format(name)],
+                    'args': [os.path.join(self.root, '{0}.json'.format(name))]})
+            for name in ('web', 'worker'))}))
+        self.specs = load_manifest(os.path.join(self.root, 'stacks.json'))
+
+    def write(self, name, text):
+        """Write a file under the test root."""
+        with open(os.path.join(self.root, name), 'w') as handle:
+            handle.write(text)
+
+    def test_incremental_build(self):
+        """Test unchanged stacks are cached and changed ones rebuilt."""
+        first = build(self.specs, self.out_dir, jobs=2)
+        assert [stack['status'] for stack in first['stacks']] == ['built', 'built']
+        with open(os.path.join(self.out_dir, 'web.json')) as handle:
+            assert 'webTopic' in json.load(handle)['Resources']
+        second = build(self.specs, self.out_dir)
+        assert second['hits'] == 2
+        assert second['hit_rate'] == 1.0
+        self.write('worker.json', json.dumps({'name': 'queueTopic'}))
+        third = build(self.specs, self.out_dir)
+        assert [stack['status'] for stack in third['stacks']] == ['cached', 'built']
+        assert third['hit_rate'] == 0.5
+        os.remove(os.path.join(self.out_dir, 'web.json'))
+        assert build(self.specs, self.out_dir)['stacks'][0]['status'] == 'built'
+        assert '2 stacks: 2 cached, 0 built, 0 failed; hit rate 100%' in format_report(
+            build(self.specs, self.out_dir))
+
+    def test_failures(self):
+        """Test failed builds are reported, not cached, and fail the command."""
+        broken = StackSpec('broken', os.path.join(self.root, 'broken.py'), [], [])
+        report = build(self.specs + [broken], self.out_dir)
+        assert report['failed'] == 1
+        assert report['stacks'][2]['error'] == 'no template for you'
+        assert build([broken], self.out_dir)['failed'] == 1
+        assert main(['build', os.path.join(self.root, 'broken.py'),
+                     '--out-dir', self.out_dir, '--json']) == 1
+        assert main(['build', '--manifest', os.path.join(self.root, 'stacks.json'),
+                     '--out-dir', self.out_dir]) == 0
+
+    def test_local_modules_are_inputs(self):
+        """Test editing a helper module the script imports rebuilds it."""
+        self.write('shared.py', 'NAME = 1\n')
+        self.write('web.py', 'import shared\n' + SCRIPT)
+        build(self.specs, self.out_dir)
+        self.write('shared.py', 'NAME = 2\n')
+        report = build(self.specs, self.out_dir)
+        assert [stack['status'] for stack in report['stacks']] == ['built', 'cached']
+
+    def test_registry_orders_and_invalidates_consumers(self):
+        """Test producers build first and export changes rebuild consumers."""
+        registry = os.path.join(self.root, 'exports.json')
+        self.write('stack.py', EXPORTS.format(root=ROOT))
+        self.write('network.json', json.dumps({'name': 'network', 'topic': 'A', 'share': ['vpc']}))
+        self.write('web.json', json.dumps({'name': 'web', 'topic': 'B', 'resolve': ['vpc']}))
+        specs = [StackSpec(name, os.path.join(self.root, 'stack.py'),
+                           [os.path.join(self.root, '{0}.json'.format(name))],
+                           [os.path.join(self.root, '{0}.json'.format(name)), registry],
+                           depends)
+                 for name, depends in (('web', ('network',)), ('network', ()))]
+        first = build(specs, self.out_dir, registry_path=registry)
+        assert first['built'] == 2
+        waves, _ = build_order([spec._replace(depends=()) for spec in specs],
+                               ExportRegistry(registry))
+        assert [[spec.name for spec in wave] for wave in waves] == [['network'], ['web']]
+        assert build(specs, self.out_dir, registry_path=registry)['hits'] == 2
+        self.write('network.json', json.dumps({'name': 'network', 'topic': 'C', 'share': ['vpc']}))
+        third = build(specs, self.out_dir, registry_path=registry)
+        assert [stack['status'] for stack in third['stacks']] == ['built', 'built']
+        broken = specs[1]._replace(script=os.path.join(self.root, 'broken.py'))
+        report = build([specs[0], broken], self.out_dir, registry_path=registry)
+        assert report['stacks'][0]['error'] == 'depends on failed network'
+        try:
+            build_order([specs[0], specs[1]._replace(depends=('web',))])
+        except ValueError as error:
+            assert 'Dependency cycle between network, web' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+
+    def test_unreadable_inputs_fail_one_stack(self):
+        """Test a missing script or bad module fails only its own stack."""
+        build(self.specs, self.out_dir)
+        self.write('shared.py', 'def broken(:\n')
+        self.write('worker.py', 'import shared\n' + SCRIPT)
+        missing = StackSpec('missing', os.path.join(self.root, 'missing.py'), [], [])
+        report = build(self.specs + [missing], self.out_dir)
+        assert [stack['status'] for stack in report['stacks']] == ['cached', 'failed', 'failed']
+        assert 'invalid syntax' in report['stacks'][1]['error']
+        assert 'missing.py' in report['stacks'][2]['error']
+        assert build(self.specs, self.out_dir)['stacks'][0]['status'] == 'cached'
+        assert main(['build', os.path.join(self.root, 'missing.py'),
+                     '--out-dir', self.out_dir]) == 1
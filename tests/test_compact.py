@@ -0,0 +1,97 @@
+import json
+
+from troposphere import Equals, Parameter, Ref, Template
+from troposphere.ec2 import VPC
+from tropohelper.changeset import REPLACEMENT, compare
+from tropohelper.compact import compact, expand
+from tropohelper.network import create_alb, create_target_group
+from tropohelper.security import create_security_group
+from tropohelper.services import create_s3_firehose
+
+BUCKET = 'arn:aws:s3:::tropohelper-analytics-event-logs-bucket-production-us-east-1'
+KEY = 'arn:aws:kms:us-east-1:123456789012:key/0a1b2c3d-4e5f-6a7b-8c9d-0e1f2a3b4c5d'
+ROLE = 'arn:aws:iam::123456789012:role/tropohelper-firehose-delivery'
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+        self.vpc = Ref('VPC')
+
+
+class TestCompact:
+    """Test template compaction."""
+
+    def setup(self):
+        """Build a stack full of helper boilerplate."""
+        self.stack = test_stack()
+        create_security_group(self.stack, 'web', [{
+            'name': 'https', 'cidr': '10.0.0.0/8', 'from_port': 443, 'to_port': 443,
+            'protocol': 'tcp'}])
+        create_target_group(self.stack, 'web', 443)
+
+        for name in ('clicks', 'views', 'orders', 'carts', 'searches', 'signups'):
+            create_s3_firehose(self.stack, name, BUCKET, KEY, ROLE)
+
+    def test_compact(self):
+        """Test defaults, empty lists and repeated literals are removed."""
+        result = compact(self.stack)
+        template = result['template']
+        resources = template['Resources']
+        assert 'SecurityGroupEgress' not in resources['webSecurityGroup']['Properties']
+        assert 'Targets' not in resources['webTargetGroup']['Properties']
+        assert 'HealthCheckPath' not in resources['webTargetGroup']['Properties']
+        assert resources['webTargetGroup']['Properties']['TargetType'] == 'instance'
+        assert sorted(result['hoisted'].values()) == sorted([BUCKET, KEY, ROLE])
+        key = [k for k, v in result['hoisted'].items() if v == BUCKET][0]
+        assert resources['clicksFirehose']['Properties']['S3DestinationConfiguration'][
+            'BucketARN'] == {'Fn::FindInMap': ['Compacted', 'Strings', key]}
+        assert template['Mappings']['Compacted']['Strings'][key] == BUCKET
+        assert result['text'] == json.dumps(template, sort_keys=True, separators=(',', ':'))
+        assert result['saved_bytes'] == result['original_bytes'] - result['compacted_bytes']
+        assert result['compacted_bytes'] * 2 < result['original_bytes']
+        paths = [entry['path'][1:] for entry in result['removed']]
+        assert ['webSecurityGroup', 'Properties', 'SecurityGroupEgress'] in paths
+
+    def test_round_trip(self):
+        """Test expanding the compacted template gives back the original."""
+        result = compact(self.stack.stack.to_json())
+        assert expand(result['text'], result['removed']) == self.stack.stack.to_dict()
+        assert compact(self.stack, min_count=7)['hoisted'] == {}
+
+    def test_keeps_meaning(self):
+        """Test parameters and conditions keep their spelling and defaults match typed values."""
+        template = self.stack.stack
+        template.add_parameter(Parameter('Flag', Type='String', Default='True',
+                                         AllowedValues=['True', 'False']))
+        template.add_condition('FlagOn', Equals(Ref('Flag'), 'True'))
+        template.add_resource(VPC('Main', CidrBlock='10.0.0.0/16', EnableDnsSupport=True,
+                                  InstanceTenancy='dedicated'))
+        result = compact(self.stack)
+        compacted = result['template']
+        assert compacted['Parameters']['Flag']['AllowedValues'] == ['True', 'False']
+        assert compacted['Parameters']['Flag']['Default'] == 'True'
+        assert compacted['Conditions']['FlagOn'] == {'Fn::Equals': [{'Ref': 'Flag'}, 'True']}
+        assert compacted['Resources']['Main']['Properties'] == {
+            'CidrBlock': '10.0.0.0/16', 'InstanceTenancy': 'dedicated'}
+        assert {'path': ['Resources', 'Main', 'Properties', 'EnableDnsSupport'],
+                'value': 'true'} in result['removed']
+        assert expand(result['template'], result['removed']) == template.to_dict()
+        raw = {'Resources': {'Main': {'Type': 'AWS::EC2::VPC', 'Properties': {
+            'CidrBlock': '10.0.0.0/16', 'EnableDnsSupport': True}}}}
+        assert compact(raw)['removed'] == [
+            {'path': ['Resources', 'Main', 'Properties', 'EnableDnsSupport'], 'value': True}]
+
+    def test_no_replacement(self):
+        """Test deploying the compacted template replaces nothing."""
+        create_alb(self.stack, 'web', subnets=['subnet-1', 'subnet-2'])
+        result = compact(self.stack)
+        assert result['template']['Resources']['webALB']['Properties'][
+            'Scheme'] == 'internet-facing'
+        changes = compare(self.stack, result['template'])
+        assert changes
+        assert [change['logical_id'] for change in changes
+                if change['behavior'] == REPLACEMENT] == []
@@ -0,0 +1,91 @@
+from troposphere import Equals, GetAtt, If, Output, Ref, Template
+from tropohelper.conditions import (create_bool_condition, create_combined_condition,
+                                    create_condition, evaluate_conditions, prune)
+from tropohelper.network import create_alb, create_or_update_dns_record, create_vpc
+from tropohelper.parameters import create_vpc_param
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+class TestConditions:
+    """Test condition builders, evaluation and pruning."""
+
+    def setup(self):
+        """Build a stack with a switchable ALB and CDN."""
+        self.stack = test_stack()
+        self.stack.vpc_address_param = create_vpc_param(self.stack, '10.0.0.0/16')
+        self.stack.vpc = create_vpc(self.stack, 'Test')
+        alb_enabled = create_bool_condition(self.stack, 'Alb')
+        create_bool_condition(self.stack, 'Cdn')
+        both = create_combined_condition(self.stack, 'AlbAndCdn', ['AlbEnabled', 'CdnEnabled'])
+        alb = create_alb(self.stack, 'Web', subnets=['subnet-1'], condition_field=alb_enabled)
+        create_or_update_dns_record(self.stack, 'www.example.com', 'CNAME',
+                                    [GetAtt(alb, 'DNSName')], 'example.com',
+                                    condition_field=both)
+        self.stack.stack.add_output(Output(
+            'Endpoint', Value=If(alb_enabled, GetAtt(alb, 'DNSName'), 'none')))
+
+    def test_builders(self):
+        """Test builders add conditions and reject conflicting redefinitions."""
+        conditions = self.stack.stack.to_dict()['Conditions']
+        assert conditions['AlbEnabled'] == {'Fn::Equals': [{'Ref': 'AlbBoolParam'}, 'YES']}
+        assert conditions['AlbAndCdn'] == {
+            'Fn::And': [{'Condition': 'AlbEnabled'}, {'Condition': 'CdnEnabled'}]}
+        assert create_bool_condition(self.stack, 'Alb') == 'AlbEnabled'
+        try:
+            create_condition(self.stack, 'AlbEnabled', Equals('a', 'b'))
+        except ValueError as error:
+            assert 'AlbEnabled already exists' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+
+    def test_evaluate(self):
+        """Test three-valued evaluation."""
+        assert evaluate_conditions(self.stack) == {
+            'AlbEnabled': None, 'CdnEnabled': None, 'AlbAndCdn': None}
+        assert evaluate_conditions(self.stack, {'AlbBoolParam': 'NO'}) == {
+            'AlbEnabled': False, 'CdnEnabled': None, 'AlbAndCdn': False}
+        assert evaluate_conditions(self.stack, use_defaults=True) == {
+            'AlbEnabled': False, 'CdnEnabled': False, 'AlbAndCdn': False}
+
+    def test_prune_disabled(self):
+        """Test false conditions remove resources, outputs branches and switches."""
+        result = prune(self.stack, {'AlbBoolParam': 'NO'})
+        template = result['template']
+        assert sorted(template['Resources']) == ['TestVPC']
+        assert template['Outputs']['Endpoint'] == {'Value': 'none'}
+        assert 'Conditions' not in template
+        assert result['removed'] == {
+            'resources': ['WebALB', 'wwwexamplecom'],
+            'outputs': [],
+            'conditions': ['AlbAndCdn', 'AlbEnabled', 'CdnEnabled'],
+            'parameters': ['AlbBoolParam'],
+        }
+        assert 'Condition' not in template['Resources']['TestVPC']
+
+    def test_prune_partially_known(self):
+        """Test unknown conditions and what they refer to are kept."""
+        result = prune(self.stack, {'AlbBoolParam': 'YES'})
+        template = result['template']
+        assert 'Condition' not in template['Resources']['WebALB']
+        assert template['Resources']['wwwexamplecom']['Condition'] == 'AlbAndCdn'
+        assert template['Outputs']['Endpoint'] == {'Value': {'Fn::GetAtt': ['WebALB', 'DNSName']}}
+        assert sorted(template['Conditions']) == ['AlbAndCdn', 'AlbEnabled', 'CdnEnabled']
+        assert result['removed']['parameters'] == []
+        assert sorted(template['Parameters']) == ['AlbBoolParam', 'CdnBoolParam', 'VPCParam']
+
+    def test_prune_rejects_dangling_references(self):
+        """Test unconditional references to pruned resources are errors."""
+        self.stack.stack.add_output(Output('Alb', Value=Ref('WebALB')))
+        try:
+            prune(self.stack, {'AlbBoolParam': 'NO'})
+        except ValueError as error:
+            assert 'Output Alb refers to WebALB' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
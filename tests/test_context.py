@@ -0,0 +1,71 @@
+from tropohelper.context import StackContext
+from tropohelper.network import create_internet_gateway, create_subnet, create_vpc
+from tropohelper.parameters import LocalParameterStore, ParameterResolver
+
+
+class TestContext:
+    """Test the stack context."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.context = StackContext('test')
+        self.context.vpc = create_vpc(self.context, 'Base', '10.0.0.0/16')
+
+    def test_roles_used_by_helpers(self):
+        """Test helpers read roles from the registry."""
+        create_subnet(self.context, 'Web', 'WebParam')
+        resources = self.context.stack.to_dict()['Resources']
+        assert resources['WebSubnet']['Properties']['VpcId'] == {'Ref': 'BaseVPC'}
+        assert 'vpc' in self.context
+        assert self.context.get('vpc') is self.context.vpc
+
+    def test_unknown_role_suggests_match(self):
+        """Test a misspelt role fails with a suggestion."""
+        try:
+            self.context.vcp
+        except AttributeError as error:
+            assert "did you mean 'vpc'" in str(error)
+            return
+        assert False, 'unknown role did not raise'
+
+    def test_strict_rejects_unknown_assignment(self):
+        """Test strict contexts only accept declared roles."""
+        context = StackContext('test', strict=True, roles=['web_alb'])
+        context.web_alb = 'alb'
+        context.internet_gateway = 'igw'
+        try:
+            context.internet_gatway = 'igw'
+        except AttributeError as error:
+            assert 'internet_gateway' in str(error)
+            return
+        assert False, 'misspelt role was accepted'
+
+    def test_snapshot_and_fork(self):
+        """Test snapshots are read-only and forks are independent."""
+        base = self.context.snapshot()
+        try:
+            create_internet_gateway(base)
+        except TypeError:
+            pass
+        else:
+            assert False, 'snapshot accepted a resource'
+        service = base.fork(env='svc')
+        create_subnet(service, 'Svc', 'SvcParam')
+        assert service.env == 'svc'
+        assert service.vpc is self.context.vpc
+        assert 'SvcSubnet' in service.stack.resources
+        assert 'SvcSubnet' not in base.stack.resources
+        assert 'SvcSubnet' not in self.context.stack.resources
+        assert not service.frozen and base.frozen
+
+    def test_fork_mappings_are_independent(self):
+        """Test mapping writes on a fork reach neither the base nor its snapshot."""
+        self.context.stack.add_mapping('ResolvedParameters', {'Values': {'BaseAmiIdParam': 'ami-1'}})
+        base = self.context.snapshot()
+        service = base.fork(env='svc')
+        store = LocalParameterStore({'/svc/ami': 'ami-2'})
+        ParameterResolver(service, mode='mapping', store=store).ami('Svc', '/svc/ami')
+        assert service.stack.mappings['ResolvedParameters']['Values'] == {
+            'BaseAmiIdParam': 'ami-1', 'SvcAmiIdParam': 'ami-2'}
+        for template in (base.stack, self.context.stack):
+            assert template.mappings['ResolvedParameters']['Values'] == {'BaseAmiIdParam': 'ami-1'}
@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+from troposphere import Template
+from tropohelper.exports import ExportRegistry, StackExports
+from tropohelper.network import create_subnet, create_vpc
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self, env='test'):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = env
+
+
+class TestExports:
+    """Test sharing and resolving cross-stack exports."""
+
+    def setup(self):
+        """Publish a network stack sharing its VPC and subnet."""
+        self.path = os.path.join(tempfile.mkdtemp(), 'exports.json')
+        self.network = test_stack()
+        exports = StackExports(self.network, 'network', ExportRegistry(self.path))
+        self.network.vpc = exports.share('vpc', create_vpc(self.network, 'Main', '10.0.0.0/16'))
+        exports.share('subnet-a', create_subnet(self.network, 'A', 'SubnetACidr'))
+        exports.publish()
+
+    def test_share_and_resolve(self):
+        """Test shared resources are exported and resolved from disk by role."""
+        outputs = self.network.stack.to_dict()['Outputs']
+        assert outputs['vpcExport']['Value'] == {'Ref': 'MainVPC'}
+        assert outputs['vpcExport']['Export'] == {'Name': 'test-vpc'}
+        assert outputs['subnetaExport']['Export'] == {'Name': 'test-subnet-a'}
+        service = test_stack()
+        web = StackExports(service, 'web', ExportRegistry(self.path))
+        assert web.resolve('vpc').to_dict() == {'Fn::ImportValue': 'test-vpc'}
+        assert web.resolve('vpc') is web.resolve('vpc')
+        try:
+            web.resolve('subnet-b')
+        except KeyError as error:
+            assert "did you mean 'subnet-a'?" in str(error)
+        else:
+            raise AssertionError('expected a KeyError')
+        web.publish()
+        registry = ExportRegistry(self.path)
+        assert registry.lookup('test', 'subnet-a')['stack'] == 'test/network'
+        assert registry.check() == {'stale': [], 'cycles': []}
+
+    def test_stale_imports(self):
+        """Test changed and removed exports make consumers stale."""
+        registry = ExportRegistry(self.path)
+        web = StackExports(test_stack(), 'web', registry)
+        web.resolve('vpc')
+        web.resolve('subnet-a')
+        web.publish()
+        network = test_stack()
+        exports = StackExports(network, 'network', registry)
+        exports.share('vpc', create_vpc(network, 'Main', '10.1.0.0/16'))
+        exports.publish()
+        assert ExportRegistry(self.path).check()['stale'] == [
+            {'stack': 'test/web', 'import': 'test/subnet-a', 'reason': 'missing'},
+            {'stack': 'test/web', 'import': 'test/vpc', 'reason': 'changed'},
+        ]
+
+    def test_cycles(self):
+        """Test publishing an import cycle is refused."""
+        registry = ExportRegistry(self.path)
+        service = test_stack()
+        web = StackExports(service, 'web', registry)
+        web.resolve('vpc')
+        service.vpc = 'WebVPC'
+        web.share('web-subnet', create_subnet(service, 'Web', 'SubnetWebCidr'))
+        web.publish()
+        rebuilt = test_stack()
+        network = StackExports(rebuilt, 'network', registry)
+        network.share('vpc', create_vpc(rebuilt, 'Main', '10.0.0.0/16'))
+        network.resolve('web-subnet')
+        try:
+            network.publish()
+        except ValueError as error:
+            assert 'Import cycle between test/network, test/web' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+        assert registry.lookup('test', 'vpc')['stack'] == 'test/network'
+        assert registry.check()['cycles'] == []
+        assert registry.changed == set()
+        other = test_stack()
+        republished = StackExports(other, 'network', ExportRegistry(self.path))
+        republished.share('vpc', create_vpc(other, 'Main', '10.0.0.0/16'))
+        republished.share('dns', create_vpc(other, 'Dns', '10.9.0.0/16'))
+        republished.publish()
+        StackExports(test_stack(), 'cron', registry).publish()
+        assert ExportRegistry(self.path).lookup('test', 'dns')['stack'] == 'test/network'
+
+    def test_concurrent_publishes_merge(self):
+        """Test registries read before each other's saves keep both stacks."""
+        first, second = ExportRegistry(self.path), ExportRegistry(self.path)
+        web = StackExports(test_stack(), 'web', first)
+        web.resolve('vpc')
+        worker = StackExports(test_stack(), 'worker', second)
+        worker.resolve('subnet-a')
+        web.publish()
+        worker.publish()
+        assert sorted(ExportRegistry(self.path).stacks) == [
+            'test/network', 'test/web', 'test/worker']
+        assert sorted(second.stacks) == ['test/network', 'test/web', 'test/worker']
+        first.remove('test', 'web')
+        first.save()
+        assert sorted(ExportRegistry(self.path).stacks) == ['test/network', 'test/worker']
+        try:
+            ExportRegistry().save()
+        except ValueError as error:
+            assert 'no path' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
@@ -0,0 +1,106 @@
+import contextlib
+import threading
+
+from troposphere import Ref, Template
+from troposphere.ec2 import SecurityGroup
+from tropohelper.fastbuild import fast_build
+from tropohelper.network import associate_routes, create_target_group
+from tropohelper.security import create_security_group
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+        self.vpc = Ref('VPC')
+
+
+def build(stack, port=443):
+    """Build a stack with rules, targets and route associations."""
+    create_security_group(stack, 'web', [{
+        'name': 'https{0}'.format(index),
+        'cidr': '10.0.{0}.0/24'.format(index),
+        'from_port': port,
+        'to_port': port,
+        'protocol': 'tcp'
+    } for index in range(5)])
+    create_target_group(stack, 'web', 443, targets=['i-1', 'i-2'],
+                        attributes={'stickiness.enabled': 'true'})
+    associate_routes(stack, [{'name': 'a', 'subnet': 'SubnetA', 'route_table': 'Routes'}])
+
+
+def error_of(function):
+    """Return the type and message of the error function raises."""
+    try:
+        function()
+    except Exception as error:
+        return type(error), str(error)
+    raise AssertionError('expected an error')
+
+
+class TestFastBuild:
+    """Test deferred validation gives the same results as normal builds."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+
+    def test_same_output(self):
+        """Test fast builds render the same template."""
+        expected = test_stack()
+        build(expected)
+        with fast_build():
+            build(self.stack)
+        assert self.stack.stack.to_dict() == expected.stack.to_dict()
+
+    def test_same_errors(self):
+        """Test invalid values raise the same error, at the end of the block."""
+        expected = error_of(lambda: build(test_stack(), port='https'))
+
+        def fast():
+            with fast_build():
+                create_security_group(self.stack, 'web', [{
+                    'name': 'https', 'cidr': '10.0.0.0/24', 'from_port': 'https',
+                    'to_port': 'https', 'protocol': 'tcp'}])
+        assert error_of(fast) == expected
+
+        def unknown(mode):
+            with mode():
+                SecurityGroup('Bad', GroupDescription='bad', Colour='blue')
+        assert error_of(lambda: unknown(fast_build)) == error_of(
+            lambda: unknown(contextlib.suppress))
+
+    def test_restores_validation(self):
+        """Test validation is back on after the block, even on errors."""
+        try:
+            with fast_build():
+                raise KeyError('boom')
+        except KeyError:
+            pass
+        assert 'does not support' in error_of(
+            lambda: SecurityGroup('Bad', GroupDescription='bad', Colour='blue'))[1]
+
+    def test_other_threads_keep_validating(self):
+        """Test only the thread inside the block defers validation."""
+        entered, release = threading.Event(), threading.Event()
+
+        def fast():
+            with fast_build():
+                build(self.stack)
+                entered.set()
+                release.wait(5)
+
+        worker = threading.Thread(target=fast)
+        worker.start()
+        entered.wait(5)
+        try:
+            assert 'does not support' in error_of(
+                lambda: SecurityGroup('Bad', GroupDescription='bad', Colour='blue'))[1]
+        finally:
+            release.set()
+            worker.join()
+        expected = test_stack()
+        build(expected)
+        assert self.stack.stack.to_dict() == expected.stack.to_dict()
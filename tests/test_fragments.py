@@ -0,0 +1,85 @@
+from troposphere import Ref, Template
+from tropohelper.context import StackContext
+from tropohelper.fragments import Fragment, graft
+from tropohelper.network import create_subnet, create_vpc
+from tropohelper.parameters import create_vpc_param
+from tropohelper.security import create_iam_role, create_security_group
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+class TestFragments:
+    """Test freezing and grafting fragments."""
+
+    def setup(self):
+        """Build a base fragment."""
+        base = StackContext('base')
+        base.vpc_address_param = create_vpc_param(base, '10.0.0.0/16')
+        base.vpc = create_vpc(base, 'Base')
+        create_security_group(base, 'Web', [{'name': 'https', 'cidr': '0.0.0.0/0',
+                                             'from_port': 443, 'to_port': 443, 'protocol': 'tcp'}])
+        create_iam_role(base, 'web-role', instance_profile=True)
+        self.fragment = Fragment.freeze(base)
+        self.stack = test_stack()
+
+    def test_graft_renames_and_rewrites_references(self):
+        """Test prefixed grafts rewrite refs between fragment resources."""
+        mapping = graft(self.stack, self.fragment, prefix='Svc')
+        resources = self.stack.stack.to_dict()['Resources']
+        assert mapping['BaseVPC'] == 'SvcBaseVPC'
+        assert resources['SvcWebSecurityGroup']['Properties']['VpcId'] == {'Ref': 'SvcBaseVPC'}
+        assert resources['SvcBaseVPC']['Properties']['CidrBlock'] == {'Ref': 'VPCParam'}
+        assert resources['SvcwebroleRole']['Type'] == 'AWS::IAM::Role'
+        assert resources['Svcwebroleinstanceprofile']['Properties']['Roles'] == [{'Ref': 'SvcwebroleRole'}]
+
+    def test_graft_prefixes_physical_names(self):
+        """Test prefixed grafts give IAM resources their own physical names."""
+        graft(self.stack, self.fragment, prefix='One')
+        graft(self.stack, self.fragment, prefix='Two')
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['OnewebroleRole']['Properties']['RoleName'] == 'One-web-role'
+        assert resources['TwowebroleRole']['Properties']['RoleName'] == 'Two-web-role'
+        assert resources['Twowebroleinstanceprofile']['Properties'][
+            'InstanceProfileName'] == 'Two-web-role'
+        assert '"RoleName": "web-role"' in self.fragment.resources['webroleRole']
+
+    def test_graft_many_times_shares_parameters(self):
+        """Test several grafts share parameters and can be referenced."""
+        graft(self.stack, self.fragment, prefix='One')
+        graft(self.stack, self.fragment, prefix='Two')
+        self.stack.vpc = self.stack.stack.resources['TwoBaseVPC']
+        create_subnet(self.stack, 'App', 'AppParam')
+        template = self.stack.stack.to_dict()
+        assert list(template['Parameters']) == ['VPCParam']
+        assert template['Resources']['AppSubnet']['Properties']['VpcId'] == {'Ref': 'TwoBaseVPC'}
+        assert Ref(self.stack.vpc).to_dict() == {'Ref': 'TwoBaseVPC'}
+
+    def test_graft_copy_on_write(self):
+        """Test editing one graft leaves the fragment and other grafts alone."""
+        graft(self.stack, self.fragment, prefix='One')
+        other = test_stack()
+        graft(other, self.fragment, prefix='One')
+        vpc = self.stack.stack.resources['OneBaseVPC']
+        vpc.body['Properties']['EnableDnsHostnames'] = 'false'
+        assert self.stack.stack.to_dict()['Resources']['OneBaseVPC']['Properties']['EnableDnsHostnames'] == 'false'
+        assert other.stack.to_dict()['Resources']['OneBaseVPC']['Properties']['EnableDnsHostnames'] == 'true'
+
+    def test_fragment_is_immutable(self):
+        """Test fragments cannot be modified."""
+        try:
+            self.fragment.resources = {}
+        except AttributeError:
+            pass
+        else:
+            assert False, 'fragment was modified'
+        try:
+            self.fragment.resources['BaseVPC'] = '{}'
+        except TypeError:
+            return
+        assert False, 'fragment section was modified'
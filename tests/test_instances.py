@@ -0,0 +1,63 @@
+from troposphere import Template
+from tropohelper.instances import create_rds_instance, create_rds_proxy
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+        self.vpc = 'vpc-1'
+
+
+SECRET = 'arn:aws:secretsmanager:us-east-1:123456789012:secret:main-db'
+
+
+class TestRDSProxy:
+    """Test the RDS Proxy helper."""
+
+    def setup(self):
+        """Create a stack with an RDS instance."""
+        self.stack = test_stack()
+        self.db = create_rds_instance(self.stack, 'main-db', 'main', 'db.r5.large', 'user', 'pass',
+                                      'subnets', [], ['sg-db'], 'params')
+
+    def test_create_rds_proxy(self):
+        """Test the proxy, its role, security groups, pool and output."""
+        create_rds_proxy(self.stack, 'main-db', self.db, SECRET, ['subnet-a', 'subnet-b'],
+                         ['sg-web'], max_connections_percent=75, idle_client_timeout=900)
+        template = self.stack.stack.to_dict()
+        resources = template['Resources']
+        proxy = resources['maindbRDSProxy']
+        assert proxy['Type'] == 'AWS::RDS::DBProxy'
+        assert proxy['DependsOn'] == ['maindbRDSProxySecret']
+        assert proxy['Properties']['Auth'] == [
+            {'AuthScheme': 'SECRETS', 'SecretArn': SECRET, 'IAMAuth': 'DISABLED'}]
+        assert proxy['Properties']['RoleArn'] == {'Fn::GetAtt': ['maindbrdsproxyRole', 'Arn']}
+        assert proxy['Properties']['IdleClientTimeout'] == 900
+        assert resources['maindbrdsproxyRole']['Properties']['AssumeRolePolicyDocument'][
+            'Statement'][0]['Principal'] == {'Service': ['rds.amazonaws.com']}
+        assert resources['maindbRDSProxySecret']['Properties']['PolicyDocument'][
+            'Statement'][0]['Resource'] == [SECRET]
+        ingress = resources['maindbRDSProxySecurityGroup']['Properties']['SecurityGroupIngress']
+        assert ingress == [{'IpProtocol': 'tcp', 'FromPort': 3306, 'ToPort': 3306,
+                            'SourceSecurityGroupId': 'sg-web'}]
+        assert resources['maindbRDSProxyIngress0']['Properties'] == {
+            'GroupId': 'sg-db', 'IpProtocol': 'tcp', 'FromPort': 3306, 'ToPort': 3306,
+            'SourceSecurityGroupId': {'Ref': 'maindbRDSProxySecurityGroup'}}
+        target_group = resources['maindbRDSProxyTargetGroup']['Properties']
+        assert target_group['DBInstanceIdentifiers'] == [{'Ref': 'maindbRDSInstance'}]
+        assert target_group['ConnectionPoolConfigurationInfo']['MaxConnectionsPercent'] == 75
+        assert template['Outputs']['maindbRDSProxyEndpoint']['Value'] == {
+            'Fn::GetAtt': ['maindbRDSProxy', 'Endpoint']}
+
+    def test_create_rds_proxy_pool_limits(self):
+        """Test pool settings outside their ranges are rejected."""
+        try:
+            create_rds_proxy(self.stack, 'main-db', self.db, SECRET, ['subnet-a'], [],
+                             max_connections_percent=40, max_idle_connections_percent=50)
+        except ValueError as error:
+            assert 'max_idle_connections_percent' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
@@ -0,0 +1,299 @@
+from troposphere import Template
+from tropohelper.security import create_acm_certificate
+from tropohelper.network import create_alb, create_alb_listener_rule, create_alb_listener_rules, \
+                                create_cache_policy, create_cloudfront_distribution, create_dns_routing, create_nat_fabric, create_or_update_dns_record, \
+                                create_subnet, create_vpc, create_vpc_mesh
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+class TestNetwork:
+    """Test the network functions."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+
+    def test_create_alb_listener_rule_multiple_conditions(self):
+        """Test creating a listener rule with several conditions."""
+        create_alb_listener_rule(self.stack, 'Api', 'listener-arn',
+                                 [{'field': 'host-header', 'values': ['api.example.com']},
+                                  {'field': 'path-pattern', 'values': ['/v1/*']}],
+                                 'tg-arn', priority=7)
+        rule = self.stack.stack.to_dict()['Resources']['ApiListenerRule']['Properties']
+        assert [c['Field'] for c in rule['Conditions']] == ['host-header', 'path-pattern']
+        assert rule['Actions'][0]['TargetGroupArn'] == 'tg-arn'
+        assert rule['Priority'] == 7
+
+    def test_create_alb_listener_rules_orders_and_merges(self):
+        """Test rules are ordered by specificity and merged."""
+        routes = [
+            {'path': '/health', 'target_group': 'health-tg'},
+            {'host': 'a.example.com', 'path': '/api/*', 'target_group': 'api-tg'},
+            {'host': 'a.example.com', 'path': '/api/login', 'target_group': 'login-tg'},
+            {'host': 'a.example.com', 'path': '/static', 'target_group': 'web-tg'},
+            {'host': 'a.example.com', 'path': '/images', 'target_group': 'web-tg'},
+        ]
+        allocations = create_alb_listener_rules(self.stack, 'Web', 'listener-arn', routes)
+        assert len(allocations) == 1
+        resources = self.stack.stack.to_dict()['Resources']
+        rules = sorted((r['Properties'] for r in resources.values()), key=lambda r: r['Priority'])
+        paths = [r['Conditions'][-1]['PathPatternConfig']['Values'] for r in rules]
+        assert paths == [['/api/login'], ['/static', '/images'], ['/api/*'], ['/health']]
+        assert [r['Priority'] for r in rules] == [1, 2, 3, 4]
+
+    def test_create_alb_listener_rules_keeps_overlapping_order(self):
+        """Test rules that can share a request keep input order."""
+        routes = [
+            {'path': '/x', 'target_group': 'b-tg'},
+            {'host': 'a.com', 'target_group': 'a-tg'},
+            {'path': '/y', 'target_group': 'b-tg'},
+        ]
+        create_alb_listener_rules(self.stack, 'Web', 'listener-arn', routes)
+        resources = self.stack.stack.to_dict()['Resources']
+        rules = sorted((r['Properties'] for r in resources.values()), key=lambda r: r['Priority'])
+        assert [(r['Priority'], r['Conditions'][0]['Field'], r['Actions'][0]['TargetGroupArn'])
+                for r in rules] == [(1, 'path-pattern', 'b-tg'), (2, 'host-header', 'a-tg'),
+                                    (3, 'path-pattern', 'b-tg')]
+        assert rules[0]['Conditions'][0]['PathPatternConfig']['Values'] == ['/x']
+        assert rules[2]['Conditions'][0]['PathPatternConfig']['Values'] == ['/y']
+
+    def test_create_alb_listener_rules_spills_to_new_alb(self):
+        """Test hosts that do not fit are moved to extra ALBs."""
+        routes = [{'host': 'h{0}.example.com'.format(i), 'target_group': 'tg{0}'.format(i)}
+                  for i in range(5)]
+        routes.append({'path': '/health', 'target_group': 'health-tg'})
+        allocations = create_alb_listener_rules(self.stack, 'Web', 'listener-arn', routes,
+                                                default_target_group='default-tg', max_rules=3)
+        assert len(allocations) == 3
+        assert allocations[0]['alb'] is None
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['Web1ALB']['Type'] == 'AWS::ElasticLoadBalancingV2::LoadBalancer'
+        assert resources['Web1Listener']['Properties']['LoadBalancerArn'] == {'Ref': 'Web1ALB'}
+        hosts = [host for allocation in allocations for host in allocation['hosts']]
+        assert sorted(hosts) == ['h{0}.example.com'.format(i) for i in range(5)]
+        for allocation in allocations:
+            assert len(allocation['rules']) <= 3
+
+    def test_create_alb_listener_rules_rejects_conflicts(self):
+        """Test conflicting routes for the same match are rejected."""
+        routes = [{'path': '/a', 'target_group': 'one'}, {'path': '/a', 'target_group': 'two'}]
+        try:
+            create_alb_listener_rules(self.stack, 'Web', 'listener-arn', routes)
+        except ValueError:
+            return
+        assert False, 'conflicting routes were accepted'
+
+    def test_create_nat_fabric(self):
+        """Test one NAT gateway and private route table per AZ."""
+        self.stack.vpc = create_vpc(self.stack, 'Test', '10.0.0.0/16')
+        zones = []
+        for zone in ['A', 'B']:
+            zones.append({
+                'name': zone,
+                'public_subnet': create_subnet(self.stack, 'Public' + zone, 'PublicParam'),
+                'private_subnets': [create_subnet(self.stack, 'Private' + zone, 'PrivateParam')],
+            })
+        fabric = create_nat_fabric(self.stack, zones)
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['ANat']['Properties']['SubnetId'] == {'Ref': 'PublicASubnet'}
+        assert resources['BNat']['Properties']['AllocationId'] == {'Fn::GetAtt': ['BNateip', 'AllocationId']}
+        assert resources['BNatRoute']['Properties']['RouteTableId'] == {'Ref': 'testBPrivateRouteTable'}
+        assert resources['BPrivate0RouteAssociation']['Properties']['SubnetId'] == {'Ref': 'PrivateBSubnet'}
+        endpoint = resources['testS3Endpoint']['Properties']
+        assert endpoint['VpcEndpointType'] == 'Gateway'
+        assert endpoint['RouteTableIds'] == [{'Ref': 'testAPrivateRouteTable'},
+                                             {'Ref': 'testBPrivateRouteTable'}]
+        assert len(fabric['endpoints']) == 2
+
+    def _vpcs(self, count):
+        """Build a list of VPC definitions for the mesh tests."""
+        return [{
+            'name': 'Vpc{0}'.format(idx),
+            'vpc_id': 'vpc-{0}'.format(idx),
+            'cidr': '10.{0}.0.0/16'.format(idx),
+            'route_tables': ['rtb-{0}'.format(idx)],
+            'subnet_ids': ['subnet-{0}'.format(idx)],
+        } for idx in range(count)]
+
+    def test_create_vpc_mesh_peering(self):
+        """Test a small mesh peers every pair and routes both ways."""
+        mesh = create_vpc_mesh(self.stack, 'Mesh', self._vpcs(3))
+        assert mesh['topology'] == 'mesh'
+        assert len(mesh['peerings']) == 3
+        assert len(mesh['routes']) == 6
+        route = self.stack.stack.to_dict()['Resources']['MeshVpc2ToVpc0Route0']['Properties']
+        assert route['DestinationCidrBlock'] == '10.0.0.0/16'
+        assert route['VpcPeeringConnectionId'] == {'Ref': 'MeshVpc0Vpc2Peering'}
+
+    def test_create_vpc_mesh_hub_summarises_routes(self):
+        """Test large meshes fall back to a transit gateway hub."""
+        mesh = create_vpc_mesh(self.stack, 'Mesh', self._vpcs(64))
+        assert mesh['topology'] == 'hub'
+        assert len(mesh['attachments']) == 64
+        resources = self.stack.stack.to_dict()['Resources']
+        assert len(resources) < 200
+        route = resources['MeshVpc5TgwRoute0x0']['Properties']
+        assert route['DestinationCidrBlock'] == '10.0.0.0/10'
+        assert route['TransitGatewayId'] == {'Ref': 'MeshTransitGateway'}
+        assert resources['MeshVpc5TgwRoute0x0']['DependsOn'] == ['MeshVpc5TgwAttachment']
+
+    def test_create_vpc_mesh_cross_region(self):
+        """Test remote VPCs are peered from here and their routes returned."""
+        vpcs = self._vpcs(3)
+        vpcs[0]['region'] = 'eu-west-1'
+        mesh = create_vpc_mesh(self.stack, 'Mesh', vpcs, topology='mesh')
+        resources = self.stack.stack.to_dict()['Resources']
+        peering = resources['MeshVpc0Vpc1Peering']['Properties']
+        assert peering['VpcId'] == 'vpc-1'
+        assert peering['PeerVpcId'] == 'vpc-0'
+        assert peering['PeerRegion'] == 'eu-west-1'
+        assert resources['MeshVpc1Vpc2Peering']['Properties']['PeerRegion'] == {
+            'Ref': 'AWS::Region'}
+        assert len(mesh['routes']) == 4
+        assert not any(route.RouteTableId == 'rtb-0' for route in mesh['routes'])
+        assert [(r['region'], r['route_table'], r['destination']) for r in mesh['remote_routes']] == [
+            ('eu-west-1', 'rtb-0', '10.1.0.0/16'), ('eu-west-1', 'rtb-0', '10.2.0.0/16')]
+        assert mesh['remote_routes'][0]['peering'].title == 'MeshVpc0Vpc1Peering'
+        vpcs[1]['region'] = 'eu-west-2'
+        for topology in ('mesh', 'hub'):
+            try:
+                create_vpc_mesh(test_stack(), 'Mesh', vpcs, topology=topology)
+            except ValueError as error:
+                assert 'Vpc0' in str(error)
+            else:
+                raise AssertionError('expected a ValueError')
+
+    def test_create_vpc_mesh_rejects_overlaps(self):
+        """Test overlapping CIDRs are rejected."""
+        vpcs = self._vpcs(2)
+        vpcs[1]['cidr'] = '10.0.128.0/17'
+        try:
+            create_vpc_mesh(self.stack, 'Mesh', vpcs)
+        except ValueError:
+            return
+        assert False, 'overlapping CIDRs were accepted'
+
+    def test_create_or_update_dns_record_defaults(self):
+        """Test plain records keep their original shape."""
+        create_or_update_dns_record(self.stack, 'www.example.com', 'CNAME',
+                                    ['web.example.com'], 'example.com')
+        record = self.stack.stack.to_dict()['Resources']['wwwexamplecom']['Properties']
+        assert record['TTL'] == '60'
+        assert record['ResourceRecords'] == ['web.example.com']
+        assert 'SetIdentifier' not in record
+
+    def test_create_dns_routing_latency_with_health_checks(self):
+        """Test latency records alias ALBs and tie in health checks."""
+        east = create_alb(self.stack, 'East', subnets=['subnet-1'])
+        created = create_dns_routing(self.stack, 'example.com', {
+            'api.example.com': {
+                'policy': 'latency',
+                'health_check': {'path': '/health'},
+                'endpoints': [
+                    {'name': 'use1', 'region': 'us-east-1', 'alb': east},
+                    {'name': 'usw2', 'region': 'us-west-2',
+                     'dns_name': 'west.elb.amazonaws.com', 'hosted_zone_id': 'Z1H1FL5HABSF5'},
+                ]}})
+        assert len(created['api.example.com']['records']) == 2
+        resources = self.stack.stack.to_dict()['Resources']
+        east_record = resources['apiexamplecomuse1']['Properties']
+        assert east_record['Region'] == 'us-east-1'
+        assert east_record['SetIdentifier'] == 'use1'
+        assert east_record['HealthCheckId'] == {'Ref': 'apiexamplecomuse1HealthCheck'}
+        assert east_record['AliasTarget'] == {
+            'DNSName': {'Fn::GetAtt': ['EastALB', 'DNSName']},
+            'HostedZoneId': {'Fn::GetAtt': ['EastALB', 'CanonicalHostedZoneID']},
+            'EvaluateTargetHealth': 'true'}
+        assert 'TTL' not in east_record
+        check = resources['apiexamplecomusw2HealthCheck']['Properties']['HealthCheckConfig']
+        assert check['FullyQualifiedDomainName'] == 'west.elb.amazonaws.com'
+        assert check['ResourcePath'] == '/health'
+        assert check['Type'] == 'HTTPS'
+
+    def test_create_dns_routing_weighted_and_failover(self):
+        """Test weighted and failover policies and their validation."""
+        create_dns_routing(self.stack, 'example.com', {
+            'blue.example.com': {
+                'policy': 'weighted',
+                'endpoints': [
+                    {'name': 'blue', 'dns_name': 'blue.elb', 'hosted_zone_id': 'Z1', 'weight': 90},
+                    {'name': 'green', 'dns_name': 'green.elb', 'hosted_zone_id': 'Z1'},
+                ]},
+            'app.example.com': {
+                'policy': 'failover',
+                'endpoints': [
+                    {'name': 'main', 'dns_name': 'main.elb', 'hosted_zone_id': 'Z1'},
+                    {'name': 'dr', 'dns_name': 'dr.elb', 'hosted_zone_id': 'Z2'},
+                ]}})
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['blueexamplecomblue']['Properties']['Weight'] == 90
+        assert resources['blueexamplecomgreen']['Properties']['Weight'] == 1
+        assert resources['appexamplecommain']['Properties']['Failover'] == 'PRIMARY'
+        assert resources['appexamplecomdr']['Properties']['Failover'] == 'SECONDARY'
+        assert not any(r['Type'] == 'AWS::Route53::HealthCheck' for r in resources.values())
+
+        try:
+            create_dns_routing(self.stack, 'example.com', {
+                'bad.example.com': {'policy': 'latency', 'endpoints': [
+                    {'name': 'x', 'dns_name': 'x.elb', 'hosted_zone_id': 'Z1'}]}})
+        except ValueError as error:
+            assert 'needs a region' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+
+    def test_create_cloudfront_distribution(self):
+        """Test an ALB-backed distribution with policies, certificate and alias."""
+        web = create_alb(self.stack, 'Web', subnets=['subnet-1'])
+        cert = create_acm_certificate(self.stack, 'www.example.com')
+        static = create_cache_policy(self.stack, 'Static', query_strings=['v'])
+        create_cloudfront_distribution(
+            self.stack, 'Web', web, domain_names=['www.example.com'], certificate=cert,
+            hosted_zone_name='example.com', origin_shield_region='us-east-1',
+            origin_domain_name='origin.example.com',
+            behaviors=[{'path': '/static/*', 'cache_policy': static,
+                        'origin_request_policy': None, 'methods': 'read'}])
+        resources = self.stack.stack.to_dict()['Resources']
+        config = resources['WebDistribution']['Properties']['DistributionConfig']
+        assert config['HttpVersion'] == 'http2and3'
+        assert config['Origins'][0]['DomainName'] == 'origin.example.com'
+        assert config['Origins'][0]['OriginShield'] == {
+            'Enabled': 'true', 'OriginShieldRegion': 'us-east-1'}
+        assert config['ViewerCertificate']['AcmCertificateArn'] == {'Ref': 'mycert'}
+        default = config['DefaultCacheBehavior']
+        assert default['CachePolicyId'] == '4135ea2d-6df8-44a3-9df3-4b5a84be39ad'
+        assert default['OriginRequestPolicyId'] == '216adef6-5c7f-47e4-b989-5492eafa07d3'
+        assert default['Compress'] == 'true'
+        static_behavior = config['CacheBehaviors'][0]
+        assert static_behavior['CachePolicyId'] == {'Ref': 'StaticCachePolicy'}
+        assert 'OriginRequestPolicyId' not in static_behavior
+        assert static_behavior['AllowedMethods'] == ['GET', 'HEAD']
+        cache_key = resources['StaticCachePolicy']['Properties']['CachePolicyConfig'][
+            'ParametersInCacheKeyAndForwardedToOrigin']
+        assert cache_key['QueryStringsConfig'] == {
+            'QueryStringBehavior': 'whitelist', 'QueryStrings': ['v']}
+        assert cache_key['EnableAcceptEncodingBrotli'] == 'true'
+        alias = resources['wwwexamplecom']['Properties']['AliasTarget']
+        assert alias['DNSName'] == {'Fn::GetAtt': ['WebDistribution', 'DomainName']}
+        assert alias['HostedZoneId'] == 'Z2FDTNDATAQYW2'
+        assert alias['EvaluateTargetHealth'] == 'false'
+
+    def test_create_cloudfront_distribution_origin_name(self):
+        """Test https origins to an ALB need a name its certificate covers."""
+        web = create_alb(self.stack, 'Web', subnets=['subnet-1'])
+        try:
+            create_cloudfront_distribution(self.stack, 'Web', web)
+        except ValueError as error:
+            assert 'needs an origin_domain_name' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+        plain = create_cloudfront_distribution(self.stack, 'Plain', web, origin_protocol='http-only')
+        origin = plain.to_dict()['Properties']['DistributionConfig']['Origins'][0]
+        assert origin['DomainName'] == {'Fn::GetAtt': ['WebALB', 'DNSName']}
+        assert origin['CustomOriginConfig']['OriginProtocolPolicy'] == 'http-only'
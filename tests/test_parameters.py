@@ -2,7 +2,8 @@ from nose import with_setup
 from troposphere import Template
 from tropohelper.parameters import create_vpc_param, create_subnet_param, create_ami_param, \
                                    create_bool_param, create_instance_type_param, create_ssh_key_param, \
-                                   create_cache_instance_type_param, create_dbpass_param
+                                   create_cache_instance_type_param, create_dbpass_param, \
+                                   LocalParameterStore, ParameterResolver
 
 
 class test_stack(object):
@@ -67,3 +68,60 @@ class TestParameters:
         create_cache_instance_type_param(self.stack, 'TestCacheType')
         cache_default_size = self.stack.stack.to_dict()['Parameters']['TestCacheTypeCacheNodeType']['Default']
         assert cache_default_size == 'cache.t2.small'
+
+    def test_create_param_dedupes_identical_calls(self):
+        """Test identical parameters are reused and conflicting ones rejected."""
+        first = create_ami_param(self.stack, 'Web')
+        assert create_ami_param(self.stack, 'Web') is first
+        create_subnet_param(self.stack, 'Web', '10.0.1.0/24')
+        try:
+            create_subnet_param(self.stack, 'Web', '10.0.2.0/24')
+        except ValueError:
+            return
+        assert False, 'conflicting parameter was accepted'
+
+    def test_parameter_resolver_ssm(self):
+        """Test ssm mode creates SSM typed parameters."""
+        resolver = ParameterResolver(self.stack, mode='ssm')
+        ami = resolver.ami('Web', '/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2')
+        assert ami.to_dict() == {'Ref': 'WebAmiIdParam'}
+        param = self.stack.stack.to_dict()['Parameters']['WebAmiIdParam']
+        assert param['Type'] == 'AWS::SSM::Parameter::Value<AWS::EC2::Image::Id>'
+        assert resolver.ami('Web', '/other') is ami
+
+    def test_parameter_resolver_mapping(self):
+        """Test mapping mode bakes store values and falls back to parameters."""
+        store = LocalParameterStore({'/web/ami': 'ami-0abc', '/web/subnet': '10.0.3.0/24'})
+        resolver = ParameterResolver(self.stack, mode='mapping', store=store)
+        ami = resolver.ami('Web', '/web/ami')
+        subnet = resolver.subnet('Web', '10.0.1.0/24', '/web/subnet')
+        missing = resolver.instance_type('Web', '/web/missing')
+        template = self.stack.stack.to_dict()
+        assert ami.to_dict() == {'Fn::FindInMap': ['ResolvedParameters', 'Values', 'WebAmiIdParam']}
+        assert template['Mappings']['ResolvedParameters']['Values']['WebSubnetParam'] == '10.0.3.0/24'
+        assert subnet.to_dict()['Fn::FindInMap'][2] == 'WebSubnetParam'
+        assert missing.to_dict() == {'Ref': 'WebboxsizeParam'}
+        assert list(template['Parameters']) == ['WebboxsizeParam']
+
+    def test_parameter_resolver_limit(self):
+        """Test ssm mode maps values past the parameter limit or raises."""
+        for index in range(59):
+            create_ami_param(self.stack, 'Svc{0}'.format(index))
+        store = LocalParameterStore({'/web/ami': 'ami-0abc', '/api/ami': 'ami-0def'})
+        resolver = ParameterResolver(self.stack, mode='ssm', store=store)
+        assert resolver.ami('Web', '/web/ami').to_dict() == {'Ref': 'WebAmiIdParam'}
+        assert resolver.ami('Api', '/api/ami').to_dict() == {
+            'Fn::FindInMap': ['ResolvedParameters', 'Values', 'ApiAmiIdParam']}
+        try:
+            ParameterResolver(self.stack, mode='ssm').ami('Cron', '/cron/ami')
+        except ValueError as error:
+            assert 'CronAmiIdParam would exceed the 60 parameter limit' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+
+    def test_create_instance_type_param_families(self):
+        """Test newer families come from the catalog."""
+        create_instance_type_param(self.stack, 'Graviton', default='m7g.large', families=['m7g', 'r7g'])
+        allowed = self.stack.stack.to_dict()['Parameters']['GravitonboxsizeParam']['AllowedValues']
+        assert 'r7g.16xlarge' in allowed
+        assert 't2.medium' not in allowed
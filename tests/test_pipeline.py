@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from troposphere import Template
+from tropohelper.network import create_vpc
+from tropohelper.parameters import create_vpc_param
+from tropohelper.pipeline import LocalObjectStore, STAGES, run_pipeline
+from tropohelper.render import HASH_KEY
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+def build_network():
+    """Build a small network stack."""
+    stack = test_stack()
+    stack.vpc_address_param = create_vpc_param(stack, '10.0.0.0/16')
+    create_vpc(stack, 'Network')
+
+    return stack
+
+
+def build_empty():
+    """Build an empty template."""
+
+    return Template(Description='empty')
+
+
+def build_broken():
+    """Fail while building."""
+    raise ValueError('broken builder')
+
+
+class SlowStore(LocalObjectStore):
+    """Object store that records how many uploads overlap."""
+
+    def __init__(self, root):
+        super(SlowStore, self).__init__(root)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def put_object(self, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+
+        with self.lock:
+            self.active -= 1
+
+        return super(SlowStore, self).put_object(**kwargs)
+
+
+class TestPipeline:
+    """Test the async build pipeline."""
+
+    def setup(self):
+        """Create scratch directories."""
+        self.root = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.root, 'build')
+        self.store = LocalObjectStore(os.path.join(self.root, 'store'))
+
+    def test_generates_writes_and_packages(self):
+        """Test every stage runs and unchanged templates are not re-uploaded."""
+        jobs = [('network', build_network), ('empty', build_empty)]
+        report = run_pipeline(jobs, out_dir=self.out_dir, store=self.store,
+                              bucket='templates', prefix='v1/', max_workers=2)
+        assert [s['name'] for s in report['stacks']] == ['network', 'empty']
+        assert all(s['uploaded'] for s in report['stacks'])
+        assert set(report['stages']) == set(STAGES)
+        assert report['stages']['generate']['count'] == 2
+
+        network = report['stacks'][0]
+        with open(network['path']) as handle:
+            template = json.load(handle)
+        assert 'NetworkVPC' in template['Resources']
+        assert HASH_KEY in template['Metadata']
+        head = self.store.head_object(Bucket='templates', Key='v1/network.json')
+        assert head['Metadata']['sha256'] == network['sha256']
+
+        again = run_pipeline(jobs, store=self.store, bucket='templates', prefix='v1/',
+                             max_workers=2)
+        assert [s['uploaded'] for s in again['stacks']] == [False, False]
+        assert again['stacks'][0]['sha256'] == network['sha256']
+
+    def test_failures_are_reported_per_stack(self):
+        """Test a failing builder does not stop the others."""
+        report = run_pipeline([('broken', build_broken), ('empty', build_empty)],
+                              out_dir=self.out_dir, max_workers=1)
+        broken, empty = report['stacks']
+        assert broken['error'] == 'ValueError: broken builder'
+        assert 'error' not in empty
+        assert os.path.exists(empty['path'])
+
+    def test_io_concurrency_is_bounded(self):
+        """Test uploads never exceed io_concurrency at once."""
+        store = SlowStore(os.path.join(self.root, 'slow'))
+        jobs = [('stack{0}'.format(n), build_empty) for n in range(6)]
+        report = run_pipeline(jobs, store=store, bucket='templates', max_workers=2,
+                              queue_size=1, io_concurrency=2)
+        assert all(s['uploaded'] for s in report['stacks'])
+        assert store.peak <= 2
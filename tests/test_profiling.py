@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import pstats
+import tempfile
+
+from troposphere import Template
+from tropohelper import profiling
+from tropohelper.network import create_vpc, create_subnet
+from tropohelper.profiling import json_sink, profile, pstats_sink, table_sink
+from tropohelper.security import create_iam_role
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+class TestProfiling:
+    """Test the helper profiling hooks."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+
+    def build(self):
+        """Build a few resources through the helpers."""
+        self.stack.vpc = create_vpc(self.stack, 'Test', '10.0.0.0/16')
+        create_subnet(self.stack, 'One', 'OneParam')
+        create_subnet(stack=self.stack, name='Two', subnet_cidr='TwoParam')
+        create_iam_role(self.stack, 'test-role', instance_profile=True)
+
+    def test_profile_records_calls_and_resources(self):
+        """Test calls, timings and resources are recorded per helper."""
+        with profile() as profiler:
+            self.build()
+        subnet = profiler.stats['tropohelper.network.create_subnet']
+        assert subnet.calls == 2
+        assert subnet.resources == 2
+        assert subnet.total >= subnet.own > 0
+        assert profiler.stats['tropohelper.security.create_iam_role'].resources == 2
+
+    def test_profile_disabled_outside_block(self):
+        """Test nothing is recorded once the block has exited."""
+        with profile() as profiler:
+            pass
+        self.build()
+        assert profiler.stats == {}
+        assert profiling._profiler is None
+
+    def test_sinks(self):
+        """Test the table, json and pstats sinks."""
+        table = io.StringIO()
+        data = io.StringIO()
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            with profile(table_sink(table), json_sink(data), pstats_sink(filename)):
+                self.build()
+            assert 'tropohelper.network.create_subnet' in table.getvalue()
+            names = [entry['name'] for entry in json.loads(data.getvalue())]
+            assert 'tropohelper.network.create_vpc' in names
+            stats = pstats.Stats(filename)
+            assert any(key[2] == 'create_subnet' for key in stats.stats)
+        finally:
+            os.remove(filename)
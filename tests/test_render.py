@@ -0,0 +1,95 @@
+import json
+
+from troposphere import Ref, Template
+from tropohelper.network import create_target_group
+from tropohelper.render import HASH_KEY, canonicalize, render, resource_hashes
+from tropohelper.services import create_sns_notification_alarm
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+        self.vpc = Ref('VPC')
+
+
+def build(attributes, dimensions, threshold):
+    """Build a small stack from the given dict arguments."""
+    stack = test_stack()
+    create_target_group(stack, 'Web', 443, attributes=attributes)
+    create_sns_notification_alarm(stack, 'Errors', 'errors', 'Errors',
+                                  'AWS/Lambda', 'arn:aws:sns:topic',
+                                  dimensions=dimensions, threshold=threshold)
+
+    return stack
+
+
+class TestRender:
+    """Test canonical rendering."""
+
+    def setup(self):
+        """Set up two equivalent stacks built in different orders."""
+        self.first = build(
+            {'stickiness.enabled': 'true', 'deregistration_delay.timeout_seconds': '30'},
+            {'Resource': 'fn', 'FunctionName': 'fn'}, 0)
+        self.second = build(
+            {'deregistration_delay.timeout_seconds': '30', 'stickiness.enabled': 'true'},
+            {'FunctionName': 'fn', 'Resource': 'fn'}, '0')
+
+    def test_equivalent_stacks_render_identically(self):
+        """Test dict order and scalar spelling do not change the output."""
+        assert render(self.first) == render(self.second)
+        assert resource_hashes(self.first) == resource_hashes(self.second)
+
+    def test_hashes_are_added_and_track_changes(self):
+        """Test resource and template hashes land in Metadata."""
+        template = json.loads(render(self.first))
+        hashes = resource_hashes(self.first)
+        assert template['Metadata'][HASH_KEY] == hashes['']
+        assert template['Resources']['WebTargetGroup']['Metadata'][HASH_KEY] == \
+            hashes['WebTargetGroup']
+        # Rendering is idempotent: hashing a rendered template gives the same hashes.
+        assert resource_hashes(template) == hashes
+
+        changed = build({'stickiness.enabled': 'false'},
+                        {'Resource': 'fn', 'FunctionName': 'fn'}, 0)
+        changed_hashes = resource_hashes(changed)
+        assert changed_hashes['WebTargetGroup'] != hashes['WebTargetGroup']
+        assert changed_hashes['ErrorsAlarm'] == hashes['ErrorsAlarm']
+        assert changed_hashes[''] != hashes['']
+
+    def test_free_text_is_kept(self):
+        """Test descriptions, tag values and intrinsics are not rewritten."""
+        value = canonicalize({
+            'Description': 'True',
+            'Tags': [{'Key': 'b', 'Value': 'True'}, {'Key': 'a', 'Value': 1}],
+            'Value': {'Fn::Select': [0, ['a']]}
+        })
+        assert value['Description'] == 'True'
+        assert value['Tags'] == [{'Key': 'a', 'Value': 1}, {'Key': 'b', 'Value': 'True'}]
+        assert value['Value'] == {'Fn::Select': [0, ['a']]}
+
+    def test_only_typed_properties_are_normalised(self):
+        """Test parameters, mappings and untyped strings keep their spelling."""
+        value = canonicalize({
+            'Parameters': {'Flag': {'Type': 'String', 'Default': 'True',
+                                    'AllowedValues': ['True', 'False']}},
+            'Mappings': {'Sizes': {'web': {'Count': 2, 'Public': 'True'}}},
+            'Conditions': {'On': {'Fn::Equals': [{'Ref': 'Flag'}, 'True']}},
+            'Resources': {
+                'Fn': {'Type': 'AWS::Lambda::Function', 'Properties': {
+                    'MemorySize': 512, 'Timeout': 30.0,
+                    'Environment': {'Variables': {'DEBUG': 'True', 'PORT': 80}}}},
+                'Vpc': {'Type': 'AWS::EC2::VPC', 'Properties': {
+                    'EnableDnsSupport': True, 'EnableDnsHostnames': 'False'}}}
+        })
+        assert value['Parameters']['Flag']['Default'] == 'True'
+        assert value['Parameters']['Flag']['AllowedValues'] == ['True', 'False']
+        assert value['Mappings']['Sizes']['web'] == {'Count': 2, 'Public': 'True'}
+        function = value['Resources']['Fn']['Properties']
+        assert function['MemorySize'] == '512' and function['Timeout'] == '30'
+        assert function['Environment']['Variables'] == {'DEBUG': 'True', 'PORT': 80}
+        assert value['Resources']['Vpc']['Properties'] == {
+            'EnableDnsSupport': 'true', 'EnableDnsHostnames': 'false'}
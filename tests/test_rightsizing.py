@@ -0,0 +1,76 @@
+from troposphere import GetAtt, Ref, Template
+from tropohelper.instances import create_autoscale_group, create_launch_config, create_rds_instance
+from tropohelper.network import create_alb, create_alb_listener, create_target_group
+from tropohelper.parameters import create_instance_type_param, create_ssh_key_param
+from tropohelper.rightsizing import capacity_report
+from tropohelper.services import create_json_redshift_firehose_from_stream, create_kinesis_stream
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+class TestRightsizing:
+    """Test the capacity report."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+        self.stack.vpc = 'vpc-1'
+        self.stack.ssh_key_param = create_ssh_key_param(self.stack)
+
+    def build_web(self):
+        """Build an ASG behind an ALB spanning three zones."""
+        web_type = create_instance_type_param(self.stack, 'Web', default='m5.large')
+        config = create_launch_config(self.stack, 'web', 'ami-1', ['sg-1'], Ref(web_type), 'profile')
+        group = create_target_group(self.stack, 'Web', 443)
+        balancer = create_alb(self.stack, 'Web', subnets=['subnet-a', 'subnet-b', 'subnet-c'])
+        create_alb_listener(self.stack, 'Web', Ref(balancer), Ref(group))
+        return create_autoscale_group(self.stack, 'web', config, ['subnet-a', 'subnet-b'],
+                                      target_groups=[Ref(group)])
+
+    def test_capacity_report_totals(self):
+        """Test ASG and RDS capacity is summed from the catalog."""
+        self.build_web()
+        create_rds_instance(self.stack, 'main-db', 'main', 'db.r5.large', 'user', 'pass',
+                            'subnets', [], [], 'params', allocated_storage='100', multi_az=True)
+        report = capacity_report(self.stack)
+        entries = dict((entry['resource'], entry) for entry in report['resources'])
+        assert entries['testwebASG']['instance_type'] == 'm5.large'
+        assert entries['testwebASG']['vcpu'] == 10
+        assert entries['maindbRDSInstance']['memory'] == 32
+        assert entries['maindbRDSInstance']['iops'] == 600
+        assert report['totals']['vcpu'] == 14
+        assert report['findings'] == []
+
+    def test_capacity_report_parameter_overrides(self):
+        """Test parameter values override defaults."""
+        self.build_web()
+        report = capacity_report(self.stack, parameters={'WebboxsizeParam': 'c7i.xlarge'})
+        assert report['totals']['memory'] == 40
+
+    def test_capacity_report_target_capacity(self):
+        """Test ASGs too small for their target groups are flagged."""
+        self.build_web()
+        template = self.stack.stack.to_dict()
+        template['Resources']['testwebASG']['Properties']['MaxSize'] = '2'
+        report = capacity_report(template, target_capacity={'WebTargetGroup': 4})
+        messages = [finding['message'] for finding in report['findings']]
+        assert any('3 ALB zones' in message for message in messages)
+        assert any('4 instances' in message for message in messages)
+
+    def test_capacity_report_firehose_buffer(self):
+        """Test a Firehose buffer the source stream cannot feed is flagged."""
+        stream = create_kinesis_stream(self.stack, 'events', 1)
+        create_json_redshift_firehose_from_stream(
+            self.stack, 'events', 'firehose-arn', GetAtt(stream, 'Arn'), 'role', 'jdbc', 'user',
+            'pass', 'table', 'logs', 'redshift', 's3', 'bucket', 'kms', 's3-role',
+            s3_buffering_seconds=60, s3_buffering_size=90)
+        report = capacity_report(self.stack)
+        assert report['totals']['throughput'] == 1
+        assert report['findings'][0]['resource'] == 'eventsFirehose'
+        assert report['findings'][0]['message'].endswith('has 1 shard(s) (1.00MB/s).')
@@ -0,0 +1,61 @@
+import json
+
+from troposphere import Template
+from tropohelper.security import compile_iam_policies, create_iam_policies, policy_size
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+class TestSecurity:
+    """Test the security functions."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+
+    def test_compile_iam_policies_merges_and_dedupes(self):
+        """Test duplicate actions and resources end up in one statement."""
+        grants = [
+            {'actions': ['s3:GetObject', 's3:PutObject'], 'resources': ['arn:aws:s3:::a/*']},
+            {'actions': ['S3:getobject', 's3:PutObject'], 'resources': ['arn:aws:s3:::b/*']},
+            {'actions': ['sqs:SendMessage'], 'resources': ['arn:aws:s3:::a/*']},
+            {'actions': ['s3:PutObject', 's3:GetObject'], 'resources': ['arn:aws:s3:::c/*']},
+        ]
+        policies = compile_iam_policies(grants)
+        assert len(policies) == 1
+        document = json.loads(policies[0][0].to_json())
+        statements = sorted(document['Statement'], key=lambda s: len(s['Resource']))
+        assert statements[0]['Resource'] == ['arn:aws:s3:::a/*']
+        assert statements[1]['Resource'] == ['arn:aws:s3:::b/*', 'arn:aws:s3:::c/*']
+        assert statements[1]['Action'] == ['s3:GetObject', 's3:PutObject']
+        assert policies[0][1] == policy_size(policies[0][0])
+
+    def test_compile_iam_policies_wildcards(self):
+        """Test covered actions are dropped and safe wildcards applied."""
+        grants = [
+            {'actions': ['logs:*', 'logs:PutLogEvents']},
+            {'actions': ['ec2:DescribeInstances', 'ec2:DescribeTags', 'ec2:RunInstances']},
+            {'actions': ['logs:CreateLogGroup', 'kms:Decrypt'], 'resources': ['arn:aws:kms:::key/1']},
+        ]
+        policies = compile_iam_policies(grants, safe_wildcards=['ec2:Describe*'])
+        document = json.loads(policies[0][0].to_json())
+        actions = dict((tuple(s['Resource']), s['Action']) for s in document['Statement'])
+        assert actions[('*',)] == ['ec2:Describe*', 'ec2:RunInstances', 'logs:*']
+        assert actions[('arn:aws:kms:::key/1',)] == ['kms:Decrypt']
+
+    def test_create_iam_policies_splits_by_size(self):
+        """Test policies over the size limit are split across resources."""
+        grants = [{'actions': ['s3:GetObject'],
+                   'resources': ['arn:aws:s3:::bucket-{0:04d}/*'.format(idx) for idx in range(400)]}]
+        policies = create_iam_policies(self.stack, 'Reader', grants, roles=['role'])
+        assert len(policies) > 1
+        resources = self.stack.stack.to_dict()['Resources']
+        assert 'Reader1' in resources and 'Reader2' in resources
+        for _, size in policies:
+            assert size <= 6144
@@ -1,12 +1,16 @@
 from troposphere import Template, GetAtt, Ref
 from tropohelper.services import (
     create_kinesis_stream,
+    create_kinesis_consumer,
     create_json_redshift_firehose_from_stream,
     create_cloud_watch_logs_metric_filter,
     create_sns_topic,
     create_sns_notification_alarm,
     create_log_group,
-    create_log_stream
+    create_log_stream,
+    create_log_pipeline,
+    create_log_subscription,
+    create_metric_filters
 )
 
 class test_stack(object):
@@ -136,3 +140,134 @@ class test_stack(object):
         assert sns_notification_alarm_properties['Statistic'] == 'Minimum'
         assert sns_notification_alarm_properties['Threshold'] == '0'
         assert sns_notification_alarm_properties['TreatMissingData'] == 'missing'
+
+
+class TestLogPipeline:
+    """Test the log pipeline and bulk metric filters."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+
+    def test_create_log_pipeline(self):
+        """Test log groups are subscribed to a stream read by an S3 firehose."""
+        web = create_log_group(self.stack, 'web')
+        create_log_pipeline(self.stack, 'logs', {'web-logs': Ref(web), 'api-logs': 'api'},
+                            'arn:aws:s3:::logs', 'kms_key_arn', 's3_role_arn', shard_count=2)
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['logsStream']['Properties']['ShardCount'] == 2
+        firehose = resources['logsFirehose']
+        assert firehose['DependsOn'] == ['logsStreamToFirehose']
+        assert firehose['Properties']['DeliveryStreamType'] == 'KinesisStreamAsSource'
+        assert firehose['Properties']['KinesisStreamSourceConfiguration'] == {
+            'KinesisStreamARN': {'Fn::GetAtt': ['logsStream', 'Arn']},
+            'RoleARN': {'Fn::GetAtt': ['logsfirehosesourceRole', 'Arn']}}
+        subscription = resources['weblogsSubscriptionFilter']
+        assert subscription['DependsOn'] == ['logsLogsToStream']
+        assert subscription['Properties'] == {
+            'DestinationArn': {'Fn::GetAtt': ['logsStream', 'Arn']},
+            'FilterPattern': '',
+            'LogGroupName': {'Ref': 'webLogGroup'},
+            'RoleArn': {'Fn::GetAtt': ['logslogsRole', 'Arn']}}
+        assert resources['apilogsSubscriptionFilter']['Properties']['LogGroupName'] == 'api'
+
+    def test_create_log_subscription_limit(self):
+        """Test a log group takes at most two subscription filters."""
+        create_log_subscription(self.stack, 'one', 'web', 'arn:one', 'role')
+        create_log_subscription(self.stack, 'two', 'web', 'arn:two', 'role')
+        create_log_subscription(self.stack, 'other', 'api', 'arn:one', 'role')
+        try:
+            create_log_subscription(self.stack, 'three', 'web', 'arn:three', 'role')
+        except ValueError as error:
+            assert 'already has 2 subscription filters' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+
+    def test_create_metric_filters(self):
+        """Test metric filters are generated from a schema table within the limit."""
+        web = create_log_group(self.stack, 'web')
+        schema = [
+            {'name': 'web-errors', 'pattern': {'level': 'ERROR', 'status': 500}},
+            {'name': 'web-latency', 'pattern': '{ $.latency > 0 }', 'value': '$.latency'},
+        ]
+        create_metric_filters(self.stack, Ref(web), schema, metric_namespace='Web')
+        resources = self.stack.stack.to_dict()['Resources']
+        errors = resources['weberrorsMetricFilter']['Properties']
+        assert errors['FilterPattern'] == '{ ($.level = "ERROR") && ($.status = 500) }'
+        assert errors['MetricTransformations'][0]['MetricNamespace'] == 'Web'
+        latency = resources['weblatencyMetricFilter']['Properties']
+        assert latency['MetricTransformations'][0]['MetricValue'] == '$.latency'
+        many = [{'name': 'filter{0}'.format(index), 'pattern': 'x'} for index in range(99)]
+        try:
+            create_metric_filters(self.stack, Ref(web), many)
+        except ValueError as error:
+            assert 'Log group would have 101 metric filters' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+        create_metric_filters(self.stack, 'other', many)
+
+
+class TestKinesisConsumer:
+    """Test Kinesis consumers."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+        self.stream = create_kinesis_stream(self.stack, 'events', 4)
+
+    def test_create_kinesis_consumer(self):
+        """Test batching, parallelization, failure handling and the lag alarm."""
+        created = create_kinesis_consumer(self.stack, 'events-worker', self.stream, 'worker',
+                                          batch_size=500, batching_window=5,
+                                          parallelization_factor=4,
+                                          failure_destination_arn='arn:aws:sqs:::dlq',
+                                          sns_topic_arn='arn:aws:sns:::alerts')
+        assert created['consumer'] is None
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['eventsworkerEventSourceMapping']['Properties'] == {
+            'EventSourceArn': {'Fn::GetAtt': ['eventsStream', 'Arn']},
+            'FunctionName': 'worker',
+            'StartingPosition': 'LATEST',
+            'BatchSize': 500,
+            'MaximumBatchingWindowInSeconds': 5,
+            'ParallelizationFactor': 4,
+            'BisectBatchOnFunctionError': 'true',
+            'MaximumRetryAttempts': 3,
+            'DestinationConfig': {'OnFailure': {'Destination': 'arn:aws:sqs:::dlq'}}}
+        alarm = resources['eventsworkeriteratorageAlarm']['Properties']
+        assert alarm['MetricName'] == 'IteratorAge'
+        assert alarm['Statistic'] == 'Maximum'
+        assert alarm['Threshold'] == '60000'
+        assert alarm['Dimensions'] == [{'Name': 'FunctionName', 'Value': 'worker'}]
+
+    def test_create_kinesis_consumer_enhanced_fan_out(self):
+        """Test enhanced fan-out reads through a stream consumer."""
+        created = create_kinesis_consumer(self.stack, 'events-fast', self.stream, 'fast',
+                                          enhanced_fan_out=True)
+        assert created['alarm'] is None
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['eventsfastStreamConsumer']['Properties'] == {
+            'ConsumerName': 'events-fast',
+            'StreamARN': {'Fn::GetAtt': ['eventsStream', 'Arn']}}
+        assert resources['eventsfastEventSourceMapping']['Properties']['EventSourceArn'] == {
+            'Fn::GetAtt': ['eventsfastStreamConsumer', 'ConsumerARN']}
+        assert resources['eventsfastEventSourceMapping']['Properties'][
+            'MaximumRetryAttempts'] == -1
+        aged = create_kinesis_consumer(self.stack, 'events-aged', self.stream, 'aged',
+                                       maximum_retry_attempts=-1, maximum_record_age=3600,
+                                       failure_destination_arn='arn:aws:sqs:::dlq')
+        assert aged['mapping'].to_dict()['Properties']['MaximumRecordAgeInSeconds'] == 3600
+        try:
+            create_kinesis_consumer(self.stack, 'forever', self.stream, 'forever',
+                                    maximum_retry_attempts=-1,
+                                    failure_destination_arn='arn:aws:sqs:::dlq')
+        except ValueError as error:
+            assert 'nothing reaches the failure destination' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+        try:
+            create_kinesis_consumer(self.stack, 'bad', self.stream, 'bad', parallelization_factor=11)
+        except ValueError as error:
+            assert 'parallelization_factor' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
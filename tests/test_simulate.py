@@ -0,0 +1,85 @@
+from troposphere import Equals, GetAtt, Output, Ref, Template
+from tropohelper.network import (create_alb, create_elastic_ip, create_nat_gateway,
+                                 create_or_update_dns_record, create_subnet, create_vpc)
+from tropohelper.parameters import create_bool_param, create_subnet_param, create_vpc_param
+from tropohelper.simulate import simulate
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+
+
+def build():
+    """Build a network with a NAT gateway and an optional ALB."""
+    stack = test_stack()
+    stack.vpc_address_param = create_vpc_param(stack, '10.0.0.0/16')
+    stack.vpc = create_vpc(stack, 'Test')
+    subnet = create_subnet(stack, 'Public1', create_subnet_param(stack, 'Public1', '10.0.1.0/24'))
+    create_nat_gateway(stack, eip=create_elastic_ip(stack, 'Nat'), subnet=subnet)
+    use_alb = create_bool_param(stack, 'Alb')
+    stack.stack.add_condition('UseAlb', Equals(Ref(use_alb), 'YES'))
+    alb = create_alb(stack, 'Web', subnets=[Ref(subnet)], condition_field='UseAlb')
+    create_or_update_dns_record(stack, 'www.example.com', 'CNAME', [GetAtt(alb, 'DNSName')],
+                                'example.com', condition_field='UseAlb')
+
+    return stack
+
+
+class TestSimulate:
+    """Test the offline deploy simulator."""
+
+    def setup(self):
+        """Build the stack."""
+        self.stack = build()
+
+    def test_create_skips_false_conditions(self):
+        """Test conditional resources are skipped and timing follows dependencies."""
+        report = simulate(self.stack)
+        assert report['skipped'] == ['WebALB', 'wwwexamplecom']
+        assert report['total_time'] == 130.0
+        assert report['critical_path'] == ['TestVPC', 'Public1Subnet', 'Nat']
+        assert report['max_parallelism'] == 2
+        nat = report['resources']['Nat']
+        assert nat['start'] == 10.0
+        assert nat['properties']['AllocationId'] == 'simulated-Nateip.AllocationId'
+        assert report['resources']['Public1Subnet']['properties']['CidrBlock'] == '10.0.1.0/24'
+
+    def test_parameters_and_latencies(self):
+        """Test parameter values switch conditions and latencies are configurable."""
+        report = simulate(self.stack, parameters={'AlbBoolParam': 'YES'},
+                          latencies={'AWS::EC2::NatGateway': 1.0})
+        assert report['skipped'] == []
+        assert report['critical_path'] == ['TestVPC', 'Public1Subnet', 'WebALB', 'wwwexamplecom']
+        assert report['total_time'] == 250.0
+        record = report['resources']['wwwexamplecom']['properties']
+        assert record['ResourceRecords'] == ['simulated-WebALB.DNSName']
+
+        limited = simulate(self.stack, parameters={'AlbBoolParam': 'YES'}, max_parallel=1)
+        assert limited['max_parallelism'] == 1
+        assert limited['total_time'] == sum(
+            resource['end'] - resource['start'] for resource in limited['resources'].values())
+
+    def test_update_only_times_changes(self):
+        """Test updates only spend time on added and modified resources."""
+        previous = self.stack.stack.to_dict()
+        self.stack.stack.add_output(Output('Vpc', Value=Ref('TestVPC')))
+        assert simulate(self.stack, previous=previous)['total_time'] == 0.0
+
+        self.stack.stack.resources['Nat'].Tags = [{'Key': 'Name', 'Value': 'renamed'}]
+        report = simulate(self.stack, previous=previous)
+        assert report['total_time'] == 120.0
+        assert report['critical_path'] == ['TestVPC', 'Public1Subnet', 'Nat']
+
+    def test_reference_to_skipped_resource_fails(self):
+        """Test unconditional references to conditional resources are errors."""
+        self.stack.stack.resources['TestVPC'].DependsOn = ['WebALB']
+        try:
+            simulate(self.stack)
+        except ValueError as error:
+            assert 'WebALB is referenced but its condition is false' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
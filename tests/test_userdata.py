@@ -0,0 +1,79 @@
+import base64
+import email
+import gzip
+import os
+
+from troposphere import Ref, Template
+from tropohelper.instances import create_ec2_instance, create_launch_config
+from tropohelper.userdata import (UserDataStore, build_user_data, cloud_config_part,
+                                  decode_user_data, file_part, script_part)
+
+
+class test_stack(object):
+    """Test stack."""
+    def __init__(self):
+        """Intitialize our test stack."""
+        self.stack = Template()
+        self.env = "test"
+        self.ssh_key_param = Ref('SSHKey')
+
+
+BOOTSTRAP = '#!/bin/bash\nyum install -y nginx\n' * 50
+
+
+class TestUserData:
+    """Test building compressed multipart user data."""
+
+    def setup(self):
+        """Create our test environment."""
+        self.stack = test_stack()
+
+    def test_build_user_data(self):
+        """Test parts are deduped, compressed and reproducible."""
+        parts = [script_part(BOOTSTRAP), cloud_config_part({'packages': ['nginx']}),
+                 file_part('/etc/app.conf', 'port=80\n'), script_part(BOOTSTRAP)]
+        user_data = build_user_data(parts)
+        assert user_data == build_user_data(parts)
+        assert len(base64.b64decode(user_data)) < len(BOOTSTRAP)
+        message = email.message_from_string(decode_user_data(user_data))
+        sections = message.get_payload()
+        assert [s.get_content_type() for s in sections] == [
+            'text/x-shellscript', 'text/cloud-config', 'text/cloud-config']
+        assert sections[0].get_payload() == BOOTSTRAP
+        assert sections[2]['Merge-Type'].startswith('list(append)')
+        assert '"path": "/etc/app.conf"' in sections[2].get_payload()
+
+    def test_build_user_data_size_limit(self):
+        """Test oversized payloads are rejected."""
+        noise = base64.b64encode(os.urandom(20000)).decode('ascii')
+        try:
+            build_user_data([script_part(noise)])
+        except ValueError as error:
+            assert 'over the 16384 byte limit' in str(error)
+        else:
+            raise AssertionError('expected a ValueError')
+        assert gzip.decompress(base64.b64decode(
+            build_user_data([script_part(BOOTSTRAP)]))).startswith(b'Content-Type')
+
+    def test_helpers_pass_encoded_user_data_through(self):
+        """Test instances use encoded payloads as is and raw scripts get Base64."""
+        user_data = build_user_data([script_part(BOOTSTRAP)])
+        create_ec2_instance(self.stack, 'Web', 'ami-1', 'subnet-1', 'key', user_data=user_data)
+        create_ec2_instance(self.stack, 'Raw', 'ami-1', 'subnet-1', 'key', user_data='echo hi')
+        resources = self.stack.stack.to_dict()['Resources']
+        assert resources['Web']['Properties']['UserData'] == user_data
+        assert resources['Raw']['Properties']['UserData'] == {'Fn::Base64': 'echo hi'}
+
+    def test_store_dedupes_across_launch_configs(self):
+        """Test a shared payload is stored once in a Mapping."""
+        store = UserDataStore(self.stack)
+        shared = build_user_data([script_part(BOOTSTRAP)])
+        for name in ('web', 'worker', 'cron'):
+            create_launch_config(self.stack, name, 'ami-1', [], 't3.micro', 'profile',
+                                 user_data=store.add(shared))
+        template = self.stack.stack.to_dict()
+        payloads = template['Mappings']['UserData']['Payloads']
+        assert list(payloads.values()) == [shared]
+        key = list(payloads)[0]
+        assert template['Resources']['testwebLC']['Properties']['UserData'] == {
+            'Fn::FindInMap': ['UserData', 'Payloads', key]}
@@ -3,3 +3,5 @@
 tropohelper is for creating cloudformation stacks from
 DRY manageable python.
 """
+
+__version__ = '1.4.0'
@@ -0,0 +1,239 @@
+"""CloudFormation properties and resources newer than the pinned troposphere.
+
+Each class mirrors the upstream troposphere definition so it can be dropped
+once the troposphere pin is raised.
+"""
+import troposphere.awslambda as awslambda
+import troposphere.cloudfront as cloudfront
+import troposphere.ec2 as ec2
+import troposphere.elasticloadbalancingv2 as alb
+from troposphere import AWSObject, AWSProperty
+from troposphere.validators import boolean, double, exactly_one, integer
+
+
+class HostHeaderConfig(AWSProperty):
+    props = {
+        'Values': ([str], False),
+    }
+
+
+class PathPatternConfig(AWSProperty):
+    props = {
+        'Values': ([str], False),
+    }
+
+
+class Condition(alb.Condition):
+    props = {
+        'Field': (str, False),
+        'HostHeaderConfig': (HostHeaderConfig, False),
+        'PathPatternConfig': (PathPatternConfig, False),
+        'Values': ([str], False),
+    }
+
+
+class Route(ec2.Route):
+    props = dict(ec2.Route.props, TransitGatewayId=(str, False))
+
+    def validate(self):
+        exactly_one(self.__class__.__name__, self.properties,
+                    ['DestinationCidrBlock', 'DestinationIpv6CidrBlock'])
+        exactly_one(self.__class__.__name__, self.properties, [
+            'EgressOnlyInternetGatewayId', 'GatewayId', 'InstanceId',
+            'NatGatewayId', 'NetworkInterfaceId', 'TransitGatewayId',
+            'VpcPeeringConnectionId'
+        ])
+
+
+class CacheCookiesConfig(AWSProperty):
+    props = {
+        'CookieBehavior': (str, True),
+        'Cookies': ([str], False),
+    }
+
+
+class CacheHeadersConfig(AWSProperty):
+    props = {
+        'HeaderBehavior': (str, True),
+        'Headers': ([str], False),
+    }
+
+
+class CacheQueryStringsConfig(AWSProperty):
+    props = {
+        'QueryStringBehavior': (str, True),
+        'QueryStrings': ([str], False),
+    }
+
+
+class ParametersInCacheKeyAndForwardedToOrigin(AWSProperty):
+    props = {
+        'CookiesConfig': (CacheCookiesConfig, True),
+        'EnableAcceptEncodingBrotli': (boolean, False),
+        'EnableAcceptEncodingGzip': (boolean, True),
+        'HeadersConfig': (CacheHeadersConfig, True),
+        'QueryStringsConfig': (CacheQueryStringsConfig, True),
+    }
+
+
+class CachePolicyConfig(AWSProperty):
+    props = {
+        'Comment': (str, False),
+        'DefaultTTL': (double, True),
+        'MaxTTL': (double, True),
+        'MinTTL': (double, True),
+        'Name': (str, True),
+        'ParametersInCacheKeyAndForwardedToOrigin':
+        (ParametersInCacheKeyAndForwardedToOrigin, True),
+    }
+
+
+class CachePolicy(AWSObject):
+    resource_type = 'AWS::CloudFront::CachePolicy'
+
+    props = {
+        'CachePolicyConfig': (CachePolicyConfig, True),
+    }
+
+
+class OriginRequestCookiesConfig(AWSProperty):
+    props = {
+        'CookieBehavior': (str, True),
+        'Cookies': ([str], False),
+    }
+
+
+class OriginRequestHeadersConfig(AWSProperty):
+    props = {
+        'HeaderBehavior': (str, True),
+        'Headers': ([str], False),
+    }
+
+
+class OriginRequestQueryStringsConfig(AWSProperty):
+    props = {
+        'QueryStringBehavior': (str, True),
+        'QueryStrings': ([str], False),
+    }
+
+
+class OriginRequestPolicyConfig(AWSProperty):
+    props = {
+        'Comment': (str, False),
+        'CookiesConfig': (OriginRequestCookiesConfig, True),
+        'HeadersConfig': (OriginRequestHeadersConfig, True),
+        'Name': (str, True),
+        'QueryStringsConfig': (OriginRequestQueryStringsConfig, True),
+    }
+
+
+class OriginRequestPolicy(AWSObject):
+    resource_type = 'AWS::CloudFront::OriginRequestPolicy'
+
+    props = {
+        'OriginRequestPolicyConfig': (OriginRequestPolicyConfig, True),
+    }
+
+
+class OriginShield(AWSProperty):
+    props = {
+        'Enabled': (boolean, False),
+        'OriginShieldRegion': (str, False),
+    }
+
+
+class Origin(cloudfront.Origin):
+    props = dict(cloudfront.Origin.props, OriginShield=(OriginShield, False))
+
+
+class CacheBehavior(cloudfront.CacheBehavior):
+    props = dict(cloudfront.CacheBehavior.props,
+                 CachePolicyId=(str, False),
+                 ForwardedValues=(cloudfront.ForwardedValues, False),
+                 OriginRequestPolicyId=(str, False))
+
+
+class DefaultCacheBehavior(cloudfront.DefaultCacheBehavior):
+    props = dict(cloudfront.DefaultCacheBehavior.props,
+                 CachePolicyId=(str, False),
+                 ForwardedValues=(cloudfront.ForwardedValues, False),
+                 OriginRequestPolicyId=(str, False))
+
+
+class AuthFormat(AWSProperty):
+    props = {
+        'AuthScheme': (str, False),
+        'Description': (str, False),
+        'IAMAuth': (str, False),
+        'SecretArn': (str, False),
+        'UserName': (str, False),
+    }
+
+
+class TagFormat(AWSProperty):
+    props = {
+        'Key': (str, False),
+        'Value': (str, False),
+    }
+
+
+class DBProxy(AWSObject):
+    resource_type = 'AWS::RDS::DBProxy'
+
+    props = {
+        'Auth': ([AuthFormat], True),
+        'DBProxyName': (str, True),
+        'DebugLogging': (boolean, False),
+        'EngineFamily': (str, True),
+        'IdleClientTimeout': (integer, False),
+        'RequireTLS': (boolean, False),
+        'RoleArn': (str, True),
+        'Tags': ([TagFormat], False),
+        'VpcSecurityGroupIds': ([str], False),
+        'VpcSubnetIds': ([str], True),
+    }
+
+
+class ConnectionPoolConfigurationInfoFormat(AWSProperty):
+    props = {
+        'ConnectionBorrowTimeout': (integer, False),
+        'InitQuery': (str, False),
+        'MaxConnectionsPercent': (integer, False),
+        'MaxIdleConnectionsPercent': (integer, False),
+        'SessionPinningFilters': ([str], False),
+    }
+
+
+class DBProxyTargetGroup(AWSObject):
+    resource_type = 'AWS::RDS::DBProxyTargetGroup'
+
+    props = {
+        'ConnectionPoolConfigurationInfo':
+        (ConnectionPoolConfigurationInfoFormat, False),
+        'DBClusterIdentifiers': ([str], False),
+        'DBInstanceIdentifiers': ([str], False),
+        'DBProxyName': (str, True),
+        'TargetGroupName': (str, True),
+    }
+
+
+class OnFailure(AWSProperty):
+    props = {
+        'Destination': (str, False),
+    }
+
+
+class DestinationConfig(AWSProperty):
+    props = {
+        'OnFailure': (OnFailure, True),
+    }
+
+
+class EventSourceMapping(awslambda.EventSourceMapping):
+    props = dict(awslambda.EventSourceMapping.props,
+                 BisectBatchOnFunctionError=(boolean, False),
+                 DestinationConfig=(DestinationConfig, False),
+                 MaximumBatchingWindowInSeconds=(integer, False),
+                 MaximumRecordAgeInSeconds=(integer, False),
+                 MaximumRetryAttempts=(integer, False),
+                 ParallelizationFactor=(integer, False))
@@ -0,0 +1,94 @@
+"""Instance type catalog for EC2, RDS and ElastiCache.
+
+The bundled data/instance_types.json lists vCPUs, memory (GiB), peak network
+bandwidth (Gbps) and peak EBS throughput (Mbps) per type. It is loaded on
+first use and indexed by name and, per kind, by vCPU count.
+"""
+import bisect
+import json
+import pkgutil
+from collections import namedtuple
+
+KINDS = ('ec2', 'db', 'cache')
+
+InstanceType = namedtuple(
+    'InstanceType', ['name', 'kind', 'family', 'vcpu', 'memory', 'network',
+                     'ebs'])
+
+_catalog = None
+
+
+def _load():
+    """Load and index the bundled catalog once."""
+    global _catalog
+
+    if _catalog is None:
+        data = json.loads(
+            pkgutil.get_data('tropohelper',
+                             'data/instance_types.json').decode('utf-8'))
+        by_name = {}
+        by_kind = {}
+
+        for kind in KINDS:
+            types = []
+
+            for name, values in data[kind].items():
+                family = name.rsplit('.', 1)[0]
+                instance = InstanceType(name, kind, family,
+                                        *values[:len(data['fields'])])
+                by_name[name] = instance
+                types.append(instance)
+            by_vcpu = sorted(
+                types,
+                key=lambda i: (i.vcpu, i.memory, i.network, i.ebs, i.name))
+            by_kind[kind] = {
+                'ordered': types,
+                'by_vcpu': by_vcpu,
+                'vcpus': [instance.vcpu for instance in by_vcpu]
+            }
+        _catalog = {'by_name': by_name, 'by_kind': by_kind}
+
+    return _catalog
+
+
+def get_instance_type(name):
+    """Return the InstanceType for name, raising KeyError if unknown."""
+
+    return _load()['by_name'][name]
+
+
+def instance_types(kind='ec2', families=None):
+    """Return type names of kind in catalog order, optionally by family.
+
+    families holds family names such as 'm7g' or 'db.r7g'.
+    """
+    types = _load()['by_kind'][kind]['ordered']
+
+    return [
+        instance.name for instance in types
+
+        if families is None or instance.family in families
+    ]
+
+
+def recommend_instance_type(vcpu=0,
+                            memory=0,
+                            network=0,
+                            ebs=0,
+                            kind='ec2',
+                            families=None):
+    """Return the smallest InstanceType meeting every requirement.
+
+    Smallest means fewest vCPUs, then least memory, network and EBS
+    throughput. Returns None if nothing in the catalog is big enough.
+    """
+    index = _load()['by_kind'][kind]
+
+    for instance in index['by_vcpu'][bisect.bisect_left(index['vcpus'],
+                                                        vcpu):]:
+        if (instance.memory >= memory and instance.network >= network
+                and instance.ebs >= ebs
+                and (families is None or instance.family in families)):
+            return instance
+
+    return None
@@ -0,0 +1,250 @@
+"""Change-set minimizer for re-rendered templates.
+
+compare() diffs a previous render with a new one and classifies each
+resource change the way CloudFormation applies it: no-interrupt,
+some-interrupt or replacement. Behaviours come from the bundled
+data/update_behavior.json. Properties it does not list update without
+interruption, and resource types it does not list are assumed to need
+some interruption.
+
+Helpers derive logical IDs and physical names from stack.env and their
+name arguments, so small changes to them replace resources. minimize()
+rewrites the new render to keep the previous logical IDs and physical
+names, so CloudFormation updates those resources in place instead.
+"""
+import json
+import pkgutil
+
+from tropohelper.context import template_dict
+from tropohelper.fragments import rename_references
+from tropohelper.render import HASH_KEY, canonicalize
+
+NO_INTERRUPT = 'no-interrupt'
+SOME_INTERRUPT = 'some-interrupt'
+REPLACEMENT = 'replacement'
+BEHAVIORS = (NO_INTERRUPT, SOME_INTERRUPT, REPLACEMENT)
+
+_spec = None
+
+
+def _load():
+    """Load the bundled update behaviour spec once."""
+    global _spec
+
+    if _spec is None:
+        _spec = json.loads(
+            pkgutil.get_data('tropohelper',
+                             'data/update_behavior.json').decode('utf-8'))
+
+    return _spec
+
+
+def update_behavior(resource_type, prop):
+    """Return how CloudFormation applies a change to prop."""
+    properties = _load()['properties']
+
+    if resource_type not in properties:
+        return SOME_INTERRUPT
+    behaviors = properties[resource_type]
+
+    return behaviors.get(prop, behaviors.get('*', NO_INTERRUPT))
+
+
+def physical_name_property(resource_type):
+    """Return the property naming resources of this type, if any."""
+
+    return _load()['physical_names'].get(resource_type)
+
+
+def _prepare(source):
+    """Return a canonical copy of a render, without content hashes."""
+    template = canonicalize(json.loads(json.dumps(template_dict(source))))
+
+    for resource in template.get('Resources', {}).values():
+        metadata = resource.get('Metadata')
+
+        if isinstance(metadata, dict):
+            metadata.pop(HASH_KEY, None)
+
+            if not metadata:
+                del resource['Metadata']
+
+    return template
+
+
+def _classify(name, old, new):
+    """Return the change dict for one resource present in both renders."""
+    change = {
+        'logical_id': name,
+        'type': new.get('Type'),
+        'action': 'modify',
+        'properties': {},
+        'attributes': []
+    }
+
+    if old.get('Type') != new.get('Type'):
+        change['behavior'] = REPLACEMENT
+
+        return change
+    old_props = old.get('Properties', {})
+    new_props = new.get('Properties', {})
+
+    for prop in set(old_props) | set(new_props):
+        if old_props.get(prop) != new_props.get(prop):
+            change['properties'][prop] = update_behavior(
+                change['type'], prop)
+    change['attributes'] = sorted(
+        key for key in set(old) | set(new)
+
+        if key not in ('Type', 'Properties') and old.get(key) != new.get(key))
+
+    if not change['properties'] and not change['attributes']:
+        return None
+    change['behavior'] = max(
+        change['properties'].values() or [NO_INTERRUPT], key=BEHAVIORS.index)
+
+    return change
+
+
+def compare(old, new):
+    """Classify the resource changes from the old render to the new one.
+
+    old and new are stacks, Templates, rendered dicts or JSON text, so a
+    previous render can be passed straight from its artifact. Returns change
+    dicts sorted by logical ID with logical_id, type, action ('add',
+    'remove' or 'modify'), behavior, properties ({property: behavior}) and
+    attributes (changed DependsOn, Metadata, ...). Added and removed
+    resources have a behavior of None; a renamed logical ID shows up as one
+    of each, which CloudFormation applies as a replacement.
+    """
+    old = _prepare(old).get('Resources', {})
+    new = _prepare(new).get('Resources', {})
+    changes = []
+
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            body = new.get(name) or old.get(name)
+            changes.append({
+                'logical_id': name,
+                'type': body.get('Type'),
+                'action': 'add' if name in new else 'remove',
+                'behavior': None,
+                'properties': {},
+                'attributes': []
+            })
+            continue
+        change = _classify(name, old[name], new[name])
+
+        if change is not None:
+            changes.append(change)
+
+    return changes
+
+
+def _match_key(body, mapping):
+    """Key comparing a resource by type and properties, minus its name."""
+
+    if mapping:
+        body = rename_references(body, mapping)
+    props = dict(body.get('Properties', {}))
+    props.pop(physical_name_property(body.get('Type')), None)
+
+    return json.dumps([body.get('Type'), props], sort_keys=True)
+
+
+def _match_logical_ids(old, new):
+    """Pair renamed resources, returning {new logical ID: old logical ID}.
+
+    A removed and an added resource match when their type and properties
+    are equal apart from the physical name, after references to resources
+    already paired are renamed. Matching repeats until nothing new pairs
+    up, so renames cascade through Refs. Ambiguous matches are left alone.
+    """
+    mapping = {}
+
+    while True:
+        by_key = {}
+
+        for name in old:
+            if name not in new and name not in mapping.values():
+                by_key.setdefault(_match_key(old[name], None),
+                                  ([], []))[0].append(name)
+
+        for name in new:
+            if name not in old and name not in mapping:
+                by_key.setdefault(_match_key(new[name], mapping),
+                                  ([], []))[1].append(name)
+        found = False
+
+        for old_names, new_names in by_key.values():
+            if len(old_names) == 1 and len(new_names) == 1:
+                mapping[new_names[0]] = old_names[0]
+                found = True
+
+        if not found:
+            return mapping
+
+
+def minimize(old, new, keep_logical_ids=True, keep_names=True):
+    """Rewrite the new render to avoid needless replacements.
+
+    With keep_logical_ids, resources that were only renamed get their old
+    logical ID back, and references to them follow. With keep_names, a
+    physical name change that would replace a resource is reverted to the
+    old name.
+
+    Returns {'template': ..., 'logical_ids': {new: old}, 'names': [...],
+    'changes': [...]}, where template is the rewritten canonical dict and
+    changes is what compare() reports for it.
+    """
+    old = _prepare(old)
+    template = _prepare(new)
+    old_resources = old.get('Resources', {})
+    logical_ids = {}
+    names = []
+
+    if keep_logical_ids:
+        logical_ids = _match_logical_ids(old_resources,
+                                         template.get('Resources', {}))
+
+    if logical_ids:
+        for section in ('Resources', 'Outputs', 'Conditions'):
+            if section in template:
+                template[section] = rename_references(template[section],
+                                                       logical_ids)
+        template['Resources'] = dict(
+            (logical_ids.get(name, name), body)
+            for name, body in template['Resources'].items())
+
+    if keep_names:
+        for name, body in sorted(template.get('Resources', {}).items()):
+            previous = old_resources.get(name)
+            prop = physical_name_property(body.get('Type'))
+
+            if previous is None or prop is None or \
+                    previous.get('Type') != body.get('Type') or \
+                    update_behavior(body['Type'], prop) != REPLACEMENT:
+                continue
+            old_props = previous.get('Properties', {})
+            new_props = body.setdefault('Properties', {})
+
+            if old_props.get(prop) == new_props.get(prop):
+                continue
+            names.append({
+                'logical_id': name,
+                'property': prop,
+                'old': old_props.get(prop),
+                'new': new_props.get(prop)
+            })
+
+            if prop in old_props:
+                new_props[prop] = old_props[prop]
+            else:
+                del new_props[prop]
+
+    return {
+        'template': template,
+        'logical_ids': logical_ids,
+        'names': names,
+        'changes': compare(old, template)
+    }
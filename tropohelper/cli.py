@@ -0,0 +1,427 @@
+"""tropohelper command line: incremental, parallel stack builds.
+
+    tropohelper build stacks/*.py --config config/common.json
+    tropohelper build --manifest stacks.json --jobs 8 --json
+    tropohelper build --manifest stacks.json --registry exports.json
+
+A build script prints its template's JSON to stdout. Each template's
+inputs (the script, the local modules it imports, its config files, its
+arguments and the tropohelper and troposphere versions) are hashed into a
+cache file; a stack whose inputs are unchanged and whose template is still
+on disk is not rebuilt. The report gives each stack's status and build
+time and the cache hit rate.
+
+With an export registry (see tropohelper.exports), the digests of the
+exports a stack imports are inputs too, so a consumer is rebuilt when its
+producer's exports change. Stacks build in waves, producers before their
+consumers, each wave in parallel; a stack whose producer failed is not
+built. A manifest names each stack's script, configs, arguments and the
+stacks it depends on besides its registry imports, relative to the
+manifest:
+
+    {"stacks": {"web": {"script": "web.py", "configs": ["web.json"],
+                        "args": ["--env", "prod"],
+                        "depends": ["network"]}}}
+"""
+import argparse
+import ast
+import concurrent.futures
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+import troposphere
+
+import tropohelper
+from tropohelper.exports import ExportRegistry
+
+CACHE_VERSION = 1
+
+StackSpec = namedtuple('StackSpec',
+                       ['name', 'script', 'configs', 'args', 'depends'])
+StackSpec.__new__.__defaults__ = ((), )
+
+
+def _file_digest(path):
+    with open(path, 'rb') as handle:
+        return hashlib.sha256(handle.read()).hexdigest()
+
+
+def _local_modules(script):
+    """Return the modules beside script that it imports, transitively."""
+    root = os.path.dirname(os.path.abspath(script))
+    found = set()
+    queue = [os.path.abspath(script)]
+
+    while queue:
+        with open(queue.pop(), 'rb') as handle:
+            tree = ast.parse(handle.read())
+        names = []
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names.append(node.module)
+                names.extend('{0}.{1}'.format(node.module, alias.name)
+                             for alias in node.names)
+
+        for name in names:
+            base = os.path.join(root, *name.split('.'))
+
+            for path in (base + '.py', os.path.join(base, '__init__.py')):
+                if os.path.isfile(path) and path not in found:
+                    found.add(path)
+                    queue.append(path)
+
+    return sorted(found)
+
+
+def _registry_imports(spec, registry):
+    """Return [stack key, import, current digest] for spec's imports."""
+    imports = []
+
+    for key, entry in sorted(registry.stacks.items()):
+        if entry['name'] != spec.name:
+            continue
+
+        for imported in sorted(entry['imports']):
+            env, role = imported.split('/', 1)
+
+            try:
+                digest = registry.lookup(env, role)['digest']
+            except KeyError:
+                digest = None
+            imports.append([key, imported, digest])
+
+    return imports
+
+
+def input_hash(spec, registry=None):
+    """Return the sha256 of everything a stack's template depends on."""
+    digest = hashlib.sha256()
+    inputs = {
+        'tropohelper': tropohelper.__version__,
+        'troposphere': troposphere.__version__,
+        'script': _file_digest(spec.script),
+        'modules': [[path, _file_digest(path)]
+                    for path in _local_modules(spec.script)],
+        'configs': [[path, _file_digest(path)]
+                    for path in sorted(spec.configs)],
+        'args': list(spec.args),
+        'imports': [] if registry is None else _registry_imports(
+            spec, registry)
+    }
+    digest.update(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def build_order(specs, registry=None):
+    """Return specs in waves, each after the stacks it depends on.
+
+    A stack depends on the stacks in its depends and, with a registry, on
+    the stacks it imports exports from. Raises ValueError on a cycle.
+    """
+    names = set(spec.name for spec in specs)
+    producers = dict((spec.name, set(spec.depends) & names) for spec in specs)
+
+    if registry is not None:
+        for key, keys in registry.dependencies().items():
+            consumer = registry.stacks[key]['name']
+
+            if consumer in producers:
+                producers[consumer].update(
+                    registry.stacks[producer]['name'] for producer in keys
+                    if registry.stacks[producer]['name'] in names)
+    waves = []
+    done = set()
+    remaining = list(specs)
+
+    while remaining:
+        wave = [spec for spec in remaining
+                if producers[spec.name] - {spec.name} <= done]
+
+        if not wave:
+            raise ValueError('Dependency cycle between {0}.'.format(
+                ', '.join(sorted(spec.name for spec in remaining))))
+        waves.append(wave)
+        done.update(spec.name for spec in wave)
+        remaining = [spec for spec in remaining if spec.name not in done]
+
+    return waves, producers
+
+
+def load_manifest(path):
+    """Return the StackSpecs in a manifest file, sorted by name."""
+    root = os.path.dirname(os.path.abspath(path))
+
+    with open(path) as handle:
+        stacks = json.load(handle)['stacks']
+
+    return [
+        StackSpec(name, os.path.join(root, entry['script']),
+                  [os.path.join(root, config)
+                   for config in entry.get('configs', [])],
+                  list(entry.get('args', [])),
+                  tuple(entry.get('depends', ())))
+
+        for name, entry in sorted(stacks.items())
+    ]
+
+
+def _load_cache(path):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as handle:
+        data = json.load(handle)
+
+    return data['stacks'] if data.get('version') == CACHE_VERSION else {}
+
+
+def _save_cache(path, stacks):
+    temporary = '{0}.tmp'.format(path)
+
+    with open(temporary, 'w') as handle:
+        data = {'version': CACHE_VERSION, 'stacks': stacks}
+        json.dump(data, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+    os.replace(temporary, path)
+
+
+def _build(spec, output, python):
+    """Run one build script and write its template; returns the digest."""
+    result = subprocess.run([python, spec.script] + spec.args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()
+                           or 'exited with {0}'.format(result.returncode))
+
+    try:
+        json.loads(result.stdout.decode('utf-8'))
+    except ValueError as error:
+        raise RuntimeError('did not print a JSON template: {0}'.format(error))
+
+    with open(output, 'wb') as handle:
+        handle.write(result.stdout)
+
+    return hashlib.sha256(result.stdout).hexdigest()
+
+
+def _result(spec, status, output, seconds=0.0, error=None):
+    return {
+        'name': spec.name,
+        'status': status,
+        'output': output,
+        'seconds': seconds,
+        'error': error
+    }
+
+
+def build(specs,
+          out_dir='build',
+          cache_path=None,
+          jobs=None,
+          force=False,
+          python=sys.executable,
+          registry_path=None):
+    """Build the stacks whose inputs changed, in up to jobs processes.
+
+    cache_path defaults to .tropohelper-cache.json in out_dir. With
+    registry_path, the export registry is read again before each wave, so
+    consumers see what their producers just published. Returns
+    {'stacks': [...], 'hits', 'built', 'failed', 'hit_rate', 'seconds'};
+    each stack entry has its name, status ('cached', 'built' or
+    'failed'), output path, seconds and error.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cache_path = cache_path or os.path.join(out_dir, '.tropohelper-cache.json')
+    cache = _load_cache(cache_path)
+    start = time.perf_counter()
+    results = {}
+
+    def registry():
+        return None if registry_path is None else ExportRegistry(
+            registry_path)
+
+    def run(spec, output):
+        began = time.perf_counter()
+
+        try:
+            return _build(spec, output, python), None, \
+                time.perf_counter() - began
+        except Exception as error:
+            return None, str(error), time.perf_counter() - began
+
+    def fail(spec, output, error, seconds=0.0):
+        cache.pop(spec.name, None)
+        results[spec.name] = _result(spec, 'failed', output, seconds, error)
+
+    waves, producers = build_order(specs, registry())
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=jobs or os.cpu_count() or 1) as executor:
+            for wave in waves:
+                current = registry()
+                pending = []
+
+                for spec in wave:
+                    output = os.path.join(out_dir,
+                                          '{0}.json'.format(spec.name))
+                    failed = sorted(name for name in producers[spec.name]
+                                    if results.get(name, {}).get('status') ==
+                                    'failed')
+
+                    if failed:
+                        fail(spec, output, 'depends on failed {0}'.format(
+                            ', '.join(failed)))
+
+                        continue
+
+                    try:
+                        digest = input_hash(spec, current)
+                    except Exception as error:
+                        fail(spec, output, str(error))
+
+                        continue
+                    entry = cache.get(spec.name, {})
+
+                    if not force and entry.get('inputs') == digest and \
+                            os.path.exists(output) and \
+                            _file_digest(output) == entry.get('output'):
+                        results[spec.name] = _result(spec, 'cached', output)
+                    else:
+                        pending.append((spec, output, digest,
+                                        executor.submit(run, spec, output)))
+
+                for spec, output, digest, future in pending:
+                    output_digest, error, seconds = future.result()
+
+                    if not error and registry_path is not None:
+                        # The build just recorded this stack's imports,
+                        # which are part of its inputs from now on.
+                        try:
+                            digest = input_hash(spec, registry())
+                        except Exception as hash_error:
+                            error = str(hash_error)
+
+                    if error:
+                        fail(spec, output, error, seconds)
+
+                        continue
+                    results[spec.name] = _result(spec, 'built', output,
+                                                 seconds)
+                    cache[spec.name] = {
+                        'inputs': digest,
+                        'output': output_digest,
+                        'seconds': seconds
+                    }
+    finally:
+        _save_cache(cache_path, cache)
+    stacks = [results[spec.name] for spec in specs]
+    counts = dict((status, sum(1 for stack in stacks
+                               if stack['status'] == status))
+                  for status in ('cached', 'built', 'failed'))
+
+    return {
+        'stacks': stacks,
+        'hits': counts['cached'],
+        'built': counts['built'],
+        'failed': counts['failed'],
+        'hit_rate': counts['cached'] / len(stacks) if stacks else 0.0,
+        'seconds': time.perf_counter() - start
+    }
+
+
+def format_report(report):
+    """Return a build report as a plain text table."""
+    width = max([len(stack['name']) for stack in report['stacks']] + [5])
+    lines = ['{0:<{1}}  {2:<6}  {3:>8}'.format('stack', width, 'status',
+                                               'seconds')]
+
+    for stack in report['stacks']:
+        lines.append('{0:<{1}}  {2:<6}  {3:>8.2f}'.format(
+            stack['name'], width, stack['status'], stack['seconds']))
+
+        if stack['error']:
+            lines.append('    {0}'.format(stack['error']))
+    lines.append(
+        '{0} stacks: {1} cached, {2} built, {3} failed; hit rate {4:.0%}; '
+        '{5:.2f}s'.format(len(report['stacks']), report['hits'],
+                          report['built'], report['failed'],
+                          report['hit_rate'], report['seconds']))
+
+    return '\n'.join(lines)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='tropohelper')
+    parser.add_argument('--version', action='version',
+                        version='tropohelper {0}'.format(
+                            tropohelper.__version__))
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    build_parser = commands.add_parser(
+        'build', help='build the templates whose inputs changed')
+    build_parser.add_argument('scripts', nargs='*',
+                              help='build scripts, named by file name')
+    build_parser.add_argument('--manifest',
+                              help='JSON manifest of stacks to build')
+    build_parser.add_argument('--config', action='append', default=[],
+                              help='config file every script reads')
+    build_parser.add_argument('--out-dir', default='build')
+    build_parser.add_argument('--cache', help='cache file path')
+    build_parser.add_argument('--registry',
+                              help='export registry the scripts publish to')
+    build_parser.add_argument('--jobs', type=int,
+                              help='parallel builds, default CPU count')
+    build_parser.add_argument('--force', action='store_true',
+                              help='rebuild even if inputs are unchanged')
+    build_parser.add_argument('--json', action='store_true',
+                              help='print the report as JSON')
+
+    return parser
+
+
+def main(argv=None):
+    """Entry point for the tropohelper console script."""
+    options = _parser().parse_args(argv)
+    specs = load_manifest(options.manifest) if options.manifest else []
+
+    for script in options.scripts:
+        name = os.path.splitext(os.path.basename(script))[0]
+        specs.append(StackSpec(name, script, list(options.config), [], ()))
+
+    for spec in specs:
+        spec.configs.extend(config for config in options.config
+                            if config not in spec.configs)
+    names = [spec.name for spec in specs]
+
+    if not specs or len(set(names)) != len(names):
+        sys.stderr.write('tropohelper: give scripts or a manifest with '
+                         'unique stack names.\n')
+
+        return 2
+    try:
+        report = build(specs, options.out_dir, options.cache, options.jobs,
+                       options.force, registry_path=options.registry)
+    except ValueError as error:
+        sys.stderr.write('tropohelper: {0}\n'.format(error))
+
+        return 2
+    print(json.dumps(report, indent=2, sort_keys=True)
+          if options.json else format_report(report))
+
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
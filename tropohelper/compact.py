@@ -0,0 +1,302 @@
+"""Template compaction before upload.
+
+compact() shrinks a rendered template to the same resource settings:
+
+* resource properties equal to their CloudFormation default, listed in
+  data/property_defaults.json, are dropped, as is the 0.0.0.0/0 egress
+  rule every security group gets anyway;
+* empty lists and dicts, such as Targets=[] or Certificates=[], are
+  dropped;
+* string literals repeated often enough to pay for it are hoisted into a
+  Mapping and read back with Fn::FindInMap;
+* the result is minified.
+
+Mappings only hold strings, so repeated blocks such as
+CloudWatchLoggingOptions shrink through their repeated literals rather
+than as a whole.
+
+Defaults are matched on their canonical form, so True and 'true' both
+match a "true" default, but the template is otherwise left as written:
+parameters, mappings and conditions are never rewritten.
+
+CloudFormation compares templates, not settings, so deploying a
+compacted template over an uncompacted one still updates every resource
+that lost a property. Properties whose update replaces the resource, per
+data/update_behavior.json, are therefore never dropped, even when they
+hold the default; changeset.compare() shows what remains.
+
+compact() runs two separate checks on its result. Expanding it again,
+inlining the hoisted literals and putting every recorded removal back,
+must give the original template exactly; that shows nothing was lost or
+rewritten, not that the removals were safe. Separately, every removed
+value must be an empty collection or the documented default of its
+resource type and property; that is only as right as
+property_defaults.json.
+"""
+import json
+import pkgutil
+
+from troposphere import MAX_MAPPINGS
+
+from tropohelper.changeset import REPLACEMENT, update_behavior
+from tropohelper.context import template_dict
+from tropohelper.parameters import MAX_MAPPING_ATTRIBUTES
+from tropohelper.render import canonicalize, dumps
+
+_defaults = None
+
+
+def _load():
+    """Load the bundled property defaults once."""
+    global _defaults
+
+    if _defaults is None:
+        _defaults = json.loads(
+            pkgutil.get_data('tropohelper',
+                             'data/property_defaults.json').decode('utf-8'))
+
+    return _defaults
+
+
+def _is_function(value):
+    return isinstance(value, dict) and len(value) == 1 and (
+        'Ref' in value or 'Condition' in value
+        or list(value)[0].startswith('Fn::'))
+
+
+def _is_empty(value):
+    """Whether value is an empty collection, or a dict of only those."""
+
+    if isinstance(value, list):
+        return not value
+
+    if isinstance(value, dict) and not _is_function(value):
+        return all(_is_empty(child) for child in value.values())
+
+    return False
+
+
+def _prune(value, path, removed):
+    """Drop empty collections under value, recording each removal."""
+
+    if not isinstance(value, dict) or _is_function(value):
+        return
+
+    for key in sorted(value):
+        if _is_empty(value[key]):
+            removed.append({'path': path + [key], 'value': value.pop(key)})
+        else:
+            _prune(value[key], path + [key], removed)
+
+
+def _is_default(resource_type, key, value):
+    """Whether value, once canonical, is the documented default of key.
+
+    Properties that replace the resource when changed never count, as
+    dropping them would replace it on the next deploy.
+    """
+    defaults = _load().get(resource_type, {})
+
+    if key not in defaults or \
+            update_behavior(resource_type, key) == REPLACEMENT:
+        return False
+    canonical = canonicalize({'Resources': {'Resource': {
+        'Type': resource_type, 'Properties': {key: value}}}})
+
+    return canonical['Resources']['Resource']['Properties'][key] == \
+        defaults[key]
+
+
+def _strip(template, removed):
+    """Remove default and empty properties from every resource."""
+    defaults = _load()
+
+    for name, resource in sorted(template.get('Resources', {}).items()):
+        properties = resource.get('Properties')
+
+        if not isinstance(properties, dict):
+            continue
+        path = ['Resources', name, 'Properties']
+        resource_type = resource.get('Type')
+
+        for key in sorted(defaults.get(resource_type, {})):
+            if key in properties and _is_default(resource_type, key,
+                                                 properties[key]):
+                removed.append({'path': path + [key],
+                                'value': properties.pop(key)})
+        _prune(properties, path, removed)
+
+
+def _check_removed(template, removed):
+    """Raise unless each removal is empty or a documented default."""
+
+    for entry in removed:
+        path = entry['path']
+
+        if _is_empty(entry['value']):
+            continue
+        resource = template['Resources'][path[1]]
+
+        if len(path) != 4 or not _is_default(resource.get('Type'), path[3],
+                                             entry['value']):
+            raise ValueError('Removed {0} is not a documented default.'
+                             .format('.'.join(path)))
+
+
+def _literals(value, counts):
+    """Count the string literals outside intrinsic functions."""
+
+    if isinstance(value, str):
+        counts[value] = counts.get(value, 0) + 1
+    elif isinstance(value, list):
+        for child in value:
+            _literals(child, counts)
+    elif isinstance(value, dict) and not _is_function(value):
+        for child in value.values():
+            _literals(child, counts)
+
+
+def _replace(value, lookups):
+    if isinstance(value, str):
+        return lookups.get(value, value)
+
+    if isinstance(value, list):
+        return [_replace(child, lookups) for child in value]
+
+    if isinstance(value, dict) and not _is_function(value):
+        return dict((key, _replace(child, lookups))
+                    for key, child in value.items())
+
+    return value
+
+
+def _hoist(template, mapping_name, min_count):
+    """Move repeated property literals into a Mapping; return them."""
+    mappings = template.get('Mappings', {})
+
+    if mapping_name in mappings:
+        raise ValueError('Template already has a {0} mapping.'.format(
+            mapping_name))
+
+    if len(mappings) >= MAX_MAPPINGS:
+        return {}
+    counts = {}
+
+    for resource in template.get('Resources', {}).values():
+        _literals(resource.get('Properties', {}), counts)
+    lookup_size = len(dumps({'Fn::FindInMap': [mapping_name, 'Strings',
+                                               'S000']}))
+    candidates = []
+
+    for literal, count in counts.items():
+        size = len(dumps(literal))
+        # Each use becomes a lookup; the literal is stored once as "S000":.
+        saved = count * (size - lookup_size) - (size + 8)
+
+        if count >= min_count and saved > 0:
+            candidates.append((-saved, literal))
+    candidates = sorted(candidates)[:MAX_MAPPING_ATTRIBUTES]
+
+    if sum(-saved for saved, _ in candidates) <= len(
+            dumps({mapping_name: {'Strings': {}}})):
+        return {}
+    chosen = [literal for _, literal in candidates]
+    strings = dict(('S{0}'.format(index), literal)
+                   for index, literal in enumerate(chosen))
+    lookups = dict((literal, {'Fn::FindInMap': [mapping_name, 'Strings', key]})
+                   for key, literal in strings.items())
+
+    for resource in template.get('Resources', {}).values():
+        if 'Properties' in resource:
+            resource['Properties'] = _replace(resource['Properties'], lookups)
+    template.setdefault('Mappings', {})[mapping_name] = {'Strings': strings}
+
+    return strings
+
+
+def _inline(value, strings, mapping_name):
+    if isinstance(value, list):
+        return [_inline(child, strings, mapping_name) for child in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if list(value) == ['Fn::FindInMap'] and \
+            value['Fn::FindInMap'][:2] == [mapping_name, 'Strings']:
+        return strings[value['Fn::FindInMap'][2]]
+
+    return dict((key, _inline(child, strings, mapping_name))
+                for key, child in value.items())
+
+
+def expand(source, removed=(), mapping_name='Compacted'):
+    """Undo compact(): inline hoisted literals and restore removed values.
+
+    removed is the list compact() reports.
+    """
+    template = json.loads(json.dumps(template_dict(source)))
+    mappings = template.get('Mappings', {})
+    strings = mappings.pop(mapping_name, {}).get('Strings', {})
+
+    if not mappings:
+        template.pop('Mappings', None)
+
+    for resource in template.get('Resources', {}).values():
+        if 'Properties' in resource:
+            resource['Properties'] = _inline(resource['Properties'], strings,
+                                             mapping_name)
+
+    for entry in removed:
+        parent = template
+
+        for key in entry['path'][:-1]:
+            parent = parent.setdefault(key, {})
+        parent[entry['path'][-1]] = entry['value']
+
+    return template
+
+
+def compact(source, mapping_name='Compacted', min_count=2):
+    """Compact a stack, Template, template dict or JSON text.
+
+    Literals used at least min_count times are considered for hoisting
+    into the mapping_name Mapping. Returns {'template', 'text',
+    'original_bytes', 'compacted_bytes', 'saved_bytes', 'removed',
+    'hoisted'}: text is the minified template, removed lists the path and
+    value of every dropped property and hoisted maps Mapping keys to their
+    literals. original_bytes is the size of the JSON text given, or of
+    troposphere's to_json() output otherwise.
+
+    Raises ValueError if expanding the result does not give back the
+    original template exactly, or if a removed value is neither empty nor
+    a documented default that can change without replacement.
+    """
+
+    if isinstance(source, str):
+        original_bytes = len(source.encode('utf-8'))
+    else:
+        original_bytes = len(
+            json.dumps(template_dict(source), indent=4, sort_keys=True,
+                       separators=(',', ': ')).encode('utf-8'))
+    original = json.loads(json.dumps(template_dict(source)))
+    template = json.loads(json.dumps(original))
+    removed = []
+    _strip(template, removed)
+    hoisted = _hoist(template, mapping_name, min_count)
+
+    if expand(template, removed, mapping_name) != original:
+        raise ValueError('Compacted template does not expand back to the '
+                         'original.')
+    _check_removed(original, removed)
+    text = dumps(template)
+    compacted_bytes = len(text.encode('utf-8'))
+
+    return {
+        'template': template,
+        'text': text,
+        'original_bytes': original_bytes,
+        'compacted_bytes': compacted_bytes,
+        'saved_bytes': original_bytes - compacted_bytes,
+        'removed': removed,
+        'hoisted': hoisted
+    }
@@ -0,0 +1,363 @@
+"""Condition builders and a static condition evaluator.
+
+create_alb, create_alb_listener, create_alb_cert, create_alb_listener_rule
+and create_or_update_dns_record take a condition_field naming a template
+condition, and create_bool_param adds YES/NO switches. The builders here
+add the conditions themselves:
+
+    condition_field = create_bool_condition(stack, 'Alb')
+
+When parameter values are known at build time, evaluate_conditions()
+decides the conditions they settle, and prune() removes the resources,
+outputs, Fn::If branches, conditions and parameters that can no longer
+matter, so each environment deploys a smaller template.
+"""
+import json
+
+from troposphere import And, Condition, Equals, Not, Or, Ref, encode_to_dict
+
+from tropohelper.context import template_dict
+from tropohelper.fragments import collect_references
+from tropohelper.parameters import create_bool_param
+from tropohelper.profiling import profiled
+
+_UNKNOWN = object()
+_NO_VALUE = object()
+
+
+@profiled
+def create_condition(stack, name, condition):
+    """Add a named condition and return its name for condition_field.
+
+    Adding an identical condition twice is a no-op; a different one under
+    the same name raises ValueError.
+    """
+    existing = stack.stack.conditions.get(name)
+
+    if existing is not None:
+        if encode_to_dict(existing) != encode_to_dict(condition):
+            raise ValueError(
+                'Condition {0} already exists with another definition.'.format(
+                    name))
+
+        return name
+
+    return stack.stack.add_condition(name, condition)
+
+
+@profiled
+def create_bool_condition(stack, name, parameter=None):
+    """Add a '{name}Enabled' condition, true when a YES/NO switch is YES.
+
+    parameter defaults to create_bool_param(stack, name).
+    """
+
+    if parameter is None:
+        parameter = create_bool_param(stack, name)
+
+    return create_condition(stack, '{0}Enabled'.format(name),
+                            Equals(Ref(parameter), 'YES'))
+
+
+@profiled
+def create_combined_condition(stack, name, conditions, operator='and'):
+    """Add a condition combining named conditions with 'and', 'or' or 'not'.
+
+    'not' takes exactly one condition, 'and' and 'or' at least two.
+    """
+    terms = [Condition(condition) for condition in conditions]
+
+    if operator == 'not':
+        if len(terms) != 1:
+            raise ValueError('not takes exactly one condition.')
+        expression = Not(terms[0])
+    elif operator in ('and', 'or'):
+        if len(terms) < 2:
+            raise ValueError('{0} takes at least two conditions.'.format(
+                operator))
+        expression = (And if operator == 'and' else Or)(*terms)
+    else:
+        raise ValueError('Unknown operator {0}.'.format(operator))
+
+    return create_condition(stack, name, expression)
+
+
+class _Evaluator(object):
+    """Three-valued evaluation of a template's conditions.
+
+    Conditions come out True, False or None when they depend on values
+    that are not known.
+    """
+
+    def __init__(self, template, parameters, use_defaults):
+        self.template = template
+        self.parameters = parameters
+        self.use_defaults = use_defaults
+        self.results = {}
+        self.pending = set()
+
+    def parameter(self, name):
+        definition = self.template.get('Parameters', {}).get(name)
+
+        if name in self.parameters:
+            value = self.parameters[name]
+        elif definition is None:
+            if name.startswith('AWS::'):
+                return _UNKNOWN
+            raise ValueError('Unknown parameter {0}.'.format(name))
+        elif self.use_defaults and 'Default' in definition:
+            value = definition['Default']
+        else:
+            return _UNKNOWN
+
+        if isinstance(value, str) and definition is not None and (
+                definition.get('Type', '').startswith('List<')
+                or definition.get('Type') == 'CommaDelimitedList'):
+            return value.split(',')
+
+        return value
+
+    def value(self, expression):
+        """Return the value of a condition argument, or _UNKNOWN."""
+
+        if isinstance(expression, list):
+            values = [self.value(item) for item in expression]
+
+            return _UNKNOWN if _UNKNOWN in values else values
+
+        if not isinstance(expression, dict):
+            return expression
+
+        if len(expression) != 1:
+            return _UNKNOWN
+        function, args = list(expression.items())[0]
+
+        if function == 'Ref':
+            return self.parameter(args)
+        args = self.value(args)
+
+        if args is _UNKNOWN:
+            return _UNKNOWN
+
+        if function == 'Fn::FindInMap':
+            return self.template['Mappings'][args[0]][args[1]][args[2]]
+
+        if function == 'Fn::Join':
+            return args[0].join(str(item) for item in args[1])
+
+        if function == 'Fn::Select':
+            return args[1][int(args[0])]
+
+        return _UNKNOWN
+
+    def condition(self, name):
+        """Return True, False or None for the named condition."""
+
+        if name == '':
+            return True
+
+        if name not in self.results:
+            if name not in self.template.get('Conditions', {}):
+                raise ValueError('Unknown condition {0}.'.format(name))
+
+            if name in self.pending:
+                raise ValueError('Condition {0} refers to itself.'.format(
+                    name))
+            self.pending.add(name)
+            self.results[name] = self.truth(self.template['Conditions'][name])
+            self.pending.discard(name)
+
+        return self.results[name]
+
+    def truth(self, expression):
+        """Evaluate a condition function to True, False or None."""
+
+        if isinstance(expression, dict) and len(expression) == 1:
+            function, args = list(expression.items())[0]
+
+            if function == 'Fn::Equals':
+                left, right = [self.value(arg) for arg in args]
+
+                if _UNKNOWN in (left, right):
+                    return None
+
+                return str(left) == str(right)
+
+            if function == 'Condition':
+                return self.condition(args)
+
+            if function == 'Fn::Not':
+                result = self.truth(args[0])
+
+                return None if result is None else not result
+
+            if function in ('Fn::And', 'Fn::Or'):
+                deciding = function == 'Fn::Or'
+                results = [self.truth(arg) for arg in args]
+
+                if deciding in results:
+                    return deciding
+
+                if None in results:
+                    return None
+
+                return not deciding
+
+        raise ValueError('Cannot evaluate condition {0!r}.'.format(
+            expression))
+
+
+def evaluate_conditions(source, parameters=None, use_defaults=False):
+    """Return {condition name: True, False or None} for a template.
+
+    parameters holds the values known at build time; pseudo parameters
+    such as AWS::Region may be included. With use_defaults, parameters
+    without a known value take their Default. None means the condition
+    still depends on unknown values.
+    """
+    template = template_dict(source)
+    evaluator = _Evaluator(template, parameters or {}, use_defaults)
+
+    return dict((name, evaluator.condition(name))
+                for name in template.get('Conditions', {}))
+
+
+def _fold(value, conditions):
+    """Replace Fn::If on known conditions by the branch taken."""
+
+    if isinstance(value, list):
+        folded = [_fold(item, conditions) for item in value]
+
+        return [item for item in folded if item is not _NO_VALUE]
+
+    if not isinstance(value, dict):
+        return value
+
+    if list(value) == ['Fn::If'] and conditions.get(
+            value['Fn::If'][0]) is not None:
+        condition, when_true, when_false = value['Fn::If']
+        branch = when_true if conditions[condition] else when_false
+
+        if branch == {'Ref': 'AWS::NoValue'}:
+            return _NO_VALUE
+
+        return _fold(branch, conditions)
+    folded = {}
+
+    for key, item in value.items():
+        item = _fold(item, conditions)
+
+        if item is not _NO_VALUE:
+            folded[key] = item
+
+    return folded
+
+
+def _prune_section(section, conditions, removed):
+    """Drop entries whose condition is false and settled conditions."""
+    kept = {}
+
+    for name, body in section.items():
+        condition = body.get('Condition')
+
+        if condition is not None and (condition == ''
+                                      or conditions.get(condition)):
+            body = dict(body)
+            del body['Condition']
+        elif condition is not None and conditions.get(condition) is False:
+            removed.append(name)
+            continue
+        kept[name] = _fold(body, conditions)
+
+    return kept
+
+
+def prune(source, parameters, use_defaults=False):
+    """Fold the conditions that parameters settle and drop dead entries.
+
+    Resources and outputs whose condition is false are removed, true and
+    empty conditions are dropped, Fn::If on a settled condition becomes the
+    branch taken, and DependsOn loses removed resources. Conditions and
+    known parameters nothing refers to any more are removed too. Raises
+    ValueError if a remaining entry still refers to a removed resource.
+
+    Returns {'template': ..., 'removed': {'resources': [...], 'outputs':
+    [...], 'conditions': [...], 'parameters': [...]}}.
+    """
+    template = json.loads(json.dumps(template_dict(source)))
+    conditions = evaluate_conditions(template, parameters, use_defaults)
+    removed = {
+        'resources': [],
+        'outputs': [],
+        'conditions': [],
+        'parameters': []
+    }
+
+    for section in ('Resources', 'Outputs'):
+        if section in template:
+            template[section] = _prune_section(template[section], conditions,
+                                               removed[section.lower()])
+    gone = set(removed['resources'])
+
+    for name, body in template.get('Resources', {}).items():
+        depends_on = body.get('DependsOn')
+
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+
+        if depends_on is not None:
+            depends_on = [item for item in depends_on if item not in gone]
+
+            if depends_on:
+                body['DependsOn'] = depends_on
+            else:
+                del body['DependsOn']
+        dangling = collect_references(body, set()) & gone
+
+        if dangling:
+            raise ValueError('{0} refers to {1}, which is never created.'
+                             .format(name, ', '.join(sorted(dangling))))
+
+    for name, body in template.get('Outputs', {}).items():
+        dangling = collect_references(body, set()) & gone
+
+        if dangling:
+            raise ValueError(
+                'Output {0} refers to {1}, which is never created.'.format(
+                    name, ', '.join(sorted(dangling))))
+    used = set()
+
+    for section in ('Resources', 'Outputs'):
+        collect_references(template.get(section, {}), used)
+    definitions = template.get('Conditions', {})
+    pending = [name for name in definitions if name in used]
+    kept = set()
+
+    while pending:
+        name = pending.pop()
+
+        if name in kept:
+            continue
+        kept.add(name)
+        found = collect_references(definitions[name], set())
+        used |= found
+        pending.extend(item for item in found if item in definitions)
+
+    for name in list(definitions):
+        if name not in kept:
+            removed['conditions'].append(name)
+            del definitions[name]
+
+    for name in list(template.get('Parameters', {})):
+        if name in (parameters or {}) and name not in used:
+            removed['parameters'].append(name)
+            del template['Parameters'][name]
+
+    for section in ('Conditions', 'Parameters', 'Outputs'):
+        if section in template and not template[section]:
+            del template[section]
+
+    for names in removed.values():
+        names.sort()
+
+    return {'template': template, 'removed': removed}
@@ -0,0 +1,206 @@
+"""Typed stack context for the helpers.
+
+Helpers read their template from stack.stack, the environment name from
+stack.env, and shared resources such as stack.vpc or stack.nat_gateway
+from attributes. StackContext keeps those shared resources in a role
+registry and gives dict-speed lookups. A missing or misspelt role raises
+right away and suggests the closest match. A context can be frozen with
+snapshot() and cloned cheaply with fork(), so one network base can seed
+many service stacks.
+"""
+import copy
+import difflib
+import json
+
+from troposphere import Template
+
+HELPER_ROLES = (
+    'frontend1_subnet',
+    'frontend2_subnet',
+    'frontend_security_group',
+    'internet_gateway',
+    'nat_eip',
+    'nat_gateway',
+    'private_route_table',
+    'public1_subnet',
+    'public_route_table',
+    'ssh_key_param',
+    'vpc',
+    'vpc_address_param',
+)
+
+_TEMPLATE_SECTIONS = ('conditions', 'mappings', 'metadata', 'outputs',
+                      'parameters', 'resources')
+_DATA_SECTIONS = ('conditions', 'mappings', 'metadata')
+
+
+class FrozenTemplate(Template):
+    """Template that refuses additions, used by StackContext snapshots."""
+
+    def _update(self, d, values):
+        raise TypeError('Cannot add to a snapshot, fork() it first.')
+
+    def add_mapping(self, name, mapping):
+        raise TypeError('Cannot add to a snapshot, fork() it first.')
+
+    def add_condition(self, name, condition):
+        raise TypeError('Cannot add to a snapshot, fork() it first.')
+
+
+def template_dict(source):
+    """Return the rendered dict for a stack, Template, dict or JSON text."""
+
+    if isinstance(source, str):
+        return json.loads(source)
+
+    if hasattr(source, 'stack'):
+        source = source.stack
+
+    if hasattr(source, 'to_dict'):
+        return source.to_dict()
+
+    return source
+
+
+def _clone_template(template, cls=Template):
+    """Copy a Template's sections without copying the objects in them.
+
+    Conditions, Mappings and Metadata are plain nested data that helpers
+    edit in place, so those are copied all the way down.
+    """
+    clone = cls(Description=template.description)
+
+    for section in _TEMPLATE_SECTIONS:
+        if section in _DATA_SECTIONS:
+            setattr(clone, section, copy.deepcopy(getattr(template, section)))
+        else:
+            setattr(clone, section, dict(getattr(template, section)))
+    clone.version = template.version
+    clone.transform = template.transform
+
+    return clone
+
+
+class StackContext(object):
+    """Template, environment and role registry handed to every helper.
+
+    Roles are read and written as attributes (ctx.vpc = create_vpc(...))
+    or through register/get. With strict=True, only HELPER_ROLES and the
+    extra roles passed in may be assigned, so a misspelt assignment fails
+    too, not just a misspelt read.
+    """
+
+    __slots__ = ('stack', 'env', '_registry', '_allowed', '_frozen')
+
+    def __init__(self, env, stack=None, roles=(), strict=False, **resources):
+        object.__setattr__(self, 'stack',
+                           Template() if stack is None else stack)
+        object.__setattr__(self, 'env', env)
+        object.__setattr__(self, '_registry', {})
+        object.__setattr__(
+            self, '_allowed',
+            frozenset(HELPER_ROLES + tuple(roles)) if strict else None)
+        object.__setattr__(self, '_frozen', False)
+
+        for role, resource in resources.items():
+            self.register(role, resource)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        registry = self._registry
+
+        if name in registry:
+            return registry[name]
+
+        raise AttributeError(self._unknown(name, registry))
+
+    def __setattr__(self, name, value):
+        if name in ('stack', 'env'):
+            self._check_mutable()
+            object.__setattr__(self, name, value)
+        else:
+            self.register(name, value)
+
+    def __delattr__(self, name):
+        self._check_mutable()
+
+        if name not in self._registry:
+            raise AttributeError(self._unknown(name, self._registry))
+        del self._registry[name]
+
+    def __contains__(self, role):
+        return role in self._registry
+
+    def __repr__(self):
+        return '<StackContext env={0!r} roles={1}{2}>'.format(
+            self.env, len(self._registry), ' frozen' if self._frozen else '')
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise TypeError('Cannot modify a snapshot, fork() it first.')
+
+    def _unknown(self, name, candidates):
+        message = 'StackContext has no role {0!r}'.format(name)
+        close = difflib.get_close_matches(name, list(candidates), n=1)
+
+        if close:
+            message += ', did you mean {0!r}?'.format(close[0])
+
+        return message
+
+    @property
+    def frozen(self):
+        """Whether this context is a read-only snapshot."""
+
+        return self._frozen
+
+    def register(self, role, resource):
+        """Store resource under role and return it."""
+        self._check_mutable()
+
+        if role.startswith('_'):
+            raise AttributeError('Role names cannot start with "_".')
+
+        if self._allowed is not None and role not in self._allowed:
+            raise AttributeError(self._unknown(role, self._allowed))
+        self._registry[role] = resource
+
+        return resource
+
+    def get(self, role, default=None):
+        """Return the resource for role, or default."""
+
+        return self._registry.get(role, default)
+
+    def roles(self):
+        """Return the registered role names, sorted."""
+
+        return sorted(self._registry)
+
+    def _copy(self, env, template_cls, frozen):
+        clone = object.__new__(StackContext)
+        object.__setattr__(clone, 'stack',
+                           _clone_template(self.stack, template_cls))
+        object.__setattr__(clone, 'env', self.env if env is None else env)
+        object.__setattr__(clone, '_registry', dict(self._registry))
+        object.__setattr__(clone, '_allowed', self._allowed)
+        object.__setattr__(clone, '_frozen', frozen)
+
+        return clone
+
+    def snapshot(self):
+        """Return a read-only copy of this context and its template."""
+
+        return self._copy(None, FrozenTemplate, True)
+
+    def fork(self, env=None):
+        """Return a writable copy, optionally for another environment.
+
+        Only the template sections and the registry are copied; the
+        resource objects themselves are shared, so a fork costs the same
+        however the base was built. Treat shared resources as read-only and
+        add new ones instead of editing them in place.
+        """
+
+        return self._copy(env, Template, False)
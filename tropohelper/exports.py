@@ -0,0 +1,371 @@
+"""Cross-stack exports kept in an on-disk registry.
+
+A producing stack shares the resources other stacks need, which adds an
+exported Output for each:
+
+    registry = ExportRegistry('exports.json')
+    network = StackExports(stack, 'network', registry)
+    stack.vpc = network.share('vpc', create_vpc(stack, 'Main'))
+    network.publish()
+
+A consuming stack in the same env resolves them by role instead of
+hand-writing ImportValue names:
+
+    web = StackExports(service, 'web', registry)
+    vpc_id = web.resolve('vpc')
+    web.publish()
+
+The registry indexes exports by env and role, so resolving is a dict
+lookup. save() merges into the file under a lock, so stacks published by
+other processes since it was read are kept. check() reports imports that
+are stale, because the export is gone or has changed since the consumer
+was built, and cycles between stacks, which CloudFormation can never
+deploy.
+"""
+import contextlib
+import difflib
+import json
+import os
+import re
+
+from troposphere import (Export, GetAtt, ImportValue, Output, Ref,
+                         encode_to_dict)
+
+from tropohelper.render import content_hash
+
+REGISTRY_VERSION = 1
+
+
+def _stack_key(env, name):
+    return '{0}/{1}'.format(env, name)
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """Hold an exclusive lock on path, with flock or, on Windows, msvcrt."""
+
+    with open(path, 'a+') as handle:
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+
+            handle.seek(0)
+
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                except OSError:
+                    continue
+
+                break
+
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+
+            yield
+
+
+def _read(path):
+    """Return the stacks in a registry file, or none if it does not exist."""
+
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as handle:
+        data = json.load(handle)
+
+    if data.get('version') != REGISTRY_VERSION:
+        raise ValueError('Unsupported export registry version {0}.'.format(
+            data.get('version')))
+
+    return data['stacks']
+
+
+class ExportRegistry(object):
+    """Exports and imports of every published stack, by env and role.
+
+    path is a JSON file, read if it exists and written by save(); with no
+    path the registry lives in memory only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stacks = {} if path is None else _read(path)
+        self.changed = set()
+        self._reindex()
+
+    def _reindex(self):
+        self.index = {}
+
+        for key, entry in self.stacks.items():
+            roles = self.index.setdefault(entry['env'], {})
+
+            for role in entry['exports']:
+                roles[role] = key
+
+    def lookup(self, env, role):
+        """Return the export entry for role in env.
+
+        The entry has the export name, the producing stack key, the resource
+        type and logical ID, and a digest of what is exported. Raises
+        KeyError naming the closest role when there is no such export.
+        """
+        roles = self.index.get(env, {})
+
+        if role not in roles:
+            message = 'No stack in {0} exports {1!r}'.format(env, role)
+            close = difflib.get_close_matches(role, list(roles), n=1)
+
+            if close:
+                message += ', did you mean {0!r}?'.format(close[0])
+            raise KeyError(message)
+        entry = dict(self.stacks[roles[role]]['exports'][role])
+        entry['stack'] = roles[role]
+
+        return entry
+
+    def record(self, env, name, exports, imports):
+        """Replace what the stack name in env exports and imports.
+
+        exports maps role to its entry and imports maps '{env}/{role}' to
+        the digest seen. Raises ValueError if another stack in env already
+        exports one of the roles.
+        """
+        key = _stack_key(env, name)
+
+        for role in exports:
+            owner = self.index.get(env, {}).get(role)
+
+            if owner is not None and owner != key:
+                raise ValueError('{0} is already exported by {1}.'.format(
+                    role, owner))
+        self.stacks[key] = {
+            'env': env,
+            'name': name,
+            'exports': exports,
+            'imports': imports
+        }
+        self.changed.add(key)
+        self._reindex()
+
+    def remove(self, env, name):
+        """Forget a deleted stack; its consumers become stale."""
+        key = _stack_key(env, name)
+        del self.stacks[key]
+        self.changed.add(key)
+        self._reindex()
+
+    def dependencies(self):
+        """Return {stack key: set of stack keys it imports from}."""
+        graph = {}
+
+        for key, entry in self.stacks.items():
+            producers = graph.setdefault(key, set())
+
+            for imported in entry['imports']:
+                env, role = imported.split('/', 1)
+                producer = self.index.get(env, {}).get(role)
+
+                if producer is not None:
+                    producers.add(producer)
+
+        return graph
+
+    def cycles(self):
+        """Return each cycle of stacks importing from each other."""
+        graph = self.dependencies()
+        found = []
+        state = {}
+
+        def visit(key, path):
+            state[key] = 'open'
+            path.append(key)
+
+            for producer in sorted(graph.get(key, ())):
+                if state.get(producer) == 'open':
+                    found.append(path[path.index(producer):])
+                elif producer not in state:
+                    visit(producer, path)
+            path.pop()
+            state[key] = 'done'
+
+        for key in sorted(graph):
+            if key not in state:
+                visit(key, [])
+
+        return found
+
+    def check(self):
+        """Return {'stale': [...], 'cycles': [...]} for the whole registry.
+
+        Each stale entry names the consuming stack, the import and why:
+        'missing' when nothing exports it any more, 'changed' when the
+        export differs from the one the consumer was built against.
+        """
+        stale = []
+
+        for key, entry in sorted(self.stacks.items()):
+            for imported, digest in sorted(entry['imports'].items()):
+                env, role = imported.split('/', 1)
+
+                try:
+                    current = self.lookup(env, role)['digest']
+                except KeyError:
+                    reason = 'missing'
+                else:
+                    if current == digest:
+                        continue
+                    reason = 'changed'
+                stale.append({
+                    'stack': key,
+                    'import': imported,
+                    'reason': reason
+                })
+
+        return {'stale': stale, 'cycles': self.cycles()}
+
+    def save(self):
+        """Merge this registry's changes into path and replace it atomically.
+
+        Under an exclusive lock on '{path}.lock', the file is read again and
+        only the stacks recorded or removed here are replaced, so concurrent
+        publishes of other stacks are kept. Raises ValueError, leaving the
+        file unchanged, if the merge has two stacks exporting one role.
+        """
+
+        if self.path is None:
+            raise ValueError('This export registry has no path to save to.')
+
+        with _locked('{0}.lock'.format(self.path)):
+            stacks = _read(self.path)
+
+            for key in self.changed:
+                if key in self.stacks:
+                    stacks[key] = self.stacks[key]
+                else:
+                    stacks.pop(key, None)
+            owners = {}
+
+            for key, entry in sorted(stacks.items()):
+                for role in entry['exports']:
+                    owner = owners.setdefault((entry['env'], role), key)
+
+                    if owner != key:
+                        raise ValueError(
+                            '{0} is already exported by {1}.'.format(
+                                role, owner))
+            temporary = '{0}.tmp'.format(self.path)
+
+            with open(temporary, 'w') as handle:
+                data = {'version': REGISTRY_VERSION, 'stacks': stacks}
+                json.dump(data, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            os.replace(temporary, self.path)
+        self.stacks = stacks
+        self.changed = set()
+        self._reindex()
+
+
+class StackExports(object):
+    """Shares resources from, and resolves imports into, one stack.
+
+    name identifies the stack within stack.env in the registry.
+    """
+
+    def __init__(self, stack, name, registry):
+        self.stack = stack
+        self.name = name
+        self.registry = registry
+        self.exports = {}
+        self.imports = {}
+        self.resolved = {}
+
+    def export_name(self, role):
+        """Return the CloudFormation export name for role."""
+
+        return '{0}-{1}'.format(self.stack.env, role)
+
+    def share(self, role, resource, attribute=None, description=None):
+        """Export resource, or its attribute, under role and return it.
+
+        Adds an Output named '{role}Export', without non-alphanumerics,
+        exporting Ref(resource) or GetAtt(resource, attribute).
+        """
+
+        if role in self.exports:
+            raise ValueError('{0} is already shared.'.format(role))
+        value = Ref(resource) if attribute is None else GetAtt(
+            resource, attribute)
+        name = self.export_name(role)
+        self.stack.stack.add_output(
+            Output(
+                '{0}Export'.format(re.sub('[^A-Za-z0-9]', '', role)),
+                Description=description or '{0} for other stacks'.format(role),
+                Value=value,
+                Export=Export(name)))
+        self.exports[role] = {
+            'name': name,
+            'type': resource.resource_type,
+            'logical_id': resource.title,
+            'attribute': attribute,
+            'digest': content_hash({
+                'value': encode_to_dict(value),
+                'resource': resource.to_dict()
+            })
+        }
+
+        return resource
+
+    def resolve(self, role, env=None):
+        """Return an ImportValue for the export of role.
+
+        env defaults to this stack's. Raises KeyError for unknown roles and
+        ValueError for roles this stack exports itself, which it should Ref.
+        """
+        env = self.stack.env if env is None else env
+        key = _stack_key(env, role)
+
+        if key not in self.resolved:
+            entry = self.registry.lookup(env, role)
+
+            if entry['stack'] == _stack_key(self.stack.env, self.name):
+                raise ValueError(
+                    '{0} is exported by this stack, use Ref instead.'.format(
+                        role))
+            self.imports[key] = entry['digest']
+            self.resolved[key] = ImportValue(entry['name'])
+
+        return self.resolved[key]
+
+    def publish(self, save=True):
+        """Record this stack in the registry, then save it if it has a path.
+
+        Raises ValueError, leaving the registry unchanged, if the stack's
+        imports would close a cycle.
+        """
+        registry = self.registry
+        key = _stack_key(self.stack.env, self.name)
+        previous = registry.stacks.get(key)
+        changed = set(registry.changed)
+        registry.record(self.stack.env, self.name, dict(self.exports),
+                        dict(self.imports))
+        cycles = [cycle for cycle in registry.cycles() if key in cycle]
+
+        if cycles:
+            if previous is None:
+                del registry.stacks[key]
+            else:
+                registry.stacks[key] = previous
+            registry.changed = changed
+            registry._reindex()
+            raise ValueError('Import cycle between {0}.'.format(', '.join(
+                cycles[0])))
+
+        if save and self.registry.path is not None:
+            self.registry.save()
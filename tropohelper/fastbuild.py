@@ -0,0 +1,183 @@
+"""Trusted fast-build mode that batches troposphere property validation.
+
+troposphere type-checks every property as it is assigned. Inside
+fast_build(), assignments made by the current thread are stored as given
+and recorded instead; on leaving the block every recorded assignment is
+replayed through troposphere's own checks in one pass, so the rendered
+template and any error raised are the same as in a normal build:
+
+    with fast_build():
+        build_stack(stack)
+    stack.stack.to_json()
+
+Until that pass, properties read back by a helper hold the raw value
+rather than the validator's result. Other threads keep validating as
+usual, and troposphere is restored once the last block in any thread
+exits.
+"""
+import contextlib
+import threading
+import types
+
+from troposphere import AWSHelperFn, BaseAWSObject, depends_on_helper
+
+_validated_setattr = BaseAWSObject.__setattr__
+_INITIALIZED = '_BaseAWSObject__initialized'
+_local = threading.local()
+_lock = threading.Lock()
+_active = 0
+
+
+def _deferred_setattr(self, name, value):
+    """Store an assignment unchecked and record it for validate_pending.
+
+    Only assignments made by a thread inside fast_build() are deferred.
+    """
+    state = self.__dict__
+
+    # troposphere itself stores these unchecked, in every thread.
+    if name in state or _INITIALIZED not in state:
+        return dict.__setattr__(self, name, value)
+    pending = getattr(_local, 'pending', None)
+
+    if pending is None:
+        return _validated_setattr(self, name, value)
+
+    if name in self.attributes:
+        self.resource[name] = depends_on_helper(value) \
+            if name == 'DependsOn' else value
+    elif name in self.propnames:
+        self.properties[name] = value
+
+        if not isinstance(value, AWSHelperFn):
+            pending.append((self, name, value))
+    else:
+        pending.append((self, name, value))
+
+
+def _validate(obj, name, value, seen):
+    """Check one assignment as troposphere would, caching repeated checks.
+
+    Type checks depend only on the type of the value and validators are
+    pure, so each distinct check runs once per pass.
+    """
+
+    if name not in obj.propnames:
+        _validated_setattr(obj, name, value)
+
+        return
+    expected_type = obj.props[name][0]
+
+    if isinstance(expected_type, types.FunctionType):
+        try:
+            key = (expected_type, type(value), value)
+            hash(key)
+        except TypeError:
+            key = None
+
+        if key is None or key not in seen:
+            try:
+                result = expected_type(value)
+            except Exception:
+                _validated_setattr(obj, name, value)
+                raise
+
+            if key is None:
+                obj.properties[name] = result
+
+                return
+            seen[key] = result
+        obj.properties[name] = seen[key]
+    elif isinstance(expected_type, list):
+        if not isinstance(value, list):
+            obj._raise_type(name, value, expected_type)
+        expected = tuple(expected_type)
+
+        for item in value:
+            key = (expected, type(item))
+
+            if key not in seen:
+                seen[key] = isinstance(item, expected) or isinstance(
+                    item, AWSHelperFn)
+
+            if not seen[key]:
+                obj._raise_type(name, item, expected_type)
+    else:
+        key = (expected_type, type(value))
+
+        if key not in seen:
+            seen[key] = isinstance(value, expected_type)
+
+        if not seen[key]:
+            obj._raise_type(name, value, expected_type)
+
+
+def _validate_all(recorded, pending):
+    """Validate recorded assignments, putting back the rest on an error."""
+    seen = {}
+
+    for index, (obj, name, value) in enumerate(recorded):
+        try:
+            _validate(obj, name, value, seen)
+        except Exception:
+            pending.extend(recorded[index + 1:])
+            raise
+
+
+def validate_pending():
+    """Validate the assignments this thread recorded so far, in order.
+
+    Raises the error the first invalid assignment would have raised in a
+    normal build. Does nothing outside fast_build().
+    """
+    pending = getattr(_local, 'pending', None)
+
+    if not pending:
+        return
+    recorded = list(pending)
+    del pending[:]
+    _validate_all(recorded, pending)
+
+
+def _install():
+    global _active
+
+    with _lock:
+        if not _active:
+            BaseAWSObject.__setattr__ = _deferred_setattr
+        _active += 1
+
+
+def _uninstall():
+    global _active
+
+    with _lock:
+        _active -= 1
+
+        if not _active:
+            BaseAWSObject.__setattr__ = _validated_setattr
+
+
+@contextlib.contextmanager
+def fast_build(validate=True):
+    """Defer this thread's property validation until the block ends.
+
+    With validate=False the final pass is skipped, for templates already
+    known to be valid. Nested blocks share the outer block's pass.
+    """
+
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = []
+    _install()
+
+    try:
+        yield
+    finally:
+        recorded = _local.pending
+        _local.pending = None
+        _uninstall()
+
+    if validate:
+        _validate_all(recorded, [])
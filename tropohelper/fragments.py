@@ -0,0 +1,283 @@
+"""Frozen template fragments that can be grafted into many templates.
+
+A Fragment is rendered once from a stack built with the helpers (VPC,
+security groups, IAM roles and so on) and kept as immutable JSON text per
+logical ID. graft() adds the fragment to another stack without rebuilding
+or validating any troposphere objects. Logical IDs can be renamed with a
+prefix or an explicit mapping, and a prefix also goes in front of the
+physical names (RoleName, InstanceProfileName, GroupName and so on) that
+must be unique in an account. References are only rewritten on the first
+render of a resource that actually refers to a renamed ID, so grafting
+costs one small object per logical ID, whatever the size of its body.
+
+Grafted objects share the frozen text until their body is asked for,
+which gives that graft its own copy to edit (copy-on-write).
+"""
+import json
+import re
+from types import MappingProxyType
+
+from troposphere import BaseAWSObject
+
+from tropohelper.context import template_dict
+
+_SUB_REFERENCE = re.compile(r'\$\{(?!!)([A-Za-z0-9]+)([.][^}]*)?\}')
+
+
+def collect_references(value, found):
+    """Collect the logical IDs and condition names value refers to."""
+
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == 'Ref' and isinstance(child, str):
+                found.add(child)
+            elif key == 'Fn::GetAtt':
+                found.add(child.split('.', 1)[0] if isinstance(child, str)
+                          else child[0])
+            elif key == 'Fn::Sub':
+                text = child if isinstance(child, str) else child[0]
+                found.update(match.group(1)
+                             for match in _SUB_REFERENCE.finditer(text))
+            elif key == 'Fn::If':
+                found.add(child[0])
+            elif key in ('Condition', 'DependsOn'):
+                if isinstance(child, str):
+                    found.add(child)
+                elif key == 'DependsOn':
+                    found.update(child)
+            collect_references(child, found)
+    elif isinstance(value, list):
+        for child in value:
+            collect_references(child, found)
+
+    return found
+
+
+def rename_references(value, mapping):
+    """Return value with every reference in mapping renamed."""
+
+    if isinstance(value, dict):
+        renamed = {}
+
+        for key, child in value.items():
+            if key == 'Ref' and isinstance(child, str):
+                renamed[key] = mapping.get(child, child)
+            elif key == 'Fn::GetAtt':
+                if isinstance(child, str):
+                    name, attribute = child.split('.', 1)
+                    renamed[key] = '{0}.{1}'.format(
+                        mapping.get(name, name), attribute)
+                else:
+                    renamed[key] = [mapping.get(child[0], child[0])
+                                    ] + rename_references(child[1:], mapping)
+            elif key == 'Fn::Sub':
+                def sub(match):
+                    return '${{{0}{1}}}'.format(
+                        mapping.get(match.group(1), match.group(1)),
+                        match.group(2) or '')
+
+                if isinstance(child, str):
+                    renamed[key] = _SUB_REFERENCE.sub(sub, child)
+                else:
+                    renamed[key] = [_SUB_REFERENCE.sub(sub, child[0])
+                                    ] + rename_references(child[1:], mapping)
+            elif key == 'Fn::If':
+                renamed[key] = [mapping.get(child[0], child[0])
+                                ] + rename_references(child[1:], mapping)
+            elif key in ('Condition', 'DependsOn') and isinstance(child, str):
+                renamed[key] = mapping.get(child, child)
+            elif key == 'DependsOn':
+                renamed[key] = [mapping.get(name, name) for name in child]
+            else:
+                renamed[key] = rename_references(child, mapping)
+
+        return renamed
+
+    if isinstance(value, list):
+        return [rename_references(child, mapping) for child in value]
+
+    return value
+
+
+class FrozenObject(BaseAWSObject):
+    """A resource, parameter or output grafted from a Fragment.
+
+    It renders the fragment's frozen JSON, renaming references on the
+    first render when needed. Ref() and GetAtt() accept it like any
+    troposphere object.
+    """
+
+    props = {}
+
+    def __init__(self, title, resource_type, text, mapping=None):
+        self.resource_type = resource_type
+        self._text = text
+        self._mapping = mapping
+        self._body = None
+        super(FrozenObject, self).__init__(title, validation=False)
+
+    @property
+    def body(self):
+        """This graft's own, editable copy of the rendered dict."""
+
+        if self._body is None:
+            self._body = json.loads(self.text)
+
+        return self._body
+
+    @property
+    def text(self):
+        """The rendered JSON text, shared with the fragment when unchanged."""
+
+        if self._mapping is not None:
+            self._text = json.dumps(
+                rename_references(json.loads(self._text), self._mapping),
+                sort_keys=True)
+            self._mapping = None
+
+        return self._text
+
+    def to_dict(self):
+        if self._body is not None:
+            return json.loads(json.dumps(self._body))
+
+        return json.loads(self.text)
+
+
+class Fragment(object):
+    """An immutable, pre-rendered set of template sections."""
+
+    __slots__ = ('resources', 'parameters', 'outputs', 'conditions',
+                 'mappings', '_references', '_types')
+
+    def __init__(self, template):
+        for section in ('Resources', 'Parameters', 'Outputs', 'Conditions',
+                        'Mappings'):
+            frozen = dict(
+                (name, json.dumps(body, sort_keys=True))
+                for name, body in template.get(section, {}).items())
+            object.__setattr__(self, section.lower(),
+                               MappingProxyType(frozen))
+        references = {}
+
+        for section in ('Resources', 'Outputs', 'Conditions'):
+            for name, body in template.get(section, {}).items():
+                references[(section, name)] = frozenset(
+                    collect_references(body, set()))
+        object.__setattr__(self, '_references', references)
+        object.__setattr__(
+            self, '_types',
+            dict((name, body.get('Type'))
+                 for name, body in template.get('Resources', {}).items()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Fragments are immutable.')
+
+    @classmethod
+    def freeze(cls, source):
+        """Render a stack, StackContext, Template or dict into a Fragment."""
+
+        return cls(template_dict(source))
+
+    def rename_map(self, prefix='', rename=None):
+        """Return old to new names for the resources, outputs and conditions.
+
+        Parameters and mappings are shared between grafts unless rename
+        names them explicitly.
+        """
+        mapping = {}
+
+        if prefix:
+            for section in (self.resources, self.outputs, self.conditions):
+                for name in section:
+                    mapping[name] = '{0}{1}'.format(prefix, name)
+        mapping.update(rename or {})
+
+        return mapping
+
+
+def _merge_shared(section, name, text, kind):
+    """Add a shared parameter or mapping, allowing identical duplicates."""
+    existing = section.get(name)
+
+    if existing is None:
+        return True
+    body = existing.to_dict() if hasattr(existing, 'to_dict') else existing
+
+    if body != json.loads(text):
+        raise ValueError('{0} {1} already exists with another definition.'
+                         .format(kind, name))
+
+    return False
+
+
+def _prefix_physical_name(text, prefix, prop):
+    """Return resource text with prop, if set, as '{prefix}-{name}'."""
+    body = json.loads(text)
+    properties = body.get('Properties', {})
+
+    if prop not in properties:
+        return text
+    name = properties[prop]
+    properties[prop] = '{0}-{1}'.format(prefix, name) if isinstance(
+        name, str) else {'Fn::Join': ['-', [prefix, name]]}
+
+    return json.dumps(body, sort_keys=True)
+
+
+def graft(stack, fragment, prefix='', rename=None):
+    """Add a Fragment to stack, renaming its logical IDs.
+
+    prefix is put in front of every resource, output and condition name,
+    and of each resource's account-unique physical name as
+    '{prefix}-{name}', so one fragment can be grafted into several stacks
+    of an account. rename maps any name, including external references,
+    to a new one, and leaves physical names alone. Returns the old to new
+    name mapping.
+    """
+    # changeset imports this module, so its lookup is imported here.
+    from tropohelper.changeset import physical_name_property
+
+    template = stack.stack if hasattr(stack, 'stack') else stack
+    mapping = fragment.rename_map(prefix, rename)
+    names = set(mapping)
+
+    def affected(section, name):
+        return bool(fragment._references[(section, name)] & names)
+
+    for name, text in fragment.parameters.items():
+        new = mapping.get(name, name)
+
+        if _merge_shared(template.parameters, new, text, 'Parameter'):
+            template.add_parameter(
+                FrozenObject(new, None, text))
+
+    for name, text in fragment.mappings.items():
+        new = mapping.get(name, name)
+
+        if _merge_shared(template.mappings, new, text, 'Mapping'):
+            template.add_mapping(new, json.loads(text))
+
+    for name, text in fragment.conditions.items():
+        body = json.loads(text)
+
+        if affected('Conditions', name):
+            body = rename_references(body, mapping)
+        template.add_condition(mapping.get(name, name), body)
+
+    for name, text in fragment.resources.items():
+        prop = physical_name_property(fragment._types[name])
+
+        if prefix and prop is not None:
+            text = _prefix_physical_name(text, prefix, prop)
+        template.add_resource(
+            FrozenObject(
+                mapping.get(name, name), fragment._types[name], text,
+                mapping if affected('Resources', name) else None))
+
+    for name, text in fragment.outputs.items():
+        template.add_output(
+            FrozenObject(mapping.get(name, name), None, text,
+                         mapping if affected('Outputs', name) else None))
+
+    return mapping
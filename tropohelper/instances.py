@@ -1,10 +1,28 @@
 import troposphere.elasticache as elasticache
-from troposphere import Base64, Ref, Tags
+from troposphere import Base64, GetAtt, Output, Ref, Tags
 from troposphere.autoscaling import AutoScalingGroup, LaunchConfiguration
-from troposphere.ec2 import Instance, SecurityGroup, SecurityGroupRule
+from troposphere.ec2 import (Instance, SecurityGroup, SecurityGroupIngress,
+                             SecurityGroupRule)
 from troposphere.rds import DBInstance, DBParameterGroup, DBSecurityGroup
 
+from tropohelper.backports import (AuthFormat,
+                                   ConnectionPoolConfigurationInfoFormat,
+                                   DBProxy, DBProxyTargetGroup)
+from tropohelper.profiling import profiled
+from tropohelper.security import create_iam_policy, create_iam_role
+from tropohelper.userdata import ENCODED_TYPES
 
+
+def _user_data(user_data):
+    """Base64 encode raw user data; pass build_user_data output through."""
+
+    if isinstance(user_data, ENCODED_TYPES):
+        return user_data
+
+    return Base64(user_data)
+
+
+@profiled
 def create_ec2_instance(stack,
                         name,
                         ami,
@@ -14,7 +32,11 @@ def create_ec2_instance(stack,
                         instance_type='t1.micro',
                         security_groups=(),
                         user_data=''):
-    """Add EC2 Instance Resource."""
+    """Add EC2 Instance Resource.
+
+    user_data is a raw script or the output of userdata.build_user_data or
+    UserDataStore.add.
+    """
 
     return stack.stack.add_resource(
         Instance(
@@ -25,10 +47,11 @@ def create_ec2_instance(stack,
             SecurityGroupIds=list(security_groups),
             SubnetId=subnetid,
             Tags=Tags(Name=name),
-            UserData=Base64(user_data),
+            UserData=_user_data(user_data),
             IamInstanceProfile=instance_profile))
 
 
+@profiled
 def create_launch_config(stack,
                          name,
                          ami,
@@ -37,7 +60,11 @@ def create_launch_config(stack,
                          profile,
                          block_devices=[],
                          user_data=''):
-    """Add EC2 LaunchConfiguration Resource."""
+    """Add EC2 LaunchConfiguration Resource.
+
+    user_data is a raw script or the output of userdata.build_user_data or
+    UserDataStore.add.
+    """
 
     return stack.stack.add_resource(
         LaunchConfiguration(
@@ -47,10 +74,11 @@ def create_launch_config(stack,
             SecurityGroups=security_group,
             InstanceType=instance_type,
             IamInstanceProfile=profile,
-            UserData=Base64(user_data),
+            UserData=_user_data(user_data),
             BlockDeviceMappings=block_devices))
 
 
+@profiled
 def create_autoscale_group(stack,
                            name,
                            launch_con,
@@ -73,6 +101,7 @@ def create_autoscale_group(stack,
         ))
 
 
+@profiled
 def create_db_param_group(stack, name, description, family, parameters={}):
     """Create a DB Parameter Group"""
 
@@ -84,6 +113,7 @@ def create_db_param_group(stack, name, description, family, parameters={}):
             Parameters=parameters))
 
 
+@profiled
 def create_rds_instance(stack,
                         db_instance_identifier,
                         db_name,
@@ -122,3 +152,102 @@ def create_rds_instance(stack,
             DeletionPolicy=deletion_policy,
             PubliclyAccessible=public,
             MultiAZ=multi_az))
+
+
+@profiled
+def create_rds_proxy(stack,
+                     name,
+                     db_instance,
+                     secret_arn,
+                     subnets,
+                     client_security_groups,
+                     port=3306,
+                     engine_family='MYSQL',
+                     max_connections_percent=90,
+                     max_idle_connections_percent=50,
+                     idle_client_timeout=1800,
+                     connection_borrow_timeout=120,
+                     require_tls=True,
+                     iam_auth=False):
+    """Add an RDS Proxy pooling connections to a create_rds_instance DB.
+
+    The proxy logs in with the Secrets Manager secret_arn through an IAM
+    role of its own. It gets a security group that admits
+    client_security_groups on port, and each VPC security group of the
+    instance admits the proxy. Applications connect to the
+    {name}RDSProxyEndpoint output instead of the instance.
+    """
+
+    if not 0 < max_connections_percent <= 100:
+        raise ValueError('max_connections_percent must be 1 to 100.')
+
+    if not 0 <= max_idle_connections_percent <= max_connections_percent:
+        raise ValueError('max_idle_connections_percent must be 0 to '
+                         'max_connections_percent.')
+    title = name.replace('-', '')
+    role = create_iam_role(stack, '{0}-rds-proxy'.format(name),
+                           service=['rds.amazonaws.com'])
+    policy = create_iam_policy(stack, '{0}RDSProxySecret'.format(title),
+                               ['secretsmanager:GetSecretValue'],
+                               roles=[Ref(role)],
+                               resources=[secret_arn])
+    proxy_group = stack.stack.add_resource(
+        SecurityGroup(
+            '{0}RDSProxySecurityGroup'.format(title),
+            GroupDescription='{0} RDS Proxy Security Group'.format(name),
+            SecurityGroupIngress=[
+                SecurityGroupRule(
+                    IpProtocol='tcp',
+                    FromPort=port,
+                    ToPort=port,
+                    SourceSecurityGroupId=group)
+
+                for group in client_security_groups
+            ],
+            VpcId=Ref(stack.vpc)))
+
+    for index, group in enumerate(
+            db_instance.properties.get('VPCSecurityGroups', [])):
+        stack.stack.add_resource(
+            SecurityGroupIngress(
+                '{0}RDSProxyIngress{1}'.format(title, index),
+                GroupId=group,
+                IpProtocol='tcp',
+                FromPort=port,
+                ToPort=port,
+                SourceSecurityGroupId=Ref(proxy_group)))
+    proxy = stack.stack.add_resource(
+        DBProxy(
+            '{0}RDSProxy'.format(title),
+            DBProxyName=name,
+            EngineFamily=engine_family,
+            Auth=[
+                AuthFormat(
+                    AuthScheme='SECRETS',
+                    SecretArn=secret_arn,
+                    IAMAuth='REQUIRED' if iam_auth else 'DISABLED')
+            ],
+            RoleArn=GetAtt(role, 'Arn'),
+            VpcSubnetIds=list(subnets),
+            VpcSecurityGroupIds=[Ref(proxy_group)],
+            IdleClientTimeout=idle_client_timeout,
+            RequireTLS=require_tls,
+            DependsOn=[policy.title]))
+    stack.stack.add_resource(
+        DBProxyTargetGroup(
+            '{0}RDSProxyTargetGroup'.format(title),
+            DBProxyName=Ref(proxy),
+            TargetGroupName='default',
+            DBInstanceIdentifiers=[Ref(db_instance)],
+            ConnectionPoolConfigurationInfo=(
+                ConnectionPoolConfigurationInfoFormat(
+                    MaxConnectionsPercent=max_connections_percent,
+                    MaxIdleConnectionsPercent=max_idle_connections_percent,
+                    ConnectionBorrowTimeout=connection_borrow_timeout))))
+    stack.stack.add_output(
+        Output(
+            '{0}RDSProxyEndpoint'.format(title),
+            Value=GetAtt(proxy, 'Endpoint'),
+            Description='RDS Proxy endpoint for {0}'.format(name)))
+
+    return proxy
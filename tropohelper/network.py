@@ -1,13 +1,46 @@
+import heapq
+import ipaddress
+import json
+import re
+
 import troposphere.elasticloadbalancing as elb
 import troposphere.elasticloadbalancingv2 as alb
-from troposphere import GetAtt, Ref
+from troposphere import MAX_RESOURCES, AWSHelperFn, GetAtt, Join, Ref
 from troposphere.ec2 import (EIP, VPC, InternetGateway, NatGateway, Route,
                              RouteTable, Subnet, SubnetRouteTableAssociation,
-                             VPCGatewayAttachment, VPCPeeringConnection)
+                             TransitGateway, TransitGatewayAttachment,
+                             VPCEndpoint, VPCGatewayAttachment,
+                             VPCPeeringConnection)
+from troposphere.cloudfront import (CustomOriginConfig, Distribution,
+                                    DistributionConfig, OriginCustomHeader,
+                                    ViewerCertificate)
 from troposphere.rds import DBSubnetGroup
-from troposphere.route53 import HostedZone, RecordSetType
+from troposphere.route53 import (AliasTarget, HealthCheck,
+                                  HealthCheckConfiguration, HostedZone,
+                                  RecordSetType)
+
+from tropohelper import backports
+from tropohelper.profiling import profiled
+
+ALB_RULES_PER_LISTENER = 100
+ALB_CONDITION_VALUES_PER_RULE = 5
+ALB_MAX_RULE_PRIORITY = 50000
+
+CLOUDFRONT_HOSTED_ZONE_ID = 'Z2FDTNDATAQYW2'
+CLOUDFRONT_ALL_METHODS = ['DELETE', 'GET', 'HEAD', 'OPTIONS', 'PATCH', 'POST',
+                          'PUT']
+CLOUDFRONT_READ_METHODS = ['GET', 'HEAD']
+MANAGED_CACHE_POLICIES = {
+    'CachingDisabled': '4135ea2d-6df8-44a3-9df3-4b5a84be39ad',
+    'CachingOptimized': '658327ea-f89d-4fab-a63d-7e88639e58f6',
+}
+MANAGED_ORIGIN_REQUEST_POLICIES = {
+    'AllViewer': '216adef6-5c7f-47e4-b989-5492eafa07d3',
+    'AllViewerExceptHostHeader': 'b689b0a8-53d0-40ab-baf2-68738e2966ac',
+}
 
 
+@profiled
 def create_vpc(stack, name, address=None):
     """Add VPC Resource."""
 
@@ -29,6 +62,7 @@ def create_vpc(stack, name, address=None):
         ))
 
 
+@profiled
 def create_vpc_peer(stack, connection, peer_region='us-east-1'):
     """Add VPC Peering Connection Resource."""
 
@@ -41,6 +75,7 @@ def create_vpc_peer(stack, connection, peer_region='us-east-1'):
         ))
 
 
+@profiled
 def create_internet_gateway(stack):
     """Add VPC Internet Gateway Resource."""
 
@@ -56,6 +91,7 @@ def create_internet_gateway(stack):
         ))
 
 
+@profiled
 def attach_gateway(stack):
     """Add VPC Gateway attachment Resource."""
     stack.stack.add_resource(
@@ -66,12 +102,14 @@ def attach_gateway(stack):
         ))
 
 
+@profiled
 def create_elastic_ip(stack, name):
     """Add VPC Elastic IP Resource."""
 
     return stack.stack.add_resource(EIP('{0}eip'.format(name)))
 
 
+@profiled
 def associate_routes(stack, subnet_list=()):
     """Add Route Association Resources."""
 
@@ -83,17 +121,24 @@ def associate_routes(stack, subnet_list=()):
                 RouteTableId=Ref(association['route_table'])))
 
 
+@profiled
 def create_subnet(stack,
                   name,
                   subnet_cidr,
                   avail_zone='us-east-1a',
                   public_ip=False):
-    """Add VPC Subnet Resource."""
+    """Add VPC Subnet Resource.
+
+    subnet_cidr is a parameter to Ref, or an already resolved value such as
+    one returned by ParameterResolver.subnet.
+    """
+    if not isinstance(subnet_cidr, AWSHelperFn):
+        subnet_cidr = Ref(subnet_cidr)
 
     return stack.stack.add_resource(
         Subnet(
             '{0}Subnet'.format(name),
-            CidrBlock=Ref(subnet_cidr),
+            CidrBlock=subnet_cidr,
             MapPublicIpOnLaunch=public_ip,
             AvailabilityZone=avail_zone,
             VpcId=Ref(stack.vpc),
@@ -106,6 +151,7 @@ def create_subnet(stack,
         ))
 
 
+@profiled
 def create_db_subnet(stack, name, description, subnet_ids=()):
     """Add DB Subnet Resource."""
 
@@ -116,23 +162,101 @@ def create_db_subnet(stack, name, description, subnet_ids=()):
             SubnetIds=subnet_ids))
 
 
-def create_nat_gateway(stack):
-    """Add VPC NAT Gateway Resource."""
+@profiled
+def create_nat_gateway(stack, name='Nat', eip=None, subnet=None):
+    """Add VPC NAT Gateway Resource.
+
+    eip and subnet default to stack.nat_eip and stack.public1_subnet.
+    """
+    if eip is None:
+        eip = stack.nat_eip
+
+    if subnet is None:
+        subnet = stack.public1_subnet
+    tag = stack.env if name == 'Nat' else '{0}{1}'.format(stack.env, name)
 
     return stack.stack.add_resource(
         NatGateway(
-            'Nat',
-            AllocationId=GetAtt(stack.nat_eip, 'AllocationId'),
-            SubnetId=Ref(stack.public1_subnet),
+            name,
+            AllocationId=GetAtt(eip, 'AllocationId'),
+            SubnetId=Ref(subnet),
             Tags=[
                 {
                     'Key': 'Name',
-                    'Value': '{0}'.format(stack.env)
+                    'Value': '{0}'.format(tag)
                 },
             ],
         ))
 
 
+@profiled
+def create_gateway_endpoint(stack, service, route_tables=()):
+    """Add VPC Gateway Endpoint Resource for s3 or dynamodb."""
+
+    return stack.stack.add_resource(
+        VPCEndpoint(
+            '{0}{1}Endpoint'.format(stack.env, service.capitalize()),
+            ServiceName=Join(
+                '', ['com.amazonaws.',
+                     Ref('AWS::Region'), '.{0}'.format(service)]),
+            VpcEndpointType='Gateway',
+            RouteTableIds=[Ref(table) for table in route_tables],
+            VpcId=Ref(stack.vpc),
+        ))
+
+
+@profiled
+def create_nat_fabric(stack, zones, endpoints=('s3', 'dynamodb')):
+    """Add per-AZ NAT Gateway, EIP, private Route Table and Route Resources.
+
+    zones is a list of dicts with 'name', 'public_subnet' and
+    'private_subnets' keys, one per availability zone. Each zone gets its own
+    NAT gateway so private traffic never crosses AZs, and gateway endpoints
+    for endpoints are attached to every private route table so S3/DynamoDB
+    traffic skips NAT.
+
+    Returns {'zones': [{'name', 'eip', 'nat_gateway', 'route_table'}],
+    'endpoints': [...]}.
+    """
+    fabric = {'zones': [], 'endpoints': []}
+
+    for zone in zones:
+        eip = create_elastic_ip(stack, '{0}Nat'.format(zone['name']))
+        nat = create_nat_gateway(
+            stack,
+            '{0}Nat'.format(zone['name']),
+            eip=eip,
+            subnet=zone['public_subnet'])
+        route_table = create_route_table(stack, stack.env,
+                                         '{0}Private'.format(zone['name']))
+        stack.stack.add_resource(
+            Route(
+                '{0}NatRoute'.format(zone['name']),
+                NatGatewayId=Ref(nat),
+                DestinationCidrBlock='0.0.0.0/0',
+                RouteTableId=Ref(route_table)))
+        associate_routes(stack, [{
+            'name': '{0}Private{1}'.format(zone['name'], idx),
+            'subnet': subnet,
+            'route_table': route_table
+        } for idx, subnet in enumerate(zone['private_subnets'])])
+        fabric['zones'].append({
+            'name': zone['name'],
+            'eip': eip,
+            'nat_gateway': nat,
+            'route_table': route_table
+        })
+
+    for service in endpoints:
+        fabric['endpoints'].append(
+            create_gateway_endpoint(
+                stack, service,
+                [zone['route_table'] for zone in fabric['zones']]))
+
+    return fabric
+
+
+@profiled
 def create_route_table(stack, env, name):
     """Add VPC Route table Resource."""
 
@@ -149,6 +273,7 @@ def create_route_table(stack, env, name):
         ))
 
 
+@profiled
 def populate_routes(stack, routes):
     """Add VPC Routes Resources."""
     tables = {
@@ -179,8 +304,11 @@ def populate_routes(stack, routes):
                 Ref(tables[route['routetable']]))
 
 
+@profiled
 def create_peer_route(stack, name, peer, destination_cidr, route_table):
-    stack.stack.add_resource(
+    """Add VPC Peering Route Resource."""
+
+    return stack.stack.add_resource(
         Route(
             '{0}'.format(name),
             VpcPeeringConnectionId=peer,
@@ -188,6 +316,164 @@ def create_peer_route(stack, name, peer, destination_cidr, route_table):
             RouteTableId=route_table))
 
 
+def check_cidr_overlaps(vpcs):
+    """Raise ValueError if any two VPC 'cidr' entries overlap."""
+    networks = sorted(
+        (ipaddress.ip_network(vpc['cidr']), vpc['name']) for vpc in vpcs)
+
+    for (first, first_name), (second, second_name) in zip(
+            networks, networks[1:]):
+        if first.overlaps(second):
+            raise ValueError('{0} ({1}) overlaps {2} ({3}).'.format(
+                first_name, first, second_name, second))
+
+
+def _mesh_resource_count(vpcs):
+    """Count peering connections and routes a full mesh would need."""
+    tables = [len(vpc['route_tables']) for vpc in vpcs
+              if not vpc.get('region')]
+
+    return (len(vpcs) * (len(vpcs) - 1) // 2 +
+            sum(count * (len(vpcs) - 1) for count in tables))
+
+
+def _hub_destinations(vpcs, vpc):
+    """Summarise every other VPC CIDR into as few routes as possible."""
+    own = ipaddress.ip_network(vpc['cidr'])
+
+    return [
+        str(block)
+        for block in ipaddress.collapse_addresses(
+            ipaddress.ip_network(other['cidr']) for other in vpcs)
+
+        if block != own
+    ]
+
+
+@profiled
+def create_vpc_mesh(stack,
+                    name,
+                    vpcs,
+                    topology='auto',
+                    max_resources=MAX_RESOURCES):
+    """Connect VPCs with a full peering mesh or a transit gateway hub.
+
+    vpcs is a list of dicts with 'name', 'vpc_id', 'cidr' and 'route_tables'
+    keys, plus 'subnet_ids' for the hub. A VPC in another region gives its
+    'region'; it is peered from a VPC in this stack's region, and the routes
+    of its own tables are returned in 'remote_routes' for a stack in that
+    region to create. topology is 'mesh', 'hub' or 'auto', which picks the
+    mesh while it fits within max_resources and the hub otherwise. Hub
+    routes are summarised so each route table needs as few entries as the
+    CIDR layout allows.
+
+    Returns {'topology', 'peerings', 'transit_gateway', 'attachments',
+    'routes', 'remote_routes'}; each remote route is a dict with 'region',
+    'route_table', 'destination' and 'peering'.
+    """
+    check_cidr_overlaps(vpcs)
+    remote = [vpc['name'] for vpc in vpcs if vpc.get('region')]
+
+    if topology == 'auto':
+        fits = (len(stack.stack.resources) + _mesh_resource_count(vpcs) <=
+                max_resources)
+        topology = 'mesh' if fits else 'hub'
+
+    if topology not in ('mesh', 'hub'):
+        raise ValueError('Unknown topology {0}.'.format(topology))
+
+    if topology == 'hub' and remote:
+        raise ValueError('A transit gateway hub cannot attach {0} from '
+                         'another region.'.format(', '.join(remote)))
+
+    mesh = {
+        'topology': topology,
+        'peerings': [],
+        'transit_gateway': None,
+        'attachments': [],
+        'routes': [],
+        'remote_routes': []
+    }
+
+    if topology == 'mesh':
+        for idx, vpc in enumerate(vpcs):
+            for peer in vpcs[idx + 1:]:
+                requester, accepter = (peer, vpc) if vpc.get('region') \
+                    else (vpc, peer)
+
+                if requester.get('region'):
+                    raise ValueError(
+                        '{0} and {1} are both in other regions, peer them '
+                        'from a stack there.'.format(vpc['name'],
+                                                     peer['name']))
+                peering = stack.stack.add_resource(
+                    VPCPeeringConnection(
+                        '{0}{1}{2}Peering'.format(name, vpc['name'],
+                                                  peer['name']),
+                        VpcId=requester['vpc_id'],
+                        PeerVpcId=accepter['vpc_id'],
+                        PeerRegion=accepter.get('region',
+                                                Ref('AWS::Region'))))
+                mesh['peerings'].append(peering)
+
+                for source, destination in ((vpc, peer), (peer, vpc)):
+                    for table_idx, route_table in enumerate(
+                            source['route_tables']):
+                        if source.get('region'):
+                            mesh['remote_routes'].append({
+                                'region': source['region'],
+                                'route_table': route_table,
+                                'destination': destination['cidr'],
+                                'peering': peering
+                            })
+
+                            continue
+                        mesh['routes'].append(
+                            create_peer_route(
+                                stack, '{0}{1}To{2}Route{3}'.format(
+                                    name, source['name'], destination['name'],
+                                    table_idx), Ref(peering),
+                                destination['cidr'], route_table))
+
+        return mesh
+
+    transit_gateway = stack.stack.add_resource(
+        TransitGateway(
+            '{0}TransitGateway'.format(name),
+            DefaultRouteTableAssociation='enable',
+            DefaultRouteTablePropagation='enable',
+            Tags=[{
+                'Key': 'Name',
+                'Value': '{0}{1}'.format(stack.env, name)
+            }]))
+    mesh['transit_gateway'] = transit_gateway
+
+    for vpc in vpcs:
+        attachment = stack.stack.add_resource(
+            TransitGatewayAttachment(
+                '{0}{1}TgwAttachment'.format(name, vpc['name']),
+                TransitGatewayId=Ref(transit_gateway),
+                VpcId=vpc['vpc_id'],
+                SubnetIds=vpc['subnet_ids']))
+        mesh['attachments'].append(attachment)
+
+        for table_idx, route_table in enumerate(vpc['route_tables']):
+            for block_idx, destination in enumerate(
+                    _hub_destinations(vpcs, vpc)):
+                mesh['routes'].append(
+                    stack.stack.add_resource(
+                        backports.Route(
+                            '{0}{1}TgwRoute{2}x{3}'.format(
+                                name, vpc['name'], table_idx, block_idx),
+                            DependsOn=[attachment.title],
+                            TransitGatewayId=Ref(transit_gateway),
+                            DestinationCidrBlock=destination,
+                            RouteTableId=route_table)))
+
+    return mesh
+
+
+@profiled
 def create_frontend_elb(stack, cert=None):
     """Add EC2 ELB Resource."""
 
@@ -224,6 +510,7 @@ def create_frontend_elb(stack, cert=None):
         ))
 
 
+@profiled
 def create_target_group(stack,
                         name,
                         port,
@@ -246,7 +533,7 @@ def create_target_group(stack,
             alb.TargetGroupAttribute(
                 Key='deregistration_delay.timeout_seconds', Value='300'))
     else:
-        for att, value in attributes.items():
+        for att, value in sorted(attributes.items()):
             tg_atts.append(alb.TargetGroupAttribute(Key=att, Value=value))
 
     if http_codes is not None:
@@ -285,6 +572,7 @@ def create_target_group(stack,
             VpcId=Ref(stack.vpc)))
 
 
+@profiled
 def create_alb(stack,
                name,
                subnets=[],
@@ -305,6 +593,7 @@ def create_alb(stack,
             LoadBalancerAttributes=LoadBalancerAttributes))
 
 
+@profiled
 def create_alb_listener(stack,
                         name,
                         alb_arn,
@@ -334,14 +623,24 @@ def create_alb_listener(stack,
             ]))
 
 
+@profiled
 def create_alb_listener_rule(stack,
                              name,
                              listener,
                              condition,
                              target_group,
                              priority=1,
-                             condition_field=''):
-    """Add ALB Listener Rule Resource."""
+                             condition_field='',
+                             actions=None):
+    """Add ALB Listener Rule Resource.
+
+    condition may be a single {'field': ..., 'values': [...]} dict or a list
+    of them; actions replaces the default forward to target_group.
+    """
+    conditions = condition if isinstance(condition, list) else [condition]
+
+    if actions is None:
+        actions = [alb.Action(Type='forward', TargetGroupArn=target_group)]
 
     return stack.stack.add_resource(
         alb.ListenerRule(
@@ -349,13 +648,347 @@ def create_alb_listener_rule(stack,
             Condition=condition_field,
             ListenerArn=listener,
             Conditions=[
-                alb.Condition(
-                    Field=condition['field'], Values=condition['values'])
+                alb.Condition(Field=cond['field'], Values=cond['values'])
+
+                for cond in conditions
             ],
-            Actions=[alb.Action(Type='forward', TargetGroupArn=target_group)],
+            Actions=actions,
             Priority=priority))
 
 
+def _routing_rules(routes):
+    """Normalise a routing table into deduplicated rule dicts."""
+    rules = []
+    seen = {}
+
+    for index, route in enumerate(routes):
+        fields = {}
+
+        for key in ('host', 'path'):
+            if route.get(key):
+                fields[key] = route[key]
+
+        if not fields:
+            raise ValueError(
+                'Route {0} needs a host and/or path.'.format(index))
+
+        if 'actions' in route:
+            actions = list(route['actions'])
+        else:
+            actions = [
+                alb.Action(Type='forward',
+                           TargetGroupArn=route['target_group'])
+            ]
+        action_key = json.dumps(
+            [action.to_dict() for action in actions], sort_keys=True)
+
+        match = tuple(sorted(fields.items()))
+
+        if match in seen:
+            if seen[match] != action_key:
+                raise ValueError('Route {0} conflicts with an earlier route '
+                                 'for {1}.'.format(index, dict(match)))
+
+            continue
+        seen[match] = action_key
+
+        wildcard = any('*' in value or '?' in value
+                       for value in fields.values())
+        literal = sum(
+            len(value.replace('*', '').replace('?', ''))
+            for value in fields.values())
+        rules.append({
+            'fields': {key: [value] for key, value in fields.items()},
+            'actions': actions,
+            'action_key': action_key,
+            'wildcard': wildcard,
+            'literal': literal,
+            'index': index,
+        })
+
+    return rules
+
+
+def _pattern(value):
+    return re.compile(re.escape(value).replace('\\*', '.*').replace(
+        '\\?', '.'))
+
+
+def _is_wildcard(value):
+    return '*' in value or '?' in value
+
+
+def _value_overlap(field, first, second):
+    """Whether one request can match both condition values."""
+
+    if field == 'host':
+        first, second = first.lower(), second.lower()
+
+    if first == second or _is_wildcard(first) and _is_wildcard(second):
+        return True
+
+    if _is_wildcard(first):
+        return bool(_pattern(first).fullmatch(second))
+
+    return _is_wildcard(second) and bool(_pattern(second).fullmatch(first))
+
+
+def _value_covered(field, value, values):
+    """Whether every request matching value also matches one of values."""
+
+    if field == 'host':
+        value, values = value.lower(), [other.lower() for other in values]
+
+    return any(
+        other == value or other == '*' or _is_wildcard(other)
+        and not _is_wildcard(value) and _pattern(other).fullmatch(value)
+        for other in values)
+
+
+def _disjoint(first, second):
+    """Whether no request can match both rules."""
+
+    return any(
+        field in second['fields'] and not any(
+            _value_overlap(field, value, other)
+            for value in values for other in second['fields'][field])
+        for field, values in first['fields'].items())
+
+
+def _narrower(first, second):
+    """Whether first matches a strict subset of what second matches."""
+
+    return first['fields'] != second['fields'] and all(
+        field in first['fields'] and all(
+            _value_covered(field, value, values)
+            for value in first['fields'][field])
+        for field, values in second['fields'].items())
+
+
+def _order_rules(rules):
+    """Order rules most specific first, without changing which rule wins.
+
+    More conditions beat fewer, exact values beat wildcards and longer
+    wildcard literals beat shorter ones. A rule only moves ahead of an
+    earlier route it could share a request with when it is strictly
+    narrower; otherwise the two keep input order. Exact rules are grouped
+    by action and host where that allows, to give the merge pass adjacent
+    candidates.
+    """
+    groups = {}
+
+    for rule in sorted(rules, key=lambda rule: rule['index']):
+        group = (rule['action_key'], tuple(rule['fields'].get('host', ())))
+        groups.setdefault(group, rule['index'])
+
+    def key(rule):
+        if rule['wildcard']:
+            return (-len(rule['fields']), 1, -rule['literal'], rule['index'],
+                    0)
+        group = (rule['action_key'], tuple(rule['fields'].get('host', ())))
+
+        return (-len(rule['fields']), 0, 0, groups[group], rule['index'])
+
+    after = dict((rule['index'], []) for rule in rules)
+    waiting = dict((rule['index'], 0) for rule in rules)
+
+    for first in rules:
+        for second in rules:
+            if first['index'] < second['index'] and not _disjoint(
+                    first, second) and not _narrower(second, first):
+                after[first['index']].append(second)
+                waiting[second['index']] += 1
+    ready = [(key(rule), rule['index'], rule) for rule in rules
+             if not waiting[rule['index']]]
+    heapq.heapify(ready)
+    ordered = []
+
+    while ready:
+        _, _, rule = heapq.heappop(ready)
+        ordered.append(rule)
+
+        for later in after[rule['index']]:
+            waiting[later['index']] -= 1
+
+            if not waiting[later['index']]:
+                heapq.heappush(ready, (key(later), later['index'], later))
+
+    return ordered
+
+
+def _merge_rules(rules, max_values=ALB_CONDITION_VALUES_PER_RULE):
+    """Merge adjacent rules sharing an action and all but one condition."""
+    merged = []
+
+    for rule in rules:
+        previous = merged[-1] if merged else None
+
+        if (previous is not None
+                and previous['action_key'] == rule['action_key']
+                and set(previous['fields']) == set(rule['fields'])):
+            differing = [
+                key for key in rule['fields']
+                if previous['fields'][key] != rule['fields'][key]
+            ]
+            values = sum(len(value) for value in previous['fields'].values())
+
+            if len(differing) == 1 and values < max_values:
+                previous['fields'][differing[0]].extend(
+                    rule['fields'][differing[0]])
+
+                continue
+        merged.append(dict(rule, fields=dict(
+            (key, list(value)) for key, value in rule['fields'].items())))
+
+    return merged
+
+
+def _pack_hosts(rules, capacity):
+    """First-fit decreasing packing of per-host rule groups into listeners."""
+    hosts = {}
+
+    for rule in rules:
+        hosts.setdefault(tuple(rule['fields']['host']), []).append(rule)
+
+    bins = []
+
+    for host in sorted(hosts, key=lambda h: -len(hosts[h])):
+        if len(hosts[host]) > capacity:
+            raise ValueError('Host {0} needs {1} rules, more than the {2} '
+                             'available per listener.'.format(
+                                 host[0], len(hosts[host]), capacity))
+
+        for packed in bins:
+            if len(packed) + len(hosts[host]) <= capacity:
+                packed.extend(hosts[host])
+
+                break
+        else:
+            bins.append(list(hosts[host]))
+
+    return bins or [[]]
+
+
+def _rule_conditions(fields):
+    """Build ALB conditions, using the config form for multiple values."""
+    conditions = []
+
+    if 'host' in fields:
+        conditions.append(
+            backports.Condition(
+                Field='host-header',
+                HostHeaderConfig=backports.HostHeaderConfig(
+                    Values=fields['host'])))
+
+    if 'path' in fields:
+        conditions.append(
+            backports.Condition(
+                Field='path-pattern',
+                PathPatternConfig=backports.PathPatternConfig(
+                    Values=fields['path'])))
+
+    return conditions
+
+
+@profiled
+def create_alb_listener_rules(stack,
+                              name,
+                              listener,
+                              routes,
+                              default_target_group=None,
+                              subnets=[],
+                              security_groups=[],
+                              port=443,
+                              protocol='HTTPS',
+                              certificates=[],
+                              max_rules=ALB_RULES_PER_LISTENER,
+                              priority_start=1,
+                              priority_step=1,
+                              condition_field=''):
+    """Allocate ALB Listener Rule Resources for a whole routing table.
+
+    routes is a list of {'host': ..., 'path': ..., 'target_group': ...} dicts
+    (either host or path may be omitted, 'actions' replaces target_group).
+    Rules are ordered by specificity, merged where it is safe and given
+    priorities in order. Hosts that do not fit on listener are packed onto
+    extra ALBs and listeners; host-less rules are repeated on every listener.
+
+    Returns a list of {'alb', 'listener', 'hosts', 'rules'} dicts, one per
+    listener, where 'alb' is None for the listener passed in.
+    """
+    rules = _routing_rules(routes)
+    host_rules = [rule for rule in rules if 'host' in rule['fields']]
+    global_rules = [rule for rule in rules if 'host' not in rule['fields']]
+
+    if len(global_rules) >= max_rules and host_rules:
+        raise ValueError('{0} host-less rules leave no room for host rules.'
+                         .format(len(global_rules)))
+
+    allocations = []
+
+    for shard, packed in enumerate(
+            _pack_hosts(host_rules, max_rules - len(global_rules))):
+        ordered = _merge_rules(_order_rules(packed + global_rules))
+
+        if len(ordered) > max_rules:
+            raise ValueError('{0} rules do not fit on one listener.'.format(
+                len(ordered)))
+
+        new_alb = None
+        shard_listener = listener
+
+        if shard:
+            if default_target_group is None:
+                raise ValueError('default_target_group is required once '
+                                 'rules spill over to another listener.')
+            new_alb = create_alb(
+                stack,
+                '{0}{1}'.format(name, shard),
+                subnets=subnets,
+                security_groups=security_groups,
+                condition_field=condition_field)
+            shard_listener = Ref(
+                create_alb_listener(
+                    stack,
+                    '{0}{1}'.format(name, shard),
+                    Ref(new_alb),
+                    default_target_group,
+                    port=port,
+                    protocol=protocol,
+                    certificates=certificates,
+                    condition_field=condition_field))
+
+        created = []
+
+        for position, rule in enumerate(ordered):
+            priority = priority_start + position * priority_step
+
+            if priority > ALB_MAX_RULE_PRIORITY:
+                raise ValueError('Priority {0} is above the ALB maximum of '
+                                 '{1}.'.format(priority,
+                                               ALB_MAX_RULE_PRIORITY))
+            created.append(
+                stack.stack.add_resource(
+                    alb.ListenerRule(
+                        '{0}{1}P{2}ListenerRule'.format(name, shard, priority),
+                        Condition=condition_field,
+                        ListenerArn=shard_listener,
+                        Conditions=_rule_conditions(rule['fields']),
+                        Actions=rule['actions'],
+                        Priority=priority)))
+
+        allocations.append({
+            'alb': new_alb,
+            'listener': shard_listener,
+            'hosts': sorted(set(
+                host for rule in packed for host in rule['fields']['host'])),
+            'rules': created,
+        })
+
+    return allocations
+
+
+@profiled
 def create_hosted_zone(stack, name):
     """Add Route53 HostedZone Resource."""
 
@@ -363,21 +996,448 @@ def create_hosted_zone(stack, name):
         HostedZone('{0}HostedZone'.format(name.replace('.', '')), Name=name))
 
 
+def _alias_target(alias, evaluate_target_health=True):
+    """Build an AliasTarget for an ALB or a (dns_name, hosted_zone_id) pair."""
+
+    if isinstance(alias, (list, tuple)):
+        dns_name, hosted_zone_id = alias
+    else:
+        dns_name = GetAtt(alias, 'DNSName')
+        hosted_zone_id = GetAtt(alias, 'CanonicalHostedZoneID')
+
+    return AliasTarget(
+        DNSName=dns_name,
+        HostedZoneId=hosted_zone_id,
+        EvaluateTargetHealth=evaluate_target_health)
+
+
+def _alnum(value):
+    """Strip everything but letters and digits, for logical IDs."""
+
+    return ''.join(char for char in value if char.isalnum())
+
+
+@profiled
 def create_or_update_dns_record(stack,
                                 record_name,
                                 record_type,
                                 record_value,
                                 hosted_zone_name,
-                                condition_field=''):
-    """Create or Update Route53 Record Resource."""
+                                condition_field='',
+                                ttl='60',
+                                alias=None,
+                                routing=None,
+                                evaluate_target_health=True):
+    """Create or Update Route53 Record Resource.
+
+    alias makes an alias record instead of a value record, pointing at an
+    ALB from create_alb or a (dns_name, hosted_zone_id) pair; record_value
+    and ttl are then ignored. routing holds the set_identifier and weight,
+    region or failover of a routed record, and optionally a health_check
+    resource.
+    """
+    routing = routing or {}
+    title = record_name.replace('.', '').replace('*', 'wildcard')
+    properties = {}
+
+    if 'set_identifier' in routing:
+        title += _alnum(routing['set_identifier'])
+        properties['SetIdentifier'] = routing['set_identifier']
+
+    for key, prop in (('weight', 'Weight'), ('region', 'Region'),
+                      ('failover', 'Failover')):
+        if routing.get(key) is not None:
+            properties[prop] = routing[key]
+
+    if routing.get('health_check') is not None:
+        properties['HealthCheckId'] = Ref(routing['health_check'])
+
+    if alias is None:
+        properties['TTL'] = ttl
+        properties['ResourceRecords'] = record_value
+    else:
+        properties['AliasTarget'] = _alias_target(alias,
+                                                  evaluate_target_health)
 
     return stack.stack.add_resource(
         RecordSetType(
-            '{0}'.format(
-                record_name.replace('.', '').replace('*', 'wildcard')),
+            '{0}'.format(title),
             Condition=condition_field,
             HostedZoneName='{0}.'.format(hosted_zone_name),
             Type=record_type,
-            TTL='60',
             Name='{0}.'.format(record_name),
-            ResourceRecords=record_value))
+            **properties))
+
+
+@profiled
+def create_health_check(stack,
+                        name,
+                        target,
+                        port=443,
+                        protocol='HTTPS',
+                        path='/',
+                        interval=30,
+                        failure_threshold=3,
+                        regions=None,
+                        condition_field=''):
+    """Add Route53 HealthCheck Resource.
+
+    target is an ALB from create_alb, probed through its DNS name, or a
+    domain name. protocol is HTTP, HTTPS or TCP.
+    """
+    config = {
+        'Type': protocol,
+        'FullyQualifiedDomainName': target if isinstance(target, str) else
+        GetAtt(target, 'DNSName'),
+        'Port': port,
+        'RequestInterval': interval,
+        'FailureThreshold': failure_threshold
+    }
+
+    if protocol != 'TCP':
+        config['ResourcePath'] = path
+
+    if protocol == 'HTTPS':
+        config['EnableSNI'] = True
+
+    if regions:
+        config['Regions'] = list(regions)
+
+    return stack.stack.add_resource(
+        HealthCheck(
+            '{0}HealthCheck'.format(name),
+            Condition=condition_field,
+            HealthCheckConfig=HealthCheckConfiguration(**config)))
+
+
+def _routing(policy, record_name, endpoints):
+    """Return the routing dict for each endpoint of a routed record."""
+
+    if policy == 'simple':
+        if len(endpoints) != 1:
+            raise ValueError('{0}: simple routing takes one endpoint.'.format(
+                record_name))
+
+        return [{}]
+    names = [endpoint['name'] for endpoint in endpoints]
+
+    if len(set(names)) != len(names):
+        raise ValueError('{0}: endpoint names must be unique.'.format(
+            record_name))
+    routings = [{'set_identifier': name} for name in names]
+
+    if policy == 'latency':
+        for endpoint, routing in zip(endpoints, routings):
+            if not endpoint.get('region'):
+                raise ValueError('{0}: latency endpoint {1} needs a region.'
+                                 .format(record_name, endpoint['name']))
+            routing['region'] = endpoint['region']
+    elif policy == 'weighted':
+        for endpoint, routing in zip(endpoints, routings):
+            routing['weight'] = endpoint.get('weight', 1)
+
+            if not 0 <= routing['weight'] <= 255:
+                raise ValueError('{0}: weight of {1} must be 0 to 255.'
+                                 .format(record_name, endpoint['name']))
+    elif policy == 'failover':
+        roles = [
+            endpoint.get('failover', default)
+            for endpoint, default in zip(endpoints, ('PRIMARY', 'SECONDARY'))
+        ]
+
+        if len(endpoints) != 2 or sorted(roles) != ['PRIMARY', 'SECONDARY']:
+            raise ValueError('{0}: failover takes a PRIMARY and a SECONDARY '
+                             'endpoint.'.format(record_name))
+
+        for role, routing in zip(roles, routings):
+            routing['failover'] = role
+    else:
+        raise ValueError('{0}: unknown routing policy {1}.'.format(
+            record_name, policy))
+
+    return routings
+
+
+@profiled
+def create_dns_routing(stack, hosted_zone_name, services):
+    """Add routed alias records and health checks from an endpoint map.
+
+    services maps each record name to a dict with:
+
+    * policy: 'latency', 'weighted', 'failover' or 'simple'.
+    * type: the record type, 'A' by default.
+    * health_check: create_health_check options shared by the endpoints,
+      or None for no health checks.
+    * endpoints: dicts with a name, an alb from create_alb or a dns_name and
+      hosted_zone_id, and the region (latency), weight (weighted, default
+      1) or failover role (PRIMARY then SECONDARY by default). Set an
+      endpoint's health_check to False to skip its check.
+
+    Every alias also evaluates target health. Returns {record_name:
+    {'records': [...], 'health_checks': [...]}}.
+    """
+    created = {}
+
+    for record_name in sorted(services):
+        service = services[record_name]
+        endpoints = service['endpoints']
+        routings = _routing(service.get('policy', 'simple'), record_name,
+                            endpoints)
+        created[record_name] = {'records': [], 'health_checks': []}
+
+        for endpoint, routing in zip(endpoints, routings):
+            if 'alb' in endpoint:
+                alias = endpoint['alb']
+                target = alias
+            else:
+                alias = (endpoint['dns_name'], endpoint['hosted_zone_id'])
+                target = endpoint['dns_name']
+
+            if service.get('health_check') is not None and \
+                    endpoint.get('health_check', True):
+                routing['health_check'] = create_health_check(
+                    stack,
+                    '{0}{1}'.format(
+                        _alnum(record_name.replace('*', 'wildcard')),
+                        _alnum(endpoint.get('name', ''))),
+                    target,
+                    **service['health_check'])
+                created[record_name]['health_checks'].append(
+                    routing['health_check'])
+            created[record_name]['records'].append(
+                create_or_update_dns_record(
+                    stack,
+                    record_name,
+                    service.get('type', 'A'),
+                    None,
+                    hosted_zone_name,
+                    condition_field=endpoint.get('condition_field', ''),
+                    alias=alias,
+                    routing=routing))
+
+    return created
+
+
+def _policy_values(values, all_behavior='all'):
+    """Map (), 'all' or a list of names to a policy behavior and list."""
+
+    if values == 'all':
+        return all_behavior, None
+
+    if not values:
+        return 'none', None
+
+    return 'whitelist', sorted(values)
+
+
+def _policy_config(cls, kind, values, all_behavior='all'):
+    """Build a cookies, headers or query strings config for a policy."""
+    behavior, names = _policy_values(values, all_behavior)
+    config = {'{0}Behavior'.format(kind): behavior}
+
+    if names:
+        config['{0}s'.format(kind)] = names
+
+    return cls(**config)
+
+
+@profiled
+def create_cache_policy(stack,
+                        name,
+                        default_ttl=86400,
+                        min_ttl=1,
+                        max_ttl=31536000,
+                        headers=(),
+                        cookies=(),
+                        query_strings=()):
+    """Add CloudFront CachePolicy Resource.
+
+    headers, cookies and query_strings form the cache key: (), a list of
+    names, or 'all' for cookies and query strings.
+    """
+    cache_key = backports.ParametersInCacheKeyAndForwardedToOrigin(
+        EnableAcceptEncodingGzip=True,
+        EnableAcceptEncodingBrotli=True,
+        HeadersConfig=_policy_config(backports.CacheHeadersConfig, 'Header',
+                                     headers),
+        CookiesConfig=_policy_config(backports.CacheCookiesConfig, 'Cookie',
+                                     cookies),
+        QueryStringsConfig=_policy_config(backports.CacheQueryStringsConfig,
+                                          'QueryString', query_strings))
+
+    return stack.stack.add_resource(
+        backports.CachePolicy(
+            '{0}CachePolicy'.format(name),
+            CachePolicyConfig=backports.CachePolicyConfig(
+                Name='{0}-{1}'.format(stack.env, name),
+                DefaultTTL=default_ttl,
+                MinTTL=min_ttl,
+                MaxTTL=max_ttl,
+                ParametersInCacheKeyAndForwardedToOrigin=cache_key)))
+
+
+@profiled
+def create_origin_request_policy(stack,
+                                 name,
+                                 headers=(),
+                                 cookies=(),
+                                 query_strings='all'):
+    """Add CloudFront OriginRequestPolicy Resource.
+
+    headers, cookies and query_strings are forwarded outside the cache key:
+    (), a list of names, or 'all'.
+    """
+
+    return stack.stack.add_resource(
+        backports.OriginRequestPolicy(
+            '{0}OriginRequestPolicy'.format(name),
+            OriginRequestPolicyConfig=backports.OriginRequestPolicyConfig(
+                Name='{0}-{1}'.format(stack.env, name),
+                HeadersConfig=_policy_config(
+                    backports.OriginRequestHeadersConfig, 'Header', headers,
+                    'allViewer'),
+                CookiesConfig=_policy_config(
+                    backports.OriginRequestCookiesConfig, 'Cookie', cookies),
+                QueryStringsConfig=_policy_config(
+                    backports.OriginRequestQueryStringsConfig, 'QueryString',
+                    query_strings))))
+
+
+def _policy_id(policy, managed):
+    """Return the ID for a policy resource, managed policy name or ID."""
+
+    if isinstance(policy, str):
+        return managed.get(policy, policy)
+
+    return Ref(policy)
+
+
+def _cache_behavior(cls, origin_id, behavior):
+    """Build a CloudFront cache behavior from a behavior dict."""
+    methods = behavior.get('methods', 'all')
+    properties = {
+        'TargetOriginId': origin_id,
+        'ViewerProtocolPolicy': behavior.get('viewer_protocol',
+                                             'redirect-to-https'),
+        'AllowedMethods': CLOUDFRONT_ALL_METHODS
+        if methods == 'all' else CLOUDFRONT_READ_METHODS,
+        'CachedMethods': CLOUDFRONT_READ_METHODS,
+        'Compress': behavior.get('compress', True),
+        'CachePolicyId': _policy_id(
+            behavior.get('cache_policy', 'CachingDisabled'),
+            MANAGED_CACHE_POLICIES)
+    }
+
+    if behavior.get('origin_request_policy', 'AllViewer') is not None:
+        properties['OriginRequestPolicyId'] = _policy_id(
+            behavior.get('origin_request_policy', 'AllViewer'),
+            MANAGED_ORIGIN_REQUEST_POLICIES)
+
+    if 'path' in behavior:
+        properties['PathPattern'] = behavior['path']
+
+    return cls(**properties)
+
+
+@profiled
+def create_cloudfront_distribution(stack,
+                                   name,
+                                   origin,
+                                   domain_names=(),
+                                   certificate=None,
+                                   hosted_zone_name=None,
+                                   behaviors=(),
+                                   default_behavior=None,
+                                   origin_shield_region=None,
+                                   origin_protocol='https-only',
+                                   origin_domain_name=None,
+                                   origin_headers=None,
+                                   price_class='PriceClass_100',
+                                   condition_field=''):
+    """Add CloudFront Distribution Resource in front of an ALB.
+
+    origin is an ALB or its domain name. An ALB origin not using http-only
+    needs origin_domain_name, a name its certificate covers. behaviors are
+    dicts with a path plus optional cache_policy, origin_request_policy,
+    methods ('all' or 'read'), compress and viewer_protocol;
+    default_behavior takes the same keys without a path. certificate must
+    be an ACM certificate in us-east-1.
+    """
+    if origin_domain_name is None:
+        if not isinstance(origin, str) and origin_protocol != 'http-only':
+            raise ValueError(
+                '{0} origin to {1} needs an origin_domain_name its '
+                'certificate covers, or origin_protocol http-only.'.format(
+                    origin_protocol, origin.title))
+        origin_domain_name = origin if isinstance(origin, str) else GetAtt(
+            origin, 'DNSName')
+    origin_id = '{0}Origin'.format(name)
+    origin_properties = {
+        'Id': origin_id,
+        'DomainName': origin_domain_name,
+        'CustomOriginConfig': CustomOriginConfig(
+            OriginProtocolPolicy=origin_protocol,
+            HTTPPort=80,
+            HTTPSPort=443,
+            OriginSSLProtocols=['TLSv1.2'])
+    }
+
+    if origin_headers:
+        origin_properties['OriginCustomHeaders'] = [
+            OriginCustomHeader(HeaderName=header, HeaderValue=value)
+            for header, value in sorted(origin_headers.items())
+        ]
+
+    if origin_shield_region:
+        origin_properties['OriginShield'] = backports.OriginShield(
+            Enabled=True, OriginShieldRegion=origin_shield_region)
+
+    if certificate is None:
+        if domain_names:
+            raise ValueError('Custom domain names need a certificate.')
+        viewer_certificate = ViewerCertificate(
+            CloudFrontDefaultCertificate=True)
+    else:
+        viewer_certificate = ViewerCertificate(
+            AcmCertificateArn=Ref(certificate),
+            SslSupportMethod='sni-only',
+            MinimumProtocolVersion='TLSv1.2_2021')
+    config = {
+        'Enabled': True,
+        'HttpVersion': 'http2and3',
+        'IPV6Enabled': True,
+        'PriceClass': price_class,
+        'Origins': [backports.Origin(**origin_properties)],
+        'DefaultCacheBehavior': _cache_behavior(
+            backports.DefaultCacheBehavior, origin_id, default_behavior or {}),
+        'ViewerCertificate': viewer_certificate
+    }
+
+    if behaviors:
+        config['CacheBehaviors'] = [
+            _cache_behavior(backports.CacheBehavior, origin_id, behavior)
+            for behavior in behaviors
+        ]
+
+    if domain_names:
+        config['Aliases'] = list(domain_names)
+    distribution = stack.stack.add_resource(
+        Distribution(
+            '{0}Distribution'.format(name),
+            Condition=condition_field,
+            DistributionConfig=DistributionConfig(**config)))
+
+    if hosted_zone_name is not None:
+        for domain_name in domain_names:
+            create_or_update_dns_record(
+                stack,
+                domain_name,
+                'A',
+                None,
+                hosted_zone_name,
+                condition_field=condition_field,
+                alias=(GetAtt(distribution, 'DomainName'),
+                       CLOUDFRONT_HOSTED_ZONE_ID),
+                evaluate_target_health=False)
+
+    return distribution
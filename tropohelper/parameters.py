@@ -1,10 +1,32 @@
-from troposphere import Parameter
+from troposphere import (MAX_MAPPINGS, MAX_PARAMETERS, FindInMap, Parameter,
+                         Ref)
 
+from tropohelper.catalog import instance_types
+from tropohelper.profiling import profiled
 
+MAX_MAPPING_ATTRIBUTES = 200
+
+
+def _add_parameter(stack, parameter):
+    """Add a Parameter, reusing an identical one added by an earlier call."""
+    existing = stack.stack.parameters.get(parameter.title)
+
+    if existing is not None:
+        if existing.to_dict() != parameter.to_dict():
+            raise ValueError('Parameter {0} is already defined differently.'
+                             .format(parameter.title))
+
+        return existing
+
+    return stack.stack.add_parameter(parameter)
+
+
+@profiled
 def create_vpc_param(stack, network):
     """Create a VPC Address Parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             'VPCParam',
             Description='VPC Address',
@@ -19,10 +41,12 @@ def create_vpc_param(stack, network):
         ))
 
 
+@profiled
 def create_subnet_param(stack, name, network):
     """Create a Subnet Parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             '{0}SubnetParam'.format(name),
             Description='{0} Subnet Declaration'.format(name),
@@ -37,10 +61,12 @@ def create_subnet_param(stack, name, network):
         ))
 
 
+@profiled
 def create_ami_param(stack, name):
     """Create an AMI Parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             '{0}AmiIdParam'.format(name),
             Type='String',
@@ -48,10 +74,12 @@ def create_ami_param(stack, name):
             Default='ami-12345678'))
 
 
+@profiled
 def create_ssh_key_param(stack):
     """Create a SSH Key Parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             'SSHKeyParam',
             Type='String',
@@ -59,10 +87,12 @@ def create_ssh_key_param(stack):
             Default=''))
 
 
+@profiled
 def create_bool_param(stack, parameter_name):
     """Create a custom Bool Parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             '{0}BoolParam'.format(parameter_name),
             Type='String',
@@ -72,10 +102,12 @@ def create_bool_param(stack, parameter_name):
         ))
 
 
+@profiled
 def create_dbpass_param(stack):
     """Create a Database Password Parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             'DbPassParam',
             Type='String',
@@ -83,26 +115,26 @@ def create_dbpass_param(stack):
             NoEcho=True))
 
 
+@profiled
 def create_instance_type_param(stack,
                                name,
                                itype='Standard',
-                               default='t2.medium'):
-    """Create an Instance Type Parameter."""
-    instance_sizes = [
-        't2.medium', 't2.large', 't2.xlarge', 't2.2xlarge', 'c5.large',
-        'c5.xlarge', 'c5.2xlarge', 'c5.4xlarge', 'r4.large', 'r4.xlarge',
-        'r4.2xlarge', 'r4.4xlarge', 'm5.large', 'm5.xlarge', 'm5.2xlarge',
-        'm5.4xlarge'
-    ]
-
-    if itype == 'DB':
-        instance_sizes = [
-            'db.t2.medium', 'db.t2.large', 'db.m4.large', 'db.m4.xlarge',
-            'db.m4.2xlarge', 'db.m4.4xlarge', 'db.m3.10xlarge', 'db.r3.large',
-            'db.r3.xlarge', 'db.r3.2xlarge', 'db.r3.4xlarge', 'db.r3.8xlarge'
-        ]
-
-    return stack.stack.add_parameter(
+                               default='t2.medium',
+                               families=None):
+    """Create an Instance Type Parameter.
+
+    AllowedValues come from the instance catalog, EC2 types or RDS classes
+    when itype is 'DB', optionally limited to families such as ['m7g'].
+    """
+    instance_sizes = instance_types('db' if itype == 'DB' else 'ec2',
+                                    families)
+
+    if default not in instance_sizes:
+        raise ValueError('{0} is not an allowed instance type.'.format(
+            default))
+
+    return _add_parameter(
+        stack,
         Parameter(
             '{0}boxsizeParam'.format(name),
             Type='String',
@@ -113,30 +145,176 @@ def create_instance_type_param(stack,
         ))
 
 
-def create_cache_instance_type_param(stack, name):
+@profiled
+def create_cache_instance_type_param(stack,
+                                     name,
+                                     default='cache.t2.small',
+                                     families=None):
     """Create a Cache Instance Type Parameter."""
+    node_types = instance_types('cache', families)
+
+    if default not in node_types:
+        raise ValueError('{0} is not an allowed cache node type.'.format(
+            default))
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             '{0}CacheNodeType'.format(name.replace('-', '')),
-            Description=
-            'The compute and memory capacity of the nodes in the Cache Cluster',
+            Description=('The compute and memory capacity of the nodes in '
+                         'the Cache Cluster'),
             Type='String',
-            Default='cache.t2.small',
-            AllowedValues=[
-                'cache.t2.micro', 'cache.t2.small', 'cache.t2.medium',
-                'cache.m3.medium', 'cache.m4.large', 'cache.m4.2xlarge'
-            ],
+            Default=default,
+            AllowedValues=node_types,
             ConstraintDescription='must select a valid Cache Node type.',
         ))
 
 
+@profiled
 def create_misc_string_param(stack, name, description='String', no_echo=False):
     """Create a Misc. String parameter."""
 
-    return stack.stack.add_parameter(
+    return _add_parameter(
+        stack,
         Parameter(
             '{0}StringParam'.format(name),
             Description='{0}'.format(description),
             Type='String',
             NoEcho=no_echo))
+
+
+class LocalParameterStore(object):
+    """In-memory stand-in for an SSM client's get_parameter."""
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get_parameter(self, Name, WithDecryption=False):
+        """Return a parameter in the shape boto3's SSM client uses."""
+
+        return {'Parameter': {'Name': Name, 'Value': self.values[Name]}}
+
+
+class ParameterResolver(object):
+    """Resolve AMI, instance type and subnet values for the helpers.
+
+    mode is one of:
+
+    * 'parameter': plain CloudFormation parameters, as the create_*_param
+      helpers always produced.
+    * 'ssm': SSM typed parameters defaulting to an SSM path, so operators no
+      longer pass values on deploy.
+    * 'mapping': values looked up in store (a boto3 SSM client or
+      LocalParameterStore) at build time and written to a Mapping, using no
+      parameters at all. Values missing from the store, or beyond the
+      mapping limits, fall back to plain parameters.
+
+    Every method returns a value to pass straight to the helpers, and asking
+    twice for the same name returns the same value.
+    """
+
+    def __init__(self,
+                 stack,
+                 mode='parameter',
+                 store=None,
+                 mapping_name='ResolvedParameters'):
+        if mode not in ('parameter', 'ssm', 'mapping'):
+            raise ValueError('Unknown parameter mode {0}.'.format(mode))
+
+        if mode == 'mapping' and store is None:
+            raise ValueError('mapping mode needs a parameter store.')
+        self.stack = stack
+        self.mode = mode
+        self.store = store
+        self.mapping_name = mapping_name
+        self.resolved = {}
+
+    def ami(self, name, path=None):
+        """Resolve the AMI for name, from path in ssm and mapping modes."""
+
+        return self._resolve(
+            '{0}AmiIdParam'.format(name), path,
+            'AWS::SSM::Parameter::Value<AWS::EC2::Image::Id>',
+            lambda: create_ami_param(self.stack, name))
+
+    def instance_type(self, name, path=None, itype='Standard',
+                      default='t2.medium'):
+        """Resolve the instance type for name."""
+
+        return self._resolve(
+            '{0}boxsizeParam'.format(name), path,
+            'AWS::SSM::Parameter::Value<String>',
+            lambda: create_instance_type_param(self.stack, name, itype,
+                                               default))
+
+    def subnet(self, name, network, path=None):
+        """Resolve the subnet CIDR for name, defaulting to network."""
+
+        return self._resolve(
+            '{0}SubnetParam'.format(name), path,
+            'AWS::SSM::Parameter::Value<String>',
+            lambda: create_subnet_param(self.stack, name, network))
+
+    def _resolve(self, title, path, ssm_type, plain):
+        if title not in self.resolved:
+            self.resolved[title] = self._value(title, path, ssm_type, plain)
+
+        return self.resolved[title]
+
+    def _value(self, title, path, ssm_type, plain):
+        if path is None or self.mode == 'parameter':
+            return self._parameter(title, plain)
+
+        if self.mode == 'ssm' and (self.store is None
+                                   or not self._parameters_full(title)):
+            return self._parameter(
+                title, lambda: _add_parameter(
+                    self.stack,
+                    Parameter(
+                        title,
+                        Type=ssm_type,
+                        Default=path,
+                        Description='SSM parameter {0}'.format(path))))
+
+        value = self._lookup(path)
+        mappings = self.stack.stack.mappings
+
+        if self.mapping_name not in mappings and len(mappings) < MAX_MAPPINGS:
+            self.stack.stack.add_mapping(self.mapping_name, {'Values': {}})
+        mapping = mappings.get(self.mapping_name, {}).get('Values')
+
+        if (value is None or mapping is None
+                or len(mapping) >= MAX_MAPPING_ATTRIBUTES):
+            return self._parameter(title, plain)
+        values = dict(mapping)
+        values[title] = value
+        mappings[self.mapping_name] = dict(mappings[self.mapping_name],
+                                           Values=values)
+
+        return FindInMap(self.mapping_name, 'Values', title)
+
+    def _parameters_full(self, title):
+        parameters = self.stack.stack.parameters
+
+        return title not in parameters and len(parameters) >= MAX_PARAMETERS
+
+    def _parameter(self, title, add):
+        if self._parameters_full(title):
+            raise ValueError(
+                'Parameter {0} would exceed the {1} parameter limit; resolve '
+                'it from a store in mapping mode instead.'.format(
+                    title, MAX_PARAMETERS))
+
+        return Ref(add())
+
+    def _lookup(self, path):
+        try:
+            return self.store.get_parameter(Name=path)['Parameter']['Value']
+        except KeyError:
+            return None
+        except Exception as error:
+            code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+            if code == 'ParameterNotFound':
+                return None
+            raise
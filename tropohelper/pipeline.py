@@ -0,0 +1,250 @@
+"""Asynchronous generate, validate and package pipeline for many stacks.
+
+    report = run_pipeline(
+        [('network', build_network), ('web', build_web)],
+        out_dir='build', store=LocalObjectStore('artifacts'),
+        bucket='templates')
+
+Builders are top level callables returning a stack, Template or dict, so
+they can run in a process pool. Generation and validation (building the
+stack and rendering it canonically) are CPU bound and run in up to
+max_workers processes. Writing, hashing and packaging are I/O bound and run
+on threads, overlapping with generation. At most queue_size rendered
+templates wait for the I/O stages; past that, generation pauses until they
+catch up.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import time
+
+from tropohelper.render import render
+
+STAGES = ('generate', 'validate', 'write', 'hash', 'package')
+
+MAX_TEMPLATE_BYTES = 1024 * 1024
+
+
+class LocalObjectStore(object):
+    """Filesystem stand-in for the S3 client calls the pipeline makes."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def head_object(self, Bucket, Key):
+        """Return the object's size and sha256, raising KeyError if missing."""
+        path = self._path(Bucket, Key)
+
+        if not os.path.exists(path):
+            raise KeyError(Key)
+
+        with open(path, 'rb') as handle:
+            body = handle.read()
+
+        return {
+            'ContentLength': len(body),
+            'Metadata': {
+                'sha256': hashlib.sha256(body).hexdigest()
+            }
+        }
+
+    def put_object(self, Bucket, Key, Body, Metadata=None):
+        """Store Body under Key."""
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as handle:
+            handle.write(Body)
+
+        return {}
+
+
+def _generate(builder, validate):
+    """Build, validate and render one stack; runs in a worker process."""
+    start = time.perf_counter()
+    source = builder()
+    built = time.perf_counter()
+    text = render(source)
+    size = len(text.encode('utf-8'))
+
+    if size > MAX_TEMPLATE_BYTES:
+        raise ValueError('Template is {0} bytes, over the {1} byte limit.'
+                         .format(size, MAX_TEMPLATE_BYTES))
+
+    if validate is not None:
+        validate(text)
+
+    return text, built - start, time.perf_counter() - built
+
+
+def _write(path, body):
+    """Write a rendered template to disk."""
+    with open(path, 'wb') as handle:
+        handle.write(body)
+
+
+def _stored_hash(store, bucket, key):
+    """Return the sha256 recorded for key, or None if it is not stored."""
+
+    try:
+        return store.head_object(Bucket=bucket, Key=key)['Metadata'].get(
+            'sha256')
+    except Exception:
+        # boto3 raises ClientError for a missing key, LocalObjectStore
+        # KeyError; either way there is nothing to compare against.
+        return None
+
+
+def _package(store, bucket, key, body, digest):
+    """Upload body unless the store already holds the same content."""
+
+    if _stored_hash(store, bucket, key) == digest:
+        return False
+    store.put_object(Bucket=bucket, Key=key, Body=body,
+                     Metadata={'sha256': digest})
+
+    return True
+
+
+def _summary(timings):
+    """Aggregate per-stack stage timings."""
+
+    return dict((stage, {
+        'count': len(timings[stage]),
+        'total': sum(timings[stage]),
+        'max': max(timings[stage]) if timings[stage] else 0.0
+    }) for stage in STAGES)
+
+
+async def pipeline(jobs,
+                   out_dir=None,
+                   store=None,
+                   bucket=None,
+                   prefix='',
+                   max_workers=None,
+                   queue_size=4,
+                   io_concurrency=4,
+                   validate=None,
+                   executor=None):
+    """Generate, validate, write, hash and package each (name, builder) job.
+
+    out_dir gets one name.json per stack. store is a boto3 S3 client or
+    LocalObjectStore; each template is uploaded to prefix + name.json in
+    bucket unless the stored copy has the same sha256. validate is an
+    optional callable taking the rendered JSON text and raising on error.
+    executor defaults to a process pool of max_workers.
+
+    Returns {'stacks': [...], 'stages': {...}, 'elapsed': seconds}. Each
+    stack entry has name, size, sha256, path, key, uploaded, timings and,
+    if any stage failed, error; the other stacks carry on regardless.
+    """
+    loop = asyncio.get_event_loop()
+    started = time.perf_counter()
+    max_workers = max_workers or os.cpu_count() or 1
+    own_executor = executor is None
+
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    queue = asyncio.Queue(maxsize=queue_size)
+    slots = asyncio.Semaphore(max_workers)
+    entries = [{'name': name, 'timings': {}} for name, _ in jobs]
+    timings = dict((stage, []) for stage in STAGES)
+
+    def timed(entry, stage, seconds):
+        entry['timings'][stage] = seconds
+        timings[stage].append(seconds)
+
+    def failed(entry, error):
+        entry['error'] = '{0}: {1}'.format(type(error).__name__, error)
+
+    async def generate(entry, builder):
+        # The slot is held until the result is queued, so a full queue
+        # stops new generation instead of piling up rendered templates.
+        async with slots:
+            try:
+                text, build_time, validate_time = await loop.run_in_executor(
+                    executor, _generate, builder, validate)
+            except Exception as error:
+                failed(entry, error)
+
+                return
+            timed(entry, 'generate', build_time)
+            timed(entry, 'validate', validate_time)
+            await queue.put((entry, text))
+
+    async def stage(entry, name, function, *args):
+        start = time.perf_counter()
+        result = await loop.run_in_executor(None, function, *args)
+        timed(entry, name, time.perf_counter() - start)
+
+        return result
+
+    async def package_worker():
+        while True:
+            item = await queue.get()
+
+            if item is None:
+                return
+            entry, text = item
+            body = text.encode('utf-8')
+            entry['size'] = len(body)
+
+            try:
+                if out_dir is not None:
+                    entry['path'] = os.path.join(
+                        out_dir, '{0}.json'.format(entry['name']))
+                    await stage(entry, 'write', _write, entry['path'], body)
+                entry['sha256'] = await stage(
+                    entry, 'hash', lambda: hashlib.sha256(body).hexdigest())
+
+                if store is not None:
+                    entry['key'] = '{0}{1}.json'.format(prefix, entry['name'])
+                    entry['uploaded'] = await stage(
+                        entry, 'package', _package, store, bucket,
+                        entry['key'], body, entry['sha256'])
+            except Exception as error:
+                failed(entry, error)
+
+    workers = [
+        asyncio.ensure_future(package_worker())
+        for _ in range(io_concurrency)
+    ]
+
+    try:
+        await asyncio.gather(*[
+            generate(entry, builder)
+            for entry, (_, builder) in zip(entries, jobs)
+        ])
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+        if own_executor:
+            executor.shutdown()
+
+    return {
+        'stacks': entries,
+        'stages': _summary(timings),
+        'elapsed': time.perf_counter() - started
+    }
+
+
+def run_pipeline(jobs, **options):
+    """Run pipeline() to completion on a new event loop."""
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(pipeline(jobs, **options))
+    finally:
+        loop.close()
@@ -0,0 +1,206 @@
+"""Call profiling for tropohelper helpers.
+
+Every helper is wrapped with profiled, which costs a single global lookup
+while no profile is active:
+
+    with profile(table_sink()):
+        build_stack()
+
+Sinks are callables taking the finished Profiler; table_sink, json_sink
+and pstats_sink cover the common outputs.
+"""
+import contextlib
+import cProfile
+import functools
+import json
+import marshal
+import sys
+import time
+
+_profiler = None
+
+
+class HelperStats(object):
+    """Aggregated timings for one helper."""
+
+    __slots__ = ('name', 'key', 'calls', 'total', 'own', 'resources',
+                 'callers')
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.resources = 0
+        self.callers = {}
+
+    @property
+    def per_call(self):
+        """Average cumulative seconds per call."""
+
+        return self.total / self.calls if self.calls else 0.0
+
+    def to_dict(self):
+        """Return the stats as a JSON friendly dict."""
+
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'total': self.total,
+            'own': self.own,
+            'per_call': self.per_call,
+            'resources': self.resources
+        }
+
+
+class Profiler(object):
+    """Collects HelperStats for helpers called while it is active."""
+
+    def __init__(self, deep=False):
+        self.stats = {}
+        self.cprofile = cProfile.Profile() if deep else None
+        self._frames = []
+
+    def call(self, func, args, kwargs):
+        """Call func, recording its timing and resources added."""
+        stack = args[0] if args else kwargs.get('stack')
+        template = getattr(stack, 'stack', None)
+        resources = getattr(template, 'resources', None)
+        before = len(resources) if resources is not None else 0
+        caller = self._frames[-1][0] if self._frames else None
+        frame = [func, 0.0]
+        self._frames.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._frames.pop()
+
+            if self._frames:
+                self._frames[-1][1] += elapsed
+            stats = self._stats(func)
+            stats.calls += 1
+            stats.total += elapsed
+            stats.own += elapsed - frame[1]
+
+            if resources is not None:
+                stats.resources += len(resources) - before
+
+            if caller is not None:
+                counts = stats.callers.setdefault(
+                    self._stats(caller).key, [0, 0.0])
+                counts[0] += 1
+                counts[1] += elapsed
+
+    def _stats(self, func):
+        name = '{0}.{1}'.format(func.__module__, func.__name__)
+
+        if name not in self.stats:
+            code = func.__code__
+            self.stats[name] = HelperStats(
+                name, (code.co_filename, code.co_firstlineno, func.__name__))
+
+        return self.stats[name]
+
+    def sorted_stats(self):
+        """Return HelperStats ordered by cumulative time, slowest first."""
+
+        return sorted(self.stats.values(), key=lambda s: -s.total)
+
+
+def profiled(func):
+    """Wrap a helper so it is recorded while a profile is active."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _profiler is None:
+            return func(*args, **kwargs)
+
+        return _profiler.call(func, args, kwargs)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def profile(*sinks, **options):
+    """Profile helper calls made inside the block.
+
+    Each sink is called with the Profiler when the block exits. Pass
+    deep=True to also run cProfile, so troposphere and awacs internals show
+    up in pstats_sink output.
+    """
+    global _profiler
+    previous = _profiler
+    profiler = Profiler(deep=options.get('deep', False))
+    _profiler = profiler
+
+    if profiler.cprofile is not None:
+        profiler.cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if profiler.cprofile is not None:
+            profiler.cprofile.disable()
+        _profiler = previous
+
+        for sink in sinks:
+            sink(profiler)
+
+
+def table_sink(stream=None):
+    """Sink printing a fixed width table, slowest helper first."""
+
+    def sink(profiler):
+        out = stream or sys.stdout
+        out.write('{0:<50} {1:>7} {2:>10} {3:>10} {4:>10} {5:>9}\n'.format(
+            'helper', 'calls', 'total(s)', 'own(s)', 'percall', 'resources'))
+
+        for stats in profiler.sorted_stats():
+            out.write(
+                '{0:<50} {1:>7} {2:>10.6f} {3:>10.6f} {4:>10.6f} {5:>9}\n'
+                .format(stats.name, stats.calls, stats.total, stats.own,
+                        stats.per_call, stats.resources))
+
+    return sink
+
+
+def json_sink(stream):
+    """Sink writing the stats as a JSON list to stream."""
+
+    def sink(profiler):
+        json.dump([stats.to_dict() for stats in profiler.sorted_stats()],
+                  stream,
+                  indent=2)
+
+    return sink
+
+
+def pstats_sink(filename):
+    """Sink writing a file loadable with pstats.Stats(filename).
+
+    Deep profiles dump the full cProfile data, otherwise the helper stats are
+    written in the same marshal format.
+    """
+
+    def sink(profiler):
+        if profiler.cprofile is not None:
+            profiler.cprofile.dump_stats(filename)
+
+            return
+        data = {}
+
+        for stats in profiler.stats.values():
+            callers = {
+                key: (count, count, elapsed, elapsed)
+
+                for key, (count, elapsed) in stats.callers.items()
+            }
+            data[stats.key] = (stats.calls, stats.calls, stats.own,
+                               stats.total, callers)
+
+        with open(filename, 'wb') as handle:
+            marshal.dump(data, handle)
+
+    return sink
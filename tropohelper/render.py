@@ -0,0 +1,228 @@
+"""Deterministic, canonical template rendering with content hashes.
+
+The same stack always renders to the same bytes:
+
+* keys are sorted;
+* resource properties troposphere types as boolean or numeric become the
+  strings CloudFormation converts them to anyway, so True, 'True' and
+  'true' (or 0 and '0') render alike;
+* lists whose order CloudFormation ignores (tags, attributes, dimensions)
+  are sorted.
+
+Everything else (Parameters, Mappings, Conditions, free-form text such as
+Description, Metadata, tag values and Lambda environment variables, and
+intrinsic function arguments) is left as written, since CloudFormation
+compares those strings exactly. Every resource, and the template itself,
+gets a sha256 content hash in its Metadata, so pipelines can skip
+unchanged uploads and deploys.
+"""
+import hashlib
+import importlib
+import json
+import pkgutil
+
+import troposphere
+from troposphere import BaseAWSObject
+
+from tropohelper.context import template_dict
+
+HASH_KEY = 'TropohelperContentHash'
+
+UNORDERED_LISTS = {
+    'Dimensions': 'Name',
+    'LoadBalancerAttributes': 'Key',
+    'Tags': 'Key',
+    'TargetGroupAttributes': 'Key',
+}
+
+BOOLEAN_TYPES = ('bool', 'boolean')
+NUMERIC_TYPES = ('double', 'float', 'int', 'integer',
+                 'integer_list_item_checker', 'integer_range_checker',
+                 'network_port', 'positive_integer',
+                 'validate_backup_retention_period', 'validate_iops',
+                 'validate_memory_size')
+
+_VERBATIM_KEYS = ('Description', 'Metadata')
+_SKIP_MODULES = ('dynamodb2', 'template_generator')
+
+_resource_types = None
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+
+        for child in _subclasses(subclass):
+            yield child
+
+
+def _load_resource_types():
+    """Return {resource type: troposphere class}, backports winning."""
+    global _resource_types
+
+    if _resource_types is None:
+        for module in pkgutil.iter_modules(troposphere.__path__):
+            if module.name not in _SKIP_MODULES:
+                importlib.import_module('troposphere.' + module.name)
+        importlib.import_module('tropohelper.backports')
+        _resource_types = dict(
+            (cls.resource_type, cls) for cls in _subclasses(BaseAWSObject)
+            if getattr(cls, 'resource_type', None))
+
+    return _resource_types
+
+
+def _expected(spec, key):
+    """Return the type spec of key in a props dict, if troposphere knows it."""
+    expected = spec.get(key) if isinstance(spec, dict) else None
+
+    if not isinstance(expected, tuple):
+        return None
+    expected = expected[0]
+
+    if isinstance(expected, list):
+        return [_props(expected[0])] if len(expected) == 1 else None
+
+    return _props(expected)
+
+
+def _props(expected):
+    if isinstance(expected, type) and issubclass(expected, BaseAWSObject):
+        return expected.props
+
+    return expected
+
+
+def _scalar(value, spec):
+    """Normalise a typed scalar to the string CloudFormation would see."""
+    kind = getattr(spec, '__name__', None)
+
+    if kind in BOOLEAN_TYPES:
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+
+        if isinstance(value, str) and value.lower() in ('true', 'false'):
+            return value.lower()
+
+    if kind in NUMERIC_TYPES and not isinstance(value, bool):
+        if isinstance(value, int):
+            return str(value)
+
+        if isinstance(value, float):
+            return str(int(value)) if value.is_integer() else repr(value)
+
+    return value
+
+
+def _canonical(value, key=None, spec=None):
+    if key in _VERBATIM_KEYS or key is not None and key.startswith('Fn::'):
+        return value
+
+    if isinstance(value, dict):
+        return dict(
+            (child_key, _canonical(child, child_key,
+                                   _expected(spec, child_key)))
+            for child_key, child in value.items())
+
+    if isinstance(value, list):
+        if key == 'Tags':
+            items = value
+        else:
+            item_spec = spec[0] if isinstance(spec, list) else None
+            items = [_canonical(child, spec=item_spec) for child in value]
+
+        if key in UNORDERED_LISTS:
+            sort_key = UNORDERED_LISTS[key]
+            items = sorted(
+                items,
+                key=lambda item: json.dumps(
+                    item.get(sort_key) if isinstance(item, dict) else item,
+                    sort_keys=True))
+
+        return items
+
+    return _scalar(value, spec)
+
+
+def canonicalize(template):
+    """Return a template dict with typed scalars normalised and unordered
+    lists sorted."""
+    resources = template.get('Resources')
+
+    if not isinstance(resources, dict):
+        return _canonical(template)
+    types = _load_resource_types()
+    canonical = _canonical(dict(
+        (key, value) for key, value in template.items()
+        if key != 'Resources'))
+    canonical['Resources'] = dict(
+        (name, _canonical(resource, spec={'Properties': (
+            types.get(resource.get('Type')), True)}))
+        for name, resource in resources.items())
+
+    return canonical
+
+
+def dumps(value, indent=None):
+    """Serialise value canonically."""
+
+    if indent is None:
+        return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+    return json.dumps(value, sort_keys=True, indent=indent)
+
+
+def content_hash(value):
+    """Return the sha256 hex digest of value's canonical form."""
+
+    return hashlib.sha256(dumps(value).encode('utf-8')).hexdigest()
+
+
+def _hash_into_metadata(body):
+    """Hash body without its own hash entry and store it in its Metadata."""
+    metadata = dict(body.get('Metadata', {}))
+    metadata.pop(HASH_KEY, None)
+    hashed = dict(body, Metadata=metadata)
+
+    if not metadata:
+        del hashed['Metadata']
+    metadata[HASH_KEY] = content_hash(hashed)
+    body['Metadata'] = metadata
+
+    return metadata[HASH_KEY]
+
+
+def canonical_template(source, hashes=True):
+    """Return the canonical dict for a stack, Template or template dict.
+
+    With hashes, each resource's Metadata and the template Metadata get a
+    TropohelperContentHash entry. The hashes cover everything except the
+    hash entries themselves.
+    """
+    template = canonicalize(template_dict(source))
+
+    if not hashes:
+        return template
+
+    for resource in template.get('Resources', {}).values():
+        _hash_into_metadata(resource)
+    _hash_into_metadata(template)
+
+    return template
+
+
+def render(source, hashes=True, indent=None):
+    """Render a stack, Template or template dict to canonical JSON."""
+
+    return dumps(canonical_template(source, hashes=hashes), indent=indent)
+
+
+def resource_hashes(source):
+    """Return {logical_id: content hash} plus the template hash under ''."""
+    template = canonical_template(source)
+    hashes = dict(
+        (name, resource['Metadata'][HASH_KEY])
+        for name, resource in template.get('Resources', {}).items())
+    hashes[''] = template['Metadata'][HASH_KEY]
+
+    return hashes
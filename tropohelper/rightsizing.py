@@ -0,0 +1,305 @@
+"""Capacity and rightsizing report for a tropohelper-built template.
+
+The report works on the rendered template alone, so it runs offline.
+Parameters resolve to the values passed in, or otherwise to their
+Default.
+"""
+from tropohelper.catalog import get_instance_type
+from tropohelper.context import template_dict
+
+KINESIS_SHARD_INGEST_MB = 1.0
+GP2_IOPS_PER_GB = 3
+GP2_MIN_IOPS = 100
+
+CAPACITY_FIELDS = ('vcpu', 'memory', 'network', 'ebs', 'iops', 'throughput')
+
+
+def _resolve(value, template, parameters):
+    """Resolve a Ref to a parameter, returning None for anything dynamic."""
+
+    if isinstance(value, dict):
+        if list(value) != ['Ref']:
+            return None
+        name = value['Ref']
+
+        if name in parameters:
+            return parameters[name]
+
+        return template.get('Parameters', {}).get(name, {}).get('Default')
+
+    return value
+
+
+def _number(value, default=0):
+    """Convert a CloudFormation scalar to a number."""
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return default
+
+
+def _ref_name(value):
+    """Return the logical ID a Ref or GetAtt points at, if any."""
+
+    if isinstance(value, dict):
+        if 'Ref' in value:
+            return value['Ref']
+
+        if 'Fn::GetAtt' in value:
+            return value['Fn::GetAtt'][0]
+
+    return None
+
+
+def _instance_entry(name, resource_type, instance_type, count):
+    """Build a report entry for count instances of instance_type."""
+    entry = {
+        'resource': name,
+        'type': resource_type,
+        'instance_type': instance_type,
+        'count': count
+    }
+
+    try:
+        instance = get_instance_type(instance_type)
+    except KeyError:
+        instance = None
+
+    for field in CAPACITY_FIELDS:
+        entry[field] = 0
+
+    if instance is not None:
+        for field in ('vcpu', 'memory', 'network', 'ebs'):
+            entry[field] = getattr(instance, field) * count
+
+    return entry, instance is None
+
+
+def _find(value, key):
+    """Yield every value stored under key anywhere in a nested structure."""
+
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            if child_key == key:
+                yield child
+
+            for found in _find(child, key):
+                yield found
+    elif isinstance(value, list):
+        for child in value:
+            for found in _find(child, key):
+                yield found
+
+
+def capacity_report(source, parameters=None, target_capacity=None):
+    """Sum provisioned capacity and flag obvious sizing mismatches.
+
+    source is a stack, Template or rendered template dict. parameters
+    overrides parameter defaults, and target_capacity maps target group
+    logical IDs to the number of instances they are expected to need.
+
+    Returns {'resources': [...], 'totals': {...}, 'findings': [...]}, where
+    each resource entry carries vcpu, memory (GiB), network (Gbps), ebs
+    (Mbps), iops and throughput (MB/s) for its whole count.
+    """
+    template = template_dict(source)
+    parameters = parameters or {}
+    target_capacity = target_capacity or {}
+    resources = template.get('Resources', {})
+    report = {'resources': [], 'totals': {}, 'findings': []}
+
+    def finding(name, message):
+        report['findings'].append({'resource': name, 'message': message})
+
+    def value(props, key, default=None):
+        resolved = _resolve(props.get(key), template, parameters)
+
+        return default if resolved is None else resolved
+
+    for name, resource in resources.items():
+        props = resource.get('Properties', {})
+        resource_type = resource.get('Type')
+        entry = None
+        unknown = False
+
+        if resource_type == 'AWS::EC2::Instance':
+            entry, unknown = _instance_entry(name, resource_type,
+                                             value(props, 'InstanceType'), 1)
+        elif resource_type == 'AWS::AutoScaling::AutoScalingGroup':
+            config = resources.get(
+                _ref_name(props.get('LaunchConfigurationName')), {})
+            config_props = config.get('Properties', {})
+            max_size = _number(value(props, 'MaxSize'))
+            min_size = _number(value(props, 'MinSize'))
+            entry, unknown = _instance_entry(
+                name, resource_type, value(config_props, 'InstanceType'),
+                max_size)
+
+            if max_size < min_size:
+                finding(name, 'MaxSize {0} is below MinSize {1}.'.format(
+                    max_size, min_size))
+            zones = props.get('VPCZoneIdentifier')
+
+            if isinstance(zones, list) and max_size < len(zones):
+                finding(name, 'MaxSize {0} cannot cover its {1} subnets.'
+                        .format(max_size, len(zones)))
+        elif resource_type == 'AWS::RDS::DBInstance':
+            count = 2 if str(value(props, 'MultiAZ', False)).lower() == \
+                'true' else 1
+            entry, unknown = _instance_entry(
+                name, resource_type, value(props, 'DBInstanceClass'), count)
+            iops = _number(value(props, 'Iops'))
+
+            if not iops:
+                iops = max(GP2_MIN_IOPS,
+                           GP2_IOPS_PER_GB *
+                           _number(value(props, 'AllocatedStorage')))
+            entry['iops'] = iops * count
+        elif resource_type == 'AWS::ElastiCache::CacheCluster':
+            entry, unknown = _instance_entry(
+                name, resource_type, value(props, 'CacheNodeType'),
+                _number(value(props, 'NumCacheNodes', 1)))
+        elif resource_type == 'AWS::ElastiCache::ReplicationGroup':
+            if 'NumNodeGroups' in props:
+                count = (_number(value(props, 'NumNodeGroups', 1)) *
+                         (_number(value(props, 'ReplicasPerNodeGroup')) + 1))
+            else:
+                count = _number(value(props, 'NumCacheClusters', 1))
+            entry, unknown = _instance_entry(name, resource_type,
+                                             value(props, 'CacheNodeType'),
+                                             count)
+        elif resource_type == 'AWS::Kinesis::Stream':
+            shards = _number(value(props, 'ShardCount', 1))
+            entry = dict((field, 0) for field in CAPACITY_FIELDS)
+            entry.update({
+                'resource': name,
+                'type': resource_type,
+                'instance_type': None,
+                'count': shards,
+                'throughput': shards * KINESIS_SHARD_INGEST_MB
+            })
+
+        if entry is None:
+            continue
+
+        if unknown:
+            finding(name, 'Unknown instance type {0}, capacity not counted.'
+                    .format(entry['instance_type']))
+        report['resources'].append(entry)
+
+    for field in CAPACITY_FIELDS:
+        report['totals'][field] = sum(
+            entry[field] for entry in report['resources'])
+
+    _check_firehose_buffers(template, resources, parameters, finding)
+    _check_target_capacity(template, resources, parameters, target_capacity,
+                           finding)
+
+    return report
+
+
+def _stream_names(resources):
+    """Map Kinesis stream logical IDs and names to their logical ID."""
+    names = {}
+
+    for name, resource in resources.items():
+        if resource.get('Type') == 'AWS::Kinesis::Stream':
+            names[name] = name
+            stream_name = resource.get('Properties', {}).get('Name')
+
+            if isinstance(stream_name, str):
+                names[stream_name] = name
+
+    return names
+
+
+def _check_firehose_buffers(template, resources, parameters, finding):
+    """Flag Firehose buffers a source stream can never fill by size."""
+    streams = _stream_names(resources)
+
+    for name, resource in resources.items():
+        if resource.get('Type') != 'AWS::KinesisFirehose::DeliveryStream':
+            continue
+        props = resource.get('Properties', {})
+        source = props.get('KinesisStreamSourceConfiguration', {})
+        arn = source.get('KinesisStreamARN')
+        stream = _ref_name(arn)
+
+        if stream is None and isinstance(arn, str):
+            stream = streams.get(arn.rsplit('/', 1)[-1].rsplit(':', 1)[-1])
+
+        if stream not in resources:
+            continue
+        shards = _number(
+            _resolve(resources[stream].get('Properties', {}).get(
+                'ShardCount', 1), template, parameters), 1)
+        supply = shards * KINESIS_SHARD_INGEST_MB
+
+        for hints in _find(props, 'BufferingHints'):
+            size = _number(_resolve(hints.get('SizeInMBs'), template,
+                                    parameters), 5)
+            interval = _number(_resolve(hints.get('IntervalInSeconds'),
+                                        template, parameters), 300)
+            demand = float(size) / interval if interval else 0
+
+            if demand > supply:
+                finding(name, ('Buffer of {0}MB per {1}s needs {2:.2f}MB/s '
+                               'but {3} has {4} shard(s) ({5:.2f}MB/s).')
+                        .format(size, interval, demand, stream, shards,
+                                supply))
+
+
+def _check_target_capacity(template, resources, parameters, target_capacity,
+                           finding):
+    """Flag ASGs too small for the ALBs and target groups they serve."""
+    balancer_zones = {}
+
+    for resource in resources.values():
+        if resource.get('Type') not in (
+                'AWS::ElasticLoadBalancingV2::Listener',
+                'AWS::ElasticLoadBalancingV2::ListenerRule'):
+            continue
+        props = resource.get('Properties', {})
+        balancer = _ref_name(props.get('LoadBalancerArn'))
+
+        if balancer is None:
+            listener = resources.get(_ref_name(props.get('ListenerArn')), {})
+            balancer = _ref_name(
+                listener.get('Properties', {}).get('LoadBalancerArn'))
+        subnets = resources.get(balancer, {}).get('Properties', {}).get(
+            'Subnets')
+
+        if not isinstance(subnets, list):
+            continue
+
+        for group in _find(props, 'TargetGroupArn'):
+            group = _ref_name(group)
+            balancer_zones[group] = max(
+                balancer_zones.get(group, 0), len(subnets))
+
+    for name, resource in resources.items():
+        if resource.get('Type') != 'AWS::AutoScaling::AutoScalingGroup':
+            continue
+        props = resource.get('Properties', {})
+        max_size = _number(_resolve(props.get('MaxSize'), template,
+                                    parameters))
+
+        for group in props.get('TargetGroupARNs', []):
+            group = _ref_name(group) or group
+
+            if not isinstance(group, str):
+                continue
+
+            if max_size < balancer_zones.get(group, 0):
+                finding(name, ('MaxSize {0} leaves some of the {1} ALB '
+                               'zones behind {2} without targets.').format(
+                                   max_size, balancer_zones[group], group))
+
+            if max_size < target_capacity.get(group, 0):
+                finding(name, ('MaxSize {0} is below the {1} instances '
+                               '{2} needs.').format(
+                                   max_size, target_capacity[group], group))
@@ -1,13 +1,21 @@
+import fnmatch
+import json
+
 import troposphere.elasticloadbalancingv2 as alb
 from awacs.aws import Action, Allow, Policy, Principal, Statement
 from awacs.sts import AssumeRole
-from troposphere import GetAtt, Output, Ref
+from troposphere import GetAtt, Output, Ref, encode_to_dict
 from troposphere.certificatemanager import Certificate, DomainValidationOption
 from troposphere.ec2 import SecurityGroup, SecurityGroupRule
 from troposphere.iam import (AccessKey, Group, InstanceProfile, ManagedPolicy,
                              Role, User)
 
+from tropohelper.profiling import profiled
+
+IAM_MANAGED_POLICY_MAX_SIZE = 6144
 
+
+@profiled
 def create_iam_role(stack,
                     role_name,
                     managed_policies=(),
@@ -41,6 +49,7 @@ def create_iam_role(stack,
     return new_role
 
 
+@profiled
 def create_iam_group(stack, group_name, managed_policies=()):
     """Add IAM group resource."""
     managed_policy_arns = [
@@ -56,6 +65,7 @@ def create_iam_group(stack, group_name, managed_policies=()):
             ManagedPolicyArns=managed_policy_arns))
 
 
+@profiled
 def create_iam_user(stack, name, groups=()):
     """Add IAM User Resource."""
 
@@ -63,6 +73,7 @@ def create_iam_user(stack, name, groups=()):
         User('{0}User'.format(name), Groups=groups, UserName=name))
 
 
+@profiled
 def create_access_key(stack, name, user):
     """Add IAM User Access/Secret Key Resource."""
     access_key = stack.stack.add_resource(
@@ -79,6 +90,7 @@ def create_access_key(stack, name, user):
             Description='Secret Key for {0}'.format(name)))
 
 
+@profiled
 def create_instance_profile(stack, name, iam_role):
     """Add IAM Instance Profile Resource."""
 
@@ -87,6 +99,7 @@ def create_instance_profile(stack, name, iam_role):
             '{0}InstanceProfile'.format(name), Roles=[Ref(iam_role)]))
 
 
+@profiled
 def create_iam_policy(stack,
                       policy_name,
                       actions,
@@ -118,6 +131,193 @@ def create_iam_policy(stack,
                 ])))
 
 
+def policy_size(policy):
+    """Return the size IAM counts for a policy: its JSON without whitespace."""
+
+    return len(
+        json.dumps(
+            encode_to_dict(policy), separators=(',', ':'), sort_keys=True))
+
+
+def _resource_key(resource):
+    """Return a hashable, comparable key for a plain or intrinsic resource."""
+
+    return json.dumps(encode_to_dict(resource), sort_keys=True)
+
+
+def _collapse_actions(actions, safe_wildcards):
+    """Drop actions covered by a wildcard and apply approved wildcards.
+
+    actions maps lower cased action names to their first spelling. A
+    wildcard from safe_wildcards replaces the actions it matches once it
+    covers at least two of them.
+    """
+    patterns = [action for action in actions if '*' in action]
+
+    for wildcard in safe_wildcards:
+        matched = [
+            action for action in actions
+            if fnmatch.fnmatchcase(action, wildcard.lower())
+        ]
+
+        if len(matched) > 1:
+            actions[wildcard.lower()] = wildcard
+            patterns.append(wildcard.lower())
+
+    return {
+        action: spelling
+
+        for action, spelling in actions.items()
+
+        if not any(pattern != action and fnmatch.fnmatchcase(action, pattern)
+                   for pattern in patterns)
+    }
+
+
+def _policy_statement(actions, resources):
+    """Build an Allow Statement from action names and resources."""
+
+    return Statement(
+        Effect=Allow,
+        Action=[
+            Action(*action.split(':', 1)) if ':' in action else Action(action)
+
+            for action in actions
+        ],
+        Resource=resources)
+
+
+def _split_statement(actions, resources, max_size):
+    """Split one statement on resources, then actions, until it fits."""
+    statement = _policy_statement(actions, resources)
+    size = policy_size(statement)
+
+    if size + policy_size(Policy(Version='2012-10-17', Statement=[])) <= \
+            max_size:
+        return [(statement, size)]
+
+    if len(resources) > 1:
+        middle = len(resources) // 2
+
+        return (_split_statement(actions, resources[:middle], max_size) +
+                _split_statement(actions, resources[middle:], max_size))
+
+    if len(actions) > 1:
+        middle = len(actions) // 2
+
+        return (_split_statement(actions[:middle], resources, max_size) +
+                _split_statement(actions[middle:], resources, max_size))
+
+    raise ValueError('Statement for {0} on {1} exceeds {2} bytes.'.format(
+        actions[0], resources[0], max_size))
+
+
+def compile_iam_policies(grants,
+                         safe_wildcards=(),
+                         max_size=IAM_MANAGED_POLICY_MAX_SIZE):
+    """Compile action/resource grants into as few small policies as possible.
+
+    grants is a list of {'actions': [...], 'resources': [...]} dicts, with
+    resources defaulting to ['*']. Actions are deduplicated case
+    insensitively, actions already covered by a wildcard (including a grant
+    on '*') are dropped, approved safe_wildcards such as 's3:Get*' replace
+    the actions they match, and resources with identical action sets share
+    one statement. Statements are then packed into policies no larger than
+    max_size.
+
+    Returns a list of (Policy, size) tuples, size being the whitespace free
+    byte count IAM checks against its limit.
+    """
+    granted = {}
+    resources = {}
+    spellings = {}
+
+    for grant in grants:
+        for resource in grant.get('resources', ['*']):
+            key = _resource_key(resource)
+            resources.setdefault(key, resource)
+            actions = granted.setdefault(key, {})
+
+            for action in grant['actions']:
+                spelling = spellings.setdefault(action.lower(), action)
+                actions.setdefault(action.lower(), spelling)
+
+    everywhere = granted.get(_resource_key('*'), {})
+    statements = {}
+
+    for key, actions in granted.items():
+        if key != _resource_key('*'):
+            actions = dict(
+                (action, spelling) for action, spelling in actions.items()
+
+                if not any(fnmatch.fnmatchcase(action, pattern)
+                           for pattern in everywhere))
+        actions = _collapse_actions(actions, safe_wildcards)
+
+        if actions:
+            statements.setdefault(
+                tuple(sorted(actions.values(), key=str.lower)),
+                []).append(key)
+
+    sized = []
+
+    for actions, keys in sorted(statements.items()):
+        sized.extend(
+            _split_statement(
+                list(actions), [resources[key] for key in sorted(keys)],
+                max_size))
+
+    base = policy_size(Policy(Version='2012-10-17', Statement=[]))
+    packed = []
+
+    for statement, size in sorted(sized, key=lambda item: -item[1]):
+        for bucket in packed:
+            if bucket[1] + size + 1 <= max_size:
+                bucket[0].append(statement)
+                bucket[1] += size + 1
+
+                break
+        else:
+            packed.append([[statement], base + size])
+
+    policies = [
+        Policy(Version='2012-10-17', Statement=bucket[0]) for bucket in packed
+    ]
+
+    return [(policy, policy_size(policy)) for policy in policies]
+
+
+@profiled
+def create_iam_policies(stack,
+                        policy_name,
+                        grants,
+                        groups=[],
+                        roles=[],
+                        users=[],
+                        safe_wildcards=()):
+    """Add compiled IAM policy resources, split by the managed policy limit.
+
+    Returns a list of (ManagedPolicy, size) tuples.
+    """
+    compiled = compile_iam_policies(grants, safe_wildcards=safe_wildcards)
+    policies = []
+
+    for idx, (document, size) in enumerate(compiled):
+        name = policy_name if len(compiled) == 1 else '{0}{1}'.format(
+            policy_name, idx + 1)
+        policies.append((stack.stack.add_resource(
+            ManagedPolicy(
+                name,
+                ManagedPolicyName=name,
+                Groups=groups,
+                Roles=roles,
+                Users=users,
+                PolicyDocument=document)), size))
+
+    return policies
+
+
+@profiled
 def create_security_group(stack, name, rules=()):
     """Add EC2 Security Group Resource."""
     ingress_rules = []
@@ -147,6 +347,7 @@ def create_security_group(stack, name, rules=()):
         ))
 
 
+@profiled
 def create_alb_cert(stack,
                     name,
                     certificate_arn,
@@ -165,6 +366,7 @@ def create_alb_cert(stack,
             ListenerArn=listener_arn))
 
 
+@profiled
 def create_acm_certificate(stack, domain_name, alternate_names=[]):
     """Add ACM Certificate Resource."""
 
@@ -1,5 +1,7 @@
+import json
+
 import troposphere.elasticache as elasticache
-from troposphere import Ref
+from troposphere import GetAtt, Ref, encode_to_dict
 from troposphere.cloudwatch import Alarm, MetricDimension
 from troposphere.ec2 import SecurityGroup, SecurityGroupRule
 from troposphere.firehose import (
@@ -7,12 +9,23 @@ from troposphere.firehose import (
     EncryptionConfiguration, KinesisStreamSourceConfiguration,
     KMSEncryptionConfig, RedshiftDestinationConfiguration, S3Configuration,
     S3DestinationConfiguration)
-from troposphere.kinesis import Stream
+from troposphere.kinesis import Stream, StreamConsumer
 from troposphere.logs import (LogGroup, LogStream, MetricFilter,
-                              MetricTransformation)
+                              MetricTransformation, SubscriptionFilter)
 from troposphere.sns import Subscription, Topic
 
+from tropohelper.backports import (DestinationConfig, EventSourceMapping,
+                                   OnFailure)
+from tropohelper.profiling import profiled
+from tropohelper.security import create_iam_policy, create_iam_role
+
+MAX_METRIC_FILTERS = 100
+
+MAX_SUBSCRIPTION_FILTERS = 2
+FAILURE_RETRY_ATTEMPTS = 3
 
+
+@profiled
 def create_s3_firehose(stack,
                        name,
                        bucket_arn,
@@ -21,32 +34,47 @@ def create_s3_firehose(stack,
                        buffering_seconds=300,
                        buffering_size=5,
                        compression_format='GZIP',
-                       log_group_name='firehose-streams'):
-    """Add Kinesis S3 Firehose Resource."""
+                       log_group_name='firehose-streams',
+                       source_stream_arn=None,
+                       source_stream_role_arn=None):
+    """Add Kinesis S3 Firehose Resource.
+
+    With source_stream_arn the firehose reads from that Kinesis stream,
+    using source_stream_role_arn, instead of taking direct puts.
+    """
+    firehose = DeliveryStream(
+        '{0}Firehose'.format(name.replace('-', '')),
+        DeliveryStreamName=name,
+        S3DestinationConfiguration=S3DestinationConfiguration(
+            BucketARN=bucket_arn,
+            Prefix=name,
+            BufferingHints=BufferingHints(
+                IntervalInSeconds=buffering_seconds,
+                SizeInMBs=buffering_size),
+            CompressionFormat=compression_format,
+            EncryptionConfiguration=EncryptionConfiguration(
+                KMSEncryptionConfig=KMSEncryptionConfig(
+                    AWSKMSKeyARN=kms_key_arn)),
+            CloudWatchLoggingOptions=CloudWatchLoggingOptions(
+                Enabled=True,
+                LogGroupName=log_group_name,
+                LogStreamName=name),
+            RoleARN=role_arn))
+
+    if source_stream_arn is not None:
+        firehose.DeliveryStreamType = 'KinesisStreamAsSource'
+        firehose.KinesisStreamSourceConfiguration = \
+            KinesisStreamSourceConfiguration(
+                KinesisStreamARN=source_stream_arn,
+                RoleARN=source_stream_role_arn)
 
-    return stack.stack.add_resource(
-        DeliveryStream(
-            '{0}Firehose'.format(name.replace('-', '')),
-            DeliveryStreamName=name,
-            S3DestinationConfiguration=S3DestinationConfiguration(
-                BucketARN=bucket_arn,
-                Prefix=name,
-                BufferingHints=BufferingHints(
-                    IntervalInSeconds=buffering_seconds,
-                    SizeInMBs=buffering_size),
-                CompressionFormat=compression_format,
-                EncryptionConfiguration=EncryptionConfiguration(
-                    KMSEncryptionConfig=KMSEncryptionConfig(
-                        AWSKMSKeyARN=kms_key_arn)),
-                CloudWatchLoggingOptions=CloudWatchLoggingOptions(
-                    Enabled=True,
-                    LogGroupName=log_group_name,
-                    LogStreamName=name),
-                RoleARN=role_arn)))
+    return stack.stack.add_resource(firehose)
 
 
+@profiled
 def create_kinesis_stream(stack, name, shard_count):
-    """Add Kinesis Stream with the specified shard count and default retention period."""
+    """Add Kinesis Stream with the specified shard count and default
+    retention period."""
 
     return stack.stack.add_resource(
         Stream(
@@ -55,6 +83,104 @@ def create_kinesis_stream(stack, name, shard_count):
             Name='{0}Stream'.format(name)))
 
 
+@profiled
+def create_kinesis_consumer(stack,
+                            name,
+                            stream,
+                            function_name,
+                            batch_size=100,
+                            batching_window=0,
+                            parallelization_factor=1,
+                            bisect_on_error=True,
+                            maximum_retry_attempts=None,
+                            maximum_record_age=-1,
+                            failure_destination_arn=None,
+                            enhanced_fan_out=False,
+                            starting_position='LATEST',
+                            sns_topic_arn=None,
+                            iterator_age_threshold=60000,
+                            iterator_age_periods='5'):
+    """Add a Lambda event source mapping consuming a Kinesis stream.
+
+    stream is a resource from create_kinesis_stream or a stream ARN.
+    maximum_retry_attempts defaults to 3 with failure_destination_arn and
+    -1 (unlimited) without; maximum_record_age is in seconds, -1 for none.
+    enhanced_fan_out reads through a StreamConsumer, and sns_topic_arn adds
+    an IteratorAge alarm. Returns {'mapping', 'consumer', 'alarm'}.
+    """
+
+    if not 1 <= batch_size <= 10000:
+        raise ValueError('batch_size must be 1 to 10000.')
+
+    if not 0 <= batching_window <= 300:
+        raise ValueError('batching_window must be 0 to 300 seconds.')
+
+    if not 1 <= parallelization_factor <= 10:
+        raise ValueError('parallelization_factor must be 1 to 10.')
+
+    if maximum_retry_attempts is None:
+        maximum_retry_attempts = -1 if failure_destination_arn is None \
+            else FAILURE_RETRY_ATTEMPTS
+
+    if not -1 <= maximum_retry_attempts <= 10000:
+        raise ValueError('maximum_retry_attempts must be -1 to 10000.')
+
+    if maximum_record_age != -1 and not 60 <= maximum_record_age <= 604800:
+        raise ValueError('maximum_record_age must be -1 or 60 to 604800.')
+
+    if failure_destination_arn is not None and \
+            maximum_retry_attempts == maximum_record_age == -1:
+        raise ValueError('Records are retried until they expire, so '
+                         'nothing reaches the failure destination.')
+    title = name.replace('-', '')
+    stream_arn = GetAtt(stream, 'Arn') if hasattr(stream, 'title') else stream
+    consumer = None
+
+    if enhanced_fan_out:
+        consumer = stack.stack.add_resource(
+            StreamConsumer(
+                '{0}StreamConsumer'.format(title),
+                ConsumerName=name,
+                StreamARN=stream_arn))
+        stream_arn = GetAtt(consumer, 'ConsumerARN')
+    mapping = EventSourceMapping(
+        '{0}EventSourceMapping'.format(title),
+        EventSourceArn=stream_arn,
+        FunctionName=function_name,
+        StartingPosition=starting_position,
+        BatchSize=batch_size,
+        MaximumBatchingWindowInSeconds=batching_window,
+        ParallelizationFactor=parallelization_factor,
+        BisectBatchOnFunctionError=bisect_on_error,
+        MaximumRetryAttempts=maximum_retry_attempts)
+
+    if maximum_record_age != -1:
+        mapping.MaximumRecordAgeInSeconds = maximum_record_age
+
+    if failure_destination_arn is not None:
+        mapping.DestinationConfig = DestinationConfig(
+            OnFailure=OnFailure(Destination=failure_destination_arn))
+    mapping = stack.stack.add_resource(mapping)
+    alarm = None
+
+    if sns_topic_arn is not None:
+        alarm = create_sns_notification_alarm(
+            stack,
+            '{0}-iterator-age'.format(name),
+            'Kinesis consumer {0} is falling behind its stream.'.format(name),
+            'IteratorAge',
+            'AWS/Lambda',
+            sns_topic_arn,
+            threshold=str(iterator_age_threshold),
+            evaluation_periods=iterator_age_periods,
+            statistic='Maximum',
+            dimensions={'FunctionName': function_name},
+            treatMissingData='notBreaching')
+
+    return {'mapping': mapping, 'consumer': consumer, 'alarm': alarm}
+
+
+@profiled
 def create_json_redshift_firehose_from_stream(stack,
                                               name,
                                               firehose_arn,
@@ -73,7 +199,8 @@ def create_json_redshift_firehose_from_stream(stack,
                                               s3_buffering_seconds=300,
                                               s3_buffering_size=5,
                                               s3_compression_format='GZIP'):
-    """Add Kinesus Redshift Firehose Resource with another Kinesis Stream as source and json as payload."""
+    """Add Kinesus Redshift Firehose Resource with another Kinesis Stream
+    as source and json as payload."""
 
     return stack.stack.add_resource(
         DeliveryStream(
@@ -113,6 +240,7 @@ def create_json_redshift_firehose_from_stream(stack,
                 Username=redshift_username)))
 
 
+@profiled
 def create_cloud_watch_logs_metric_filter(stack,
                                           name,
                                           log_group_name,
@@ -120,7 +248,8 @@ def create_cloud_watch_logs_metric_filter(stack,
                                           metric_namespace='LogMetrics',
                                           metric_value='1',
                                           metric_default_value=0.0):
-    """Add a Cloud Watch logs metric filter pointing to an existing log group."""
+    """Add a Cloud Watch logs metric filter pointing to an existing log
+    group."""
 
     return stack.stack.add_resource(
         MetricFilter(
@@ -136,6 +265,7 @@ def create_cloud_watch_logs_metric_filter(stack,
             ]))
 
 
+@profiled
 def create_log_group(stack, name, custom_name=False, retention_in_days=7):
     """Add a log group."""
     lg = LogGroup(
@@ -148,6 +278,7 @@ def create_log_group(stack, name, custom_name=False, retention_in_days=7):
     return stack.stack.add_resource(lg)
 
 
+@profiled
 def create_log_stream(stack, log_group, name, custom_name=False):
     ls = LogStream(
         '{0}LogStream'.format(name.replace('-', '')), LogGroupName=log_group)
@@ -158,6 +289,165 @@ def create_log_stream(stack, log_group, name, custom_name=False):
     return stack.stack.add_resource(ls)
 
 
+def _log_group_filters(stack, resource_type, log_group_name):
+    """Count the filters of resource_type already on a log group."""
+    log_group_name = encode_to_dict(log_group_name)
+
+    return sum(
+        1 for resource in stack.stack.resources.values()
+
+        if resource.resource_type == resource_type and encode_to_dict(
+            resource.properties.get('LogGroupName')) == log_group_name)
+
+
+def _filter_pattern(pattern):
+    """Return a filter pattern, building JSON patterns from dicts.
+
+    {'level': 'ERROR', 'status': 500} matches JSON log events with both
+    fields, as { ($.level = "ERROR") && ($.status = 500) }.
+    """
+
+    if not isinstance(pattern, dict):
+        return pattern
+    terms = []
+
+    for field, value in sorted(pattern.items()):
+        if isinstance(value, str):
+            value = json.dumps(value)
+        terms.append('($.{0} = {1})'.format(field, value))
+
+    return '{{ {0} }}'.format(' && '.join(terms))
+
+
+@profiled
+def create_metric_filters(stack,
+                          log_group_name,
+                          schema,
+                          metric_namespace='LogMetrics',
+                          max_filters=MAX_METRIC_FILTERS):
+    """Add a metric filter for each row of a log schema table.
+
+    Each row is a dict with a name, a pattern (a filter pattern string or
+    a dict of JSON fields to match) and optionally a value (default '1',
+    or a field such as '$.latency') and a default (0.0). Raises ValueError
+    if the log group would have more than max_filters metric filters, the
+    CloudWatch Logs limit by default.
+    """
+    existing = _log_group_filters(stack, MetricFilter.resource_type,
+                                  log_group_name)
+
+    if existing + len(schema) > max_filters:
+        raise ValueError(
+            'Log group would have {0} metric filters, over the limit of {1}.'
+            .format(existing + len(schema), max_filters))
+
+    return [
+        create_cloud_watch_logs_metric_filter(
+            stack,
+            row['name'],
+            log_group_name,
+            _filter_pattern(row['pattern']),
+            metric_namespace=metric_namespace,
+            metric_value=row.get('value', '1'),
+            metric_default_value=float(row.get('default', 0.0)))
+
+        for row in schema
+    ]
+
+
+@profiled
+def create_log_subscription(stack,
+                            name,
+                            log_group_name,
+                            destination_arn,
+                            role_arn,
+                            filter_pattern=''):
+    """Add a subscription filter sending a log group to a destination.
+
+    Raises ValueError if the log group already has the maximum number of
+    subscription filters.
+    """
+
+    if _log_group_filters(stack, SubscriptionFilter.resource_type,
+                          log_group_name) >= MAX_SUBSCRIPTION_FILTERS:
+        raise ValueError(
+            'Log group already has {0} subscription filters.'.format(
+                MAX_SUBSCRIPTION_FILTERS))
+
+    return stack.stack.add_resource(
+        SubscriptionFilter(
+            '{0}SubscriptionFilter'.format(name.replace('-', '')),
+            DestinationArn=destination_arn,
+            FilterPattern=_filter_pattern(filter_pattern),
+            LogGroupName=log_group_name,
+            RoleArn=role_arn))
+
+
+@profiled
+def create_log_pipeline(stack,
+                        name,
+                        log_groups,
+                        bucket_arn,
+                        kms_key_arn,
+                        s3_role_arn,
+                        shard_count=1,
+                        filter_pattern='',
+                        buffering_seconds=300,
+                        buffering_size=5):
+    """Send log groups to S3 through a Kinesis stream and a firehose.
+
+    log_groups maps a subscription name to a log group name. The stream
+    comes from create_kinesis_stream and the firehose from
+    create_s3_firehose; the roles letting CloudWatch Logs write to the
+    stream and the firehose read from it are added too. Returns {'stream',
+    'firehose', 'subscriptions'}.
+    """
+    stream = create_kinesis_stream(stack, name, shard_count)
+    title = name.replace('-', '')
+    logs_role = create_iam_role(stack, '{0}-logs'.format(name),
+                                service=['logs.amazonaws.com'])
+    logs_policy = create_iam_policy(
+        stack, '{0}LogsToStream'.format(title),
+        ['kinesis:PutRecord', 'kinesis:PutRecords'],
+        roles=[Ref(logs_role)],
+        resources=[GetAtt(stream, 'Arn')])
+    source_role = create_iam_role(stack, '{0}-firehose-source'.format(name),
+                                  service=['firehose.amazonaws.com'])
+    source_policy = create_iam_policy(
+        stack, '{0}StreamToFirehose'.format(title), [
+            'kinesis:DescribeStream', 'kinesis:GetRecords',
+            'kinesis:GetShardIterator', 'kinesis:ListShards'
+        ],
+        roles=[Ref(source_role)],
+        resources=[GetAtt(stream, 'Arn')])
+    firehose = create_s3_firehose(
+        stack,
+        name,
+        bucket_arn,
+        kms_key_arn,
+        s3_role_arn,
+        buffering_seconds=buffering_seconds,
+        buffering_size=buffering_size,
+        source_stream_arn=GetAtt(stream, 'Arn'),
+        source_stream_role_arn=GetAtt(source_role, 'Arn'))
+    firehose.DependsOn = [source_policy.title]
+    subscriptions = []
+
+    for subscription_name, log_group_name in sorted(log_groups.items()):
+        subscription = create_log_subscription(
+            stack, subscription_name, log_group_name, GetAtt(stream, 'Arn'),
+            GetAtt(logs_role, 'Arn'), filter_pattern)
+        subscription.DependsOn = [logs_policy.title]
+        subscriptions.append(subscription)
+
+    return {
+        'stream': stream,
+        'firehose': firehose,
+        'subscriptions': subscriptions
+    }
+
+
+@profiled
 def create_sns_topic(stack, name, endpoint, protocol='https'):
     """Add a SNS topic."""
 
@@ -169,6 +459,7 @@ def create_sns_topic(stack, name, endpoint, protocol='https'):
             TopicName='{0}Topic'.format(name)))
 
 
+@profiled
 def create_sns_notification_alarm(stack,
                                   name,
                                   description,
@@ -184,7 +475,8 @@ def create_sns_notification_alarm(stack,
                                   treatMissingData='missing'):
     """Add SNS notification alarm for a cloud watch log metric which triggers alarm based on the specified criteria."""
     dimensions = dimensions or {}
-    dimensions_list = [MetricDimension(Name=k, Value=v) for k,v in dimensions.items()]
+    dimensions_list = [MetricDimension(Name=k, Value=v)
+                       for k, v in sorted(dimensions.items())]
 
     return stack.stack.add_resource(
         Alarm(
@@ -204,6 +496,7 @@ def create_sns_notification_alarm(stack,
             TreatMissingData=treatMissingData))
 
 
+@profiled
 def create_cache_cluster(stack, name, cache_type, vpc, cidrs, subnet_ids,
                          instance_type, num_cache_clusters):
     """Add Elasticache Cache cluster Resource."""
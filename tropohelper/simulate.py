@@ -0,0 +1,386 @@
+"""Offline deploy simulator for tropohelper templates.
+
+simulate() plays a rendered template through a fake CloudFormation
+engine. It works out which resources exist for the given parameter values,
+resolves Refs, GetAtts and the other intrinsic functions against fake
+physical IDs, and starts each resource as soon as everything it depends on
+has finished. Resources take a configurable time per type. The report gives
+the simulated total deploy time, the maximum number of resources in flight
+and the critical path, so topology changes can be compared without AWS.
+
+An empty Condition, which helpers emit when condition_field is left at its
+default, means the resource is unconditional.
+"""
+import heapq
+
+from tropohelper.changeset import compare
+from tropohelper.conditions import evaluate_conditions
+from tropohelper.context import template_dict
+
+DEFAULT_LATENCY = 10.0
+
+DEFAULT_LATENCIES = {
+    'AWS::AutoScaling::AutoScalingGroup': 60.0,
+    'AWS::AutoScaling::LaunchConfiguration': 2.0,
+    'AWS::CertificateManager::Certificate': 300.0,
+    'AWS::CloudFront::Distribution': 900.0,
+    'AWS::CloudWatch::Alarm': 2.0,
+    'AWS::EC2::EIP': 5.0,
+    'AWS::EC2::Instance': 60.0,
+    'AWS::EC2::InternetGateway': 15.0,
+    'AWS::EC2::NatGateway': 120.0,
+    'AWS::EC2::Route': 2.0,
+    'AWS::EC2::RouteTable': 5.0,
+    'AWS::EC2::SecurityGroup': 5.0,
+    'AWS::EC2::Subnet': 5.0,
+    'AWS::EC2::SubnetRouteTableAssociation': 2.0,
+    'AWS::EC2::TransitGateway': 300.0,
+    'AWS::EC2::TransitGatewayAttachment': 120.0,
+    'AWS::EC2::VPC': 5.0,
+    'AWS::EC2::VPCEndpoint': 60.0,
+    'AWS::EC2::VPCGatewayAttachment': 15.0,
+    'AWS::EC2::VPCPeeringConnection': 10.0,
+    'AWS::ElastiCache::CacheCluster': 300.0,
+    'AWS::ElastiCache::ReplicationGroup': 600.0,
+    'AWS::ElasticLoadBalancing::LoadBalancer': 30.0,
+    'AWS::ElasticLoadBalancingV2::Listener': 5.0,
+    'AWS::ElasticLoadBalancingV2::ListenerRule': 5.0,
+    'AWS::ElasticLoadBalancingV2::LoadBalancer': 180.0,
+    'AWS::ElasticLoadBalancingV2::TargetGroup': 5.0,
+    'AWS::IAM::InstanceProfile': 120.0,
+    'AWS::IAM::ManagedPolicy': 10.0,
+    'AWS::IAM::Role': 15.0,
+    'AWS::Kinesis::Stream': 30.0,
+    'AWS::Kinesis::StreamConsumer': 30.0,
+    'AWS::KinesisFirehose::DeliveryStream': 60.0,
+    'AWS::Lambda::EventSourceMapping': 60.0,
+    'AWS::Logs::LogGroup': 2.0,
+    'AWS::RDS::DBInstance': 600.0,
+    'AWS::RDS::DBProxy': 300.0,
+    'AWS::RDS::DBProxyTargetGroup': 180.0,
+    'AWS::Route53::RecordSet': 60.0,
+    'AWS::SNS::Topic': 5.0,
+}
+
+PSEUDO_PARAMETERS = {
+    'AWS::AccountId': '123456789012',
+    'AWS::NotificationARNs': [],
+    'AWS::Partition': 'aws',
+    'AWS::Region': 'us-east-1',
+    'AWS::StackName': 'simulated',
+    'AWS::URLSuffix': 'amazonaws.com',
+}
+
+_NO_VALUE = object()
+
+
+class _Resolver(object):
+    """Evaluates conditions and intrinsic functions for one template."""
+
+    def __init__(self, template, parameters, pseudo):
+        self.template = template
+        self.parameters = parameters
+        self.pseudo = pseudo
+        self.resources = template.get('Resources', {})
+        self.conditions = evaluate_conditions(
+            template, dict(pseudo, **parameters), use_defaults=True)
+        self.created = set()
+
+    def parameter(self, name):
+        """Return a parameter's value, splitting list types."""
+
+        if name in self.pseudo:
+            return self.pseudo[name]
+
+        if name == 'AWS::NoValue':
+            return _NO_VALUE
+        definition = self.template.get('Parameters', {}).get(name)
+
+        if definition is None:
+            raise ValueError('Unknown parameter or resource {0}.'.format(name))
+
+        if name in self.parameters:
+            value = self.parameters[name]
+        elif 'Default' in definition:
+            value = definition['Default']
+        else:
+            raise ValueError('No value for parameter {0}.'.format(name))
+
+        if isinstance(value, str) and (
+                definition.get('Type', '').startswith('List<')
+                or definition.get('Type') == 'CommaDelimitedList'):
+            return value.split(',')
+
+        return value
+
+    def condition(self, name):
+        """Return whether the named condition holds."""
+
+        if name == '':
+            return True
+
+        if name not in self.conditions:
+            raise ValueError('Unknown condition {0}.'.format(name))
+
+        if self.conditions[name] is None:
+            raise ValueError('Cannot evaluate condition {0}.'.format(name))
+
+        return self.conditions[name]
+
+    def physical_id(self, name):
+        return '{0}-{1}'.format(self.pseudo['AWS::StackName'], name)
+
+    def reference(self, name, found):
+        """Record a dependency on a resource, which must be created."""
+
+        if name not in self.created:
+            if name in self.resources:
+                raise ValueError(
+                    '{0} is referenced but its condition is false.'.format(
+                        name))
+            raise ValueError('Unknown resource {0}.'.format(name))
+        found.add(name)
+
+    def resolve(self, value, found):
+        """Resolve value, adding the resources it refers to to found."""
+
+        if isinstance(value, list):
+            resolved = [self.resolve(child, found) for child in value]
+
+            return [child for child in resolved if child is not _NO_VALUE]
+
+        if not isinstance(value, dict):
+            return value
+
+        if len(value) == 1:
+            function, args = list(value.items())[0]
+            handler = _FUNCTIONS.get(function)
+
+            if handler is not None:
+                return handler(self, args, found)
+
+        resolved = {}
+
+        for key, child in value.items():
+            child = self.resolve(child, found)
+
+            if child is not _NO_VALUE:
+                resolved[key] = child
+
+        return resolved
+
+
+def _ref(resolver, name, found):
+    if name in resolver.resources:
+        resolver.reference(name, found)
+
+        return resolver.physical_id(name)
+
+    return resolver.parameter(name)
+
+
+def _get_att(resolver, args, found):
+    if isinstance(args, str):
+        args = args.split('.', 1)
+    resolver.reference(args[0], found)
+
+    return '{0}.{1}'.format(resolver.physical_id(args[0]),
+                            resolver.resolve(args[1], found))
+
+
+def _if(resolver, args, found):
+    branch = args[1] if resolver.condition(args[0]) else args[2]
+
+    return resolver.resolve(branch, found)
+
+
+def _join(resolver, args, found):
+    return args[0].join(
+        str(part) for part in resolver.resolve(args[1], found))
+
+
+def _select(resolver, args, found):
+    return resolver.resolve(args[1], found)[int(resolver.resolve(args[0],
+                                                                 found))]
+
+
+def _sub(resolver, args, found):
+    if isinstance(args, str):
+        text, variables = args, {}
+    else:
+        text, variables = args[0], resolver.resolve(args[1], found)
+    parts = text.split('${')
+    result = [parts[0]]
+
+    for part in parts[1:]:
+        name, rest = part.split('}', 1)
+
+        if name.startswith('!'):
+            result.append('${' + name[1:] + '}' + rest)
+            continue
+
+        if name in variables:
+            value = variables[name]
+        elif '.' in name:
+            value = _get_att(resolver, name, found)
+        else:
+            value = _ref(resolver, name, found)
+        result.append('{0}{1}'.format(value, rest))
+
+    return ''.join(result)
+
+
+def _find_in_map(resolver, args, found):
+    name, first, second = [resolver.resolve(arg, found) for arg in args]
+
+    return resolver.template['Mappings'][name][first][second]
+
+
+def _get_azs(resolver, args, found):
+    region = resolver.resolve(args, found) or resolver.pseudo['AWS::Region']
+
+    return ['{0}{1}'.format(region, zone) for zone in 'abc']
+
+
+_FUNCTIONS = {
+    'Ref': _ref,
+    'Fn::GetAtt': _get_att,
+    'Fn::If': _if,
+    'Fn::Join': _join,
+    'Fn::Select': _select,
+    'Fn::Sub': _sub,
+    'Fn::FindInMap': _find_in_map,
+    'Fn::GetAZs': _get_azs,
+    'Fn::Base64': lambda resolver, args, found: resolver.resolve(args, found),
+    'Fn::ImportValue': lambda resolver, args, found: 'import:{0}'.format(
+        resolver.resolve(args, found)),
+}
+
+
+def _order(resources, resolver):
+    """Resolve each created resource and return {name: dependencies}."""
+    dependencies = {}
+
+    for name, resource in sorted(resources.items()):
+        found = set()
+        resource['Properties'] = resolver.resolve(
+            resource.get('Properties', {}), found)
+        depends_on = resource.get('DependsOn', [])
+
+        for dependency in [depends_on] if isinstance(depends_on,
+                                                     str) else depends_on:
+            resolver.reference(dependency, found)
+        dependencies[name] = found
+
+    return dependencies
+
+
+def simulate(source,
+             parameters=None,
+             latencies=None,
+             default_latency=DEFAULT_LATENCY,
+             previous=None,
+             max_parallel=None,
+             pseudo_parameters=None):
+    """Simulate creating, or updating from previous, a template.
+
+    source and previous are stacks, Templates, rendered dicts or JSON text.
+    parameters overrides parameter defaults and latencies overrides
+    DEFAULT_LATENCIES (seconds per resource type). With previous, only
+    added and modified resources take time. max_parallel caps the number of
+    resources in flight, which CloudFormation itself does not.
+
+    Returns {'total_time', 'max_parallelism', 'critical_path', 'resources',
+    'skipped', 'removed'}. resources maps each created logical ID to its
+    type, start, end, physical_id, resolved properties and dependencies.
+    Raises ValueError for unknown references, references to resources whose
+    condition is false, and dependency cycles.
+    """
+    template = template_dict(source)
+    durations = dict(DEFAULT_LATENCIES, **(latencies or {}))
+    pseudo = dict(PSEUDO_PARAMETERS, **(pseudo_parameters or {}))
+    resolver = _Resolver(template, parameters or {}, pseudo)
+    resources = {}
+    skipped = []
+
+    for name, resource in template.get('Resources', {}).items():
+        if resolver.condition(resource.get('Condition', '')):
+            resources[name] = dict(resource)
+            resolver.created.add(name)
+        else:
+            skipped.append(name)
+    dependencies = _order(resources, resolver)
+    changed = None
+    removed = []
+
+    if previous is not None:
+        changed = set()
+
+        for change in compare(previous, template):
+            if change['action'] == 'remove':
+                removed.append(change['logical_id'])
+            else:
+                changed.add(change['logical_id'])
+
+    def duration(name):
+        if changed is not None and name not in changed:
+            return 0.0
+
+        return float(durations.get(resources[name]['Type'], default_latency))
+
+    waiting = dict((name, set(found)) for name, found in dependencies.items())
+    dependents = dict((name, []) for name in resources)
+
+    for name, found in dependencies.items():
+        for dependency in found:
+            dependents[dependency].append(name)
+    ready = sorted(name for name, found in waiting.items() if not found)
+    running = []
+    report = {}
+    blocker = {}
+    now = 0.0
+    peak = 0
+
+    while ready or running:
+        while ready and (max_parallel is None or len(running) < max_parallel):
+            name = ready.pop(0)
+            end = now + duration(name)
+            report[name] = {
+                'type': resources[name]['Type'],
+                'start': now,
+                'end': end,
+                'physical_id': resolver.physical_id(name),
+                'properties': resources[name]['Properties'],
+                'dependencies': sorted(dependencies[name])
+            }
+            heapq.heappush(running, (end, name))
+        peak = max(peak, len(running))
+        now, name = heapq.heappop(running)
+
+        for dependent in dependents[name]:
+            waiting[dependent].discard(name)
+            blocker[dependent] = name
+
+            if not waiting[dependent]:
+                ready.append(dependent)
+        ready.sort()
+
+    if len(report) < len(resources):
+        raise ValueError('Dependency cycle between {0}.'.format(', '.join(
+            sorted(set(resources) - set(report)))))
+    path = []
+    name = max(report, key=lambda key: (report[key]['end'], key)) \
+        if report else None
+
+    while name is not None:
+        path.append(name)
+        name = blocker.get(name)
+
+    return {
+        'total_time': now,
+        'max_parallelism': peak,
+        'critical_path': path[::-1],
+        'resources': report,
+        'skipped': sorted(skipped),
+        'removed': removed
+    }
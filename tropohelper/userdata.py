@@ -0,0 +1,189 @@
+"""Compressed multipart cloud-init user data.
+
+    user_data = build_user_data([
+        script_part(BOOTSTRAP),
+        cloud_config_part({'packages': ['nginx']}),
+        file_part('/etc/app.conf', APP_CONFIG),
+    ])
+    create_launch_config(stack, 'web', ami, groups, itype, profile,
+                         user_data=user_data)
+
+build_user_data() assembles the parts into a gzip-compressed MIME
+multipart document, checks it against the EC2 user data limit and returns
+it base64 encoded. The helpers in instances.py pass encoded user data
+through as is. Parts are literal text; intrinsic functions cannot be
+compressed, so keep dynamic values in tags, parameters or SSM.
+
+The output is deterministic, so the same parts always give the same
+payload. UserDataStore keeps each distinct payload once in a Mapping, so
+many launch configs sharing a bootstrap add it to the template once.
+"""
+import base64
+import gzip
+import hashlib
+import io
+import json
+from collections import namedtuple
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from troposphere import MAX_MAPPINGS, FindInMap
+
+from tropohelper.parameters import MAX_MAPPING_ATTRIBUTES
+
+USER_DATA_MAX_BYTES = 16384
+
+CLOUD_CONFIG_MERGE = 'list(append)+dict(no_replace,recurse_list)+str()'
+
+Part = namedtuple('Part', ['content_type', 'content', 'filename'])
+
+
+class EncodedUserData(str):
+    """Base64 user data the instance helpers use without re-encoding."""
+
+
+class StoredUserData(FindInMap):
+    """A Mapping lookup of EncodedUserData, from UserDataStore."""
+
+
+ENCODED_TYPES = (EncodedUserData, StoredUserData)
+
+
+def script_part(script, filename=None):
+    """Return a shell script part, run once on first boot."""
+
+    return Part('text/x-shellscript', script, filename)
+
+
+def boothook_part(script, filename=None):
+    """Return a boothook part, run early on every boot."""
+
+    return Part('text/cloud-boothook', script, filename)
+
+
+def cloud_config_part(config, filename=None):
+    """Return a cloud-config part from a dict.
+
+    Multiple cloud-config parts are merged, appending lists, so packages
+    and write_files from several parts add up.
+    """
+
+    return Part('text/cloud-config',
+                '#cloud-config\n{0}\n'.format(json.dumps(config,
+                                                         sort_keys=True)),
+                filename)
+
+
+def file_part(path, content, permissions='0644', owner='root:root'):
+    """Return a cloud-config part writing content to path."""
+
+    return cloud_config_part({
+        'write_files': [{
+            'path': path,
+            'content': content,
+            'permissions': permissions,
+            'owner': owner
+        }]
+    })
+
+
+def _gzip(data):
+    """Compress data with a fixed timestamp so output is reproducible."""
+    buffer = io.BytesIO()
+
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as handle:
+        handle.write(data)
+
+    return buffer.getvalue()
+
+
+def _multipart(parts):
+    """Render parts as a MIME multipart document with a stable boundary."""
+    digest = hashlib.sha256()
+
+    for part in parts:
+        digest.update(json.dumps(part).encode('utf-8'))
+    message = MIMEMultipart(boundary='==tropohelper-{0}=='.format(
+        digest.hexdigest()[:24]))
+
+    for index, part in enumerate(parts):
+        maintype, subtype = part.content_type.split('/', 1)
+
+        try:
+            part.content.encode('ascii')
+            charset = 'us-ascii'
+        except UnicodeEncodeError:
+            charset = 'utf-8'
+        section = MIMEText(part.content, subtype, charset)
+        section.add_header(
+            'Content-Disposition', 'attachment',
+            filename=part.filename or 'part-{0:03d}'.format(index + 1))
+
+        if part.content_type == 'text/cloud-config':
+            section.add_header('Merge-Type', CLOUD_CONFIG_MERGE)
+        message.attach(section)
+
+    return message.as_bytes()
+
+
+def build_user_data(parts, compress=True, max_bytes=USER_DATA_MAX_BYTES):
+    """Return parts as base64 EncodedUserData, gzipped unless compress=False.
+
+    Identical parts are included once. Raises ValueError if the payload
+    exceeds max_bytes before base64 encoding, the EC2 limit by default.
+    """
+    unique = []
+
+    for part in parts:
+        if part not in unique:
+            unique.append(part)
+    payload = _multipart(unique)
+
+    if compress:
+        payload = _gzip(payload)
+
+    if len(payload) > max_bytes:
+        raise ValueError('User data is {0} bytes, over the {1} byte limit.'
+                         .format(len(payload), max_bytes))
+
+    return EncodedUserData(base64.b64encode(payload).decode('ascii'))
+
+
+def decode_user_data(user_data):
+    """Return the MIME document inside EncodedUserData, for inspection."""
+    payload = base64.b64decode(user_data)
+
+    if payload[:2] == b'\x1f\x8b':
+        payload = gzip.decompress(payload)
+
+    return payload.decode('utf-8')
+
+
+class UserDataStore(object):
+    """Keeps each distinct payload once in a template Mapping.
+
+    add() returns a FindInMap to pass as user_data. Once the mapping is
+    full, or the template has no room for it, payloads are inlined.
+    """
+
+    def __init__(self, stack, mapping_name='UserData'):
+        self.stack = stack
+        self.mapping_name = mapping_name
+
+    def add(self, user_data):
+        """Store EncodedUserData and return the value to pass on."""
+        key = hashlib.sha256(user_data.encode('ascii')).hexdigest()[:16]
+        mappings = self.stack.stack.mappings
+
+        if self.mapping_name not in mappings and \
+                len(mappings) < MAX_MAPPINGS:
+            self.stack.stack.add_mapping(self.mapping_name, {'Payloads': {}})
+        payloads = mappings.get(self.mapping_name, {}).get('Payloads')
+
+        if payloads is None or (key not in payloads and
+                                len(payloads) >= MAX_MAPPING_ATTRIBUTES):
+            return EncodedUserData(user_data)
+        payloads[key] = str(user_data)
+
+        return StoredUserData(self.mapping_name, 'Payloads', key)